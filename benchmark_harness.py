@@ -0,0 +1,422 @@
+import argparse
+import contextlib
+import json
+import math
+import os
+import py_compile
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Offline benchmark of free_llm_benchmark.py itself: a local stub of the OpenRouter
+# /models and /chat/completions endpoints plus a fake GoogleTranslator, so pipeline
+# throughput can be measured (and regressions spotted) without spending any quota.
+#
+#   python benchmark_harness.py --questions 20 --models 30 --latency 1.5 --rate-429 0.05
+#
+# --startup instead times the commands that need no network from process start to exit:
+#
+#   python benchmark_harness.py --startup
+
+
+# Non-network commands should start well within this, and importing the module must not
+# load any of the dependencies it only needs for a run
+STARTUP_TARGET_MS = 100
+STARTUP_COMMANDS = [["--help"], ["dedup"], ["leaderboard"], ["report"]]
+LAZY_MODULES = ["requests", "deep_translator", "openpyxl", "asyncio", "concurrent.futures", "email.utils", "subprocess", "argparse", "hashlib", "html"]
+
+FILLER_WORDS = ("model benchmark answer question latency token stream request response system data "
+                "result value method process example context language translation report quality "
+                "analysis performance memory network thread queue cache format reason detail").split()
+
+
+class StubServer(ThreadingHTTPServer):
+    # The async engine opens hundreds of connections at once; the default listen
+    # backlog of 5 would reset most of them
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class StubOpenRouter:
+    """
+    Local stand-in for the OpenRouter API.
+    Every model gets its own median latency (lognormal around --latency), and each
+    request sleeps a lognormal sample around that median. A fraction of the requests
+    is answered with 429 or 503, and responses are response_chars of non-repeating filler
+    (or, for --loop-rate of them, a degenerate loop of one sentence), sent either as one
+    JSON body or as server-sent events when the request asks for streaming.
+    """
+    def __init__(self, config):
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.models = []
+        for i in range(config.models):
+            self.models.append({
+                "id": f"stub-provider-{i % config.providers}/model-{i}:free",
+                "name": f"Stub Model {i}",
+                "context_length": 32768,
+                "pricing": {"prompt": "0", "completion": "0"},
+                "median_latency": config.latency * self.random.lognormvariate(0, config.latency_spread),
+            })
+        self.models_by_id = {model["id"]: model for model in self.models}
+        self.lock = threading.Lock()
+        self.counts = {"models": 0, "completions": 0, "429": 0, "503": 0}
+        self.server = StubServer(("127.0.0.1", config.port), self._handler())
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/api/v1"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name="stub-openrouter", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+    def draw(self):
+        with self.lock:
+            return self.random.random()
+
+    def latency_for(self, model_id):
+        model = self.models_by_id.get(model_id)
+        median = model["median_latency"] if model else self.config.latency
+        with self.lock:
+            return self.random.lognormvariate(math.log(max(median, 0.001)), self.config.latency_spread)
+
+    def response_text(self, model_id):
+        with self.lock:
+            looping = self.random.random() < self.config.loop_rate
+            seed = self.random.random()
+        if looping:
+            sentence = f"{model_id} keeps repeating the same sentence over and over again. "
+            return (sentence * (self.config.response_chars // len(sentence) + 1))[:self.config.response_chars]
+        # Random words, so the output never trips the repetition guard
+        words = random.Random(seed).choices(FILLER_WORDS, k=self.config.response_chars // 5 + 1)
+        return f"{model_id} answers: " + " ".join(words)[:self.config.response_chars]
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def send_json(self, status, body, headers=None):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if not self.path.endswith("/models"):
+                    return self.send_json(404, {"error": {"message": "not found"}})
+                stub.count("models")
+                models = [{key: value for key, value in model.items() if key != "median_latency"}
+                          for model in stub.models]
+                self.send_json(200, {"data": models}, {"ETag": '"stub-catalog"'})
+
+            def do_POST(self):
+                if not self.path.endswith("/chat/completions"):
+                    return self.send_json(404, {"error": {"message": "not found"}})
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                stub.count("completions")
+                draw = stub.draw()
+                if draw < stub.config.rate_429:
+                    stub.count("429")
+                    return self.send_json(429, {"error": {"message": "Rate limit exceeded"}},
+                                          {"Retry-After": str(stub.config.retry_after)})
+                if draw < stub.config.rate_429 + stub.config.rate_503:
+                    stub.count("503")
+                    return self.send_json(503, {"error": {"message": "Service unavailable"}},
+                                          {"Retry-After": str(stub.config.retry_after)})
+
+                model_id = request.get("model", "")
+                time.sleep(stub.latency_for(model_id))
+                text = stub.response_text(model_id)
+                prompt_text = " ".join(message.get("content", "") for message in request.get("messages", []))
+                usage = {"prompt_tokens": len(prompt_text) // 4 + 1, "completion_tokens": len(text) // 4 + 1}
+                usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+                if request.get("stream"):
+                    self.send_stream(text, usage)
+                else:
+                    self.send_json(200, {"id": "stub", "model": model_id,
+                                         "choices": [{"message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                                         "usage": usage})
+
+            def send_stream(self, text, usage):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.wfile.write(b": OPENROUTER PROCESSING\n\n")
+                chunk_size = stub.config.stream_chunk_chars
+                for start in range(0, len(text), chunk_size):
+                    event = {"choices": [{"delta": {"content": text[start:start + chunk_size]}}]}
+                    self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+                event = {"choices": [{"delta": {}, "finish_reason": "stop"}], "usage": usage}
+                self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.close_connection = True
+
+        return Handler
+
+
+class FakeTranslator:
+    """
+    Drop-in for deep_translator.GoogleTranslator that tags the text instead of
+    translating it, after an optional fixed delay per call.
+    """
+    delay = 0.0
+    calls = 0
+    lock = threading.Lock()
+
+    def __init__(self, source="auto", target="en", **kwargs):
+        self.source = source
+        self.target = target
+
+    def translate(self, text, **kwargs):
+        with FakeTranslator.lock:
+            FakeTranslator.calls += 1
+        if FakeTranslator.delay:
+            time.sleep(FakeTranslator.delay)
+        return f"[{self.target}] {text}"
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process in MB, or None where it is not available.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def instrument_reports(benchmark, timings):
+    """
+    Add the time spent writing reports to timings["report_seconds"]: every task of
+    the background report writer plus the batch Excel workbook save.
+    """
+    lock = threading.Lock()
+
+    def timed(fn):
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with lock:
+                    timings["report_seconds"] += time.perf_counter() - started
+        return wrapper
+
+    submit = benchmark.BackgroundReportWriter.submit
+    benchmark.BackgroundReportWriter.submit = lambda self, question, fn, *args: submit(self, question, timed(fn), *args)
+    save = benchmark.ExcelReportWriter.save
+    benchmark.ExcelReportWriter.save = lambda self: (
+        timed(save)(self) if threading.current_thread().name != "report-writer" else save(self))
+
+
+def run_benchmark(config):
+    """
+    Run process_pending_questions end to end against the stub in a scratch directory
+    and return the measured metrics.
+    """
+    workdir = config.workdir or tempfile.mkdtemp(prefix="llm_benchmark_")
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    with open("preguntas_pendientes.csv", "w", encoding="utf-8") as f:
+        for i in range(config.questions):
+            f.write(f"pregunta de prueba numero {i + 1}: explica el tema {i + 1} con detalle\n")
+    open("preguntas_resueltas.csv", "w", encoding="utf-8").close()
+    open("blacklist.csv", "w", encoding="utf-8").close()
+
+    stub = StubOpenRouter(config).start()
+    FakeTranslator.delay = config.translation_latency
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import free_llm_benchmark as benchmark
+
+    benchmark.API_URL = stub.base_url + "/chat/completions"
+    benchmark.MODEL_LIST_URL = stub.base_url + "/models"
+    benchmark.GoogleTranslator = FakeTranslator
+    benchmark.STREAM_RESPONSES = config.stream
+    benchmark.USE_ASYNC_ENGINE = config.use_async
+    if not config.keep_rate_limits:
+        # Measure the pipeline, not the configured request budget
+        benchmark.rate_limiter = benchmark.RateLimiter(10 ** 9)
+        benchmark.translation_rate_limiter = benchmark.RateLimiter(10 ** 9)
+    timings = {"report_seconds": 0.0}
+    instrument_reports(benchmark, timings)
+
+    started = time.perf_counter()
+    try:
+        if config.verbose:
+            benchmark.process_pending_questions()
+        else:
+            with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+                benchmark.process_pending_questions()
+    finally:
+        elapsed = time.perf_counter() - started
+        stub.stop()
+
+    with open("preguntas_resueltas.csv", encoding="utf-8") as f:
+        resolved = sum(1 for line in f if line.strip())
+    return {
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "questions": config.questions,
+        "models": config.models,
+        "stream": config.stream,
+        "async": config.use_async,
+        "resolved_questions": resolved,
+        "elapsed_seconds": round(elapsed, 3),
+        "questions_per_minute": round(resolved / elapsed * 60, 2) if elapsed else None,
+        "requests_per_second": round(stub.counts["completions"] / elapsed, 2) if elapsed else None,
+        "completion_requests": stub.counts["completions"],
+        "injected_429": stub.counts["429"],
+        "injected_503": stub.counts["503"],
+        "translation_calls": FakeTranslator.calls,
+        "report_seconds": round(timings["report_seconds"], 3),
+        "peak_rss_mb": round(peak_rss_mb(), 1) if resource else None,
+        "workdir": workdir,
+    }
+
+
+def run_startup_benchmark(config):
+    """
+    Time every STARTUP_COMMANDS command of free_llm_benchmark.py, run through the
+    run_benchmark.py launcher, as python -m and as a script, in a scratch directory. Each time is the median of config.startup_runs
+    runs after a warm-up run, next to the time of a bare interpreter start. The module's
+    bytecode is written first (even under PYTHONDONTWRITEBYTECODE), as an installed copy has it.
+    """
+    workdir = config.workdir or tempfile.mkdtemp(prefix="llm_startup_")
+    os.makedirs(workdir, exist_ok=True)
+    for name in ("preguntas_pendientes.csv", "preguntas_resueltas.csv"):
+        open(os.path.join(workdir, name), "w", encoding="utf-8").close()
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    py_compile.compile(os.path.join(package_dir, "free_llm_benchmark.py"))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [package_dir, os.environ.get("PYTHONPATH")])))
+
+    def median_ms(command):
+        samples = []
+        subprocess.run(command, cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        for _ in range(config.startup_runs):
+            started = time.perf_counter()
+            subprocess.run(command, cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+            samples.append((time.perf_counter() - started) * 1000)
+        return round(statistics.median(samples), 1)
+
+    commands = {}
+    for args in STARTUP_COMMANDS:
+        commands["launcher " + " ".join(args)] = median_ms([sys.executable, os.path.join(package_dir, "run_benchmark.py")] + args)
+        commands["-m " + " ".join(args)] = median_ms([sys.executable, "-m", "free_llm_benchmark"] + args)
+        commands["script " + " ".join(args)] = median_ms([sys.executable, os.path.join(package_dir, "free_llm_benchmark.py")] + args)
+    loaded = subprocess.run(
+        [sys.executable, "-c", f"import sys, free_llm_benchmark; print(' '.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"],
+        cwd=workdir, env=env, capture_output=True, text=True, check=True).stdout.split()
+    return {
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "target_ms": STARTUP_TARGET_MS,
+        "interpreter_ms": median_ms([sys.executable, "-c", "pass"]),
+        "commands_ms": commands,
+        "eager_imports": loaded,
+        "workdir": workdir,
+    }
+
+
+def print_benchmark_metrics(metrics):
+    print(f"\n\033[94m{'='*80}\033[0m")
+    print("\033[94mOffline Benchmark Results\033[0m")
+    print(f"\033[94m{'='*80}\033[0m")
+    print(f"- Questions resolved: {metrics['resolved_questions']}/{metrics['questions']} with {metrics['models']} models"
+          f"{' (streaming)' if metrics['stream'] else ''}{' (async engine)' if metrics['async'] else ''}")
+    print(f"- Wall time: {metrics['elapsed_seconds']:.2f}s")
+    print(f"\033[92m- Questions/min: {metrics['questions_per_minute']}\033[0m")
+    print(f"\033[92m- Requests/sec: {metrics['requests_per_second']} ({metrics['completion_requests']} completion requests, "
+          f"{metrics['injected_429']} x 429, {metrics['injected_503']} x 503)\033[0m")
+    print(f"- Translation calls: {metrics['translation_calls']}")
+    print(f"- Report writing time: {metrics['report_seconds']:.2f}s")
+    peak_rss = f"{metrics['peak_rss_mb']:.1f}MB" if metrics['peak_rss_mb'] is not None else "N/A"
+    print(f"- Peak RSS: {peak_rss}")
+    print(f"- Output directory: {metrics['workdir']}")
+
+
+def print_startup_metrics(metrics):
+    print(f"\n\033[94m{'='*80}\033[0m")
+    print("\033[94mStartup Benchmark Results\033[0m")
+    print(f"\033[94m{'='*80}\033[0m")
+    print(f"- Bare interpreter start: {metrics['interpreter_ms']:.1f}ms")
+    for command, ms in metrics["commands_ms"].items():
+        color = "\033[92m" if ms < metrics["target_ms"] else "\033[31m"
+        print(f"{color}- {command}: {ms:.1f}ms\033[0m")
+    if metrics["eager_imports"]:
+        print(f"\033[31m- Loaded at import: {', '.join(metrics['eager_imports'])}\033[0m")
+    else:
+        print("\033[92m- Loaded at import: none of the lazily imported modules\033[0m")
+    print(f"- Target: under {metrics['target_ms']}ms per command")
+    print(f"- Output directory: {metrics['workdir']}")
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Offline throughput benchmark of free_llm_benchmark.py against a stub OpenRouter server.")
+    parser.add_argument("--questions", type=int, default=10, help="pending questions to process (default: 10)")
+    parser.add_argument("--models", type=int, default=20, help="free models listed by the stub (default: 20)")
+    parser.add_argument("--providers", type=int, default=4, help="providers the models are spread over (default: 4)")
+    parser.add_argument("--latency", type=float, default=1.0, help="median model latency in seconds (default: 1.0)")
+    parser.add_argument("--latency-spread", type=float, default=0.5, help="lognormal sigma of the latency across models and requests (default: 0.5)")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="fraction of requests answered with 429 (default: 0)")
+    parser.add_argument("--rate-503", type=float, default=0.0, help="fraction of requests answered with 503 (default: 0)")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429/503 (default: 1)")
+    parser.add_argument("--response-chars", type=int, default=8000, help="length of every model response (default: 8000)")
+    parser.add_argument("--loop-rate", type=float, default=0.0, help="fraction of responses that loop on one sentence (default: 0)")
+    parser.add_argument("--stream-chunk-chars", type=int, default=64, help="characters per streamed event (default: 64)")
+    parser.add_argument("--translation-latency", type=float, default=0.0, help="seconds per fake translation call (default: 0)")
+    parser.add_argument("--stream", action="store_true", help="run with STREAM_RESPONSES")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="run with USE_ASYNC_ENGINE (needs httpx)")
+    parser.add_argument("--keep-rate-limits", action="store_true", help="keep the configured request rate limits instead of lifting them")
+    parser.add_argument("--port", type=int, default=0, help="stub server port (default: any free port)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for latencies and injected errors")
+    parser.add_argument("--workdir", help="scratch directory for the run (default: a new temporary directory)")
+    parser.add_argument("--json", help="append the metrics as one JSON line to this file")
+    parser.add_argument("--verbose", action="store_true", help="show the benchmark's own output")
+    parser.add_argument("--startup", action="store_true", help="time the startup of the commands that need no network instead")
+    parser.add_argument("--startup-runs", type=int, default=10, help="runs per command with --startup (default: 10)")
+    return parser
+
+
+if __name__ == "__main__":
+    config = build_arg_parser().parse_args()
+    results_file = os.path.abspath(config.json) if config.json else None
+    if config.startup:
+        metrics = run_startup_benchmark(config)
+        print_startup_metrics(metrics)
+    else:
+        metrics = run_benchmark(config)
+        print_benchmark_metrics(metrics)
+
+    if results_file:
+        with open(results_file, "a", encoding="utf-8") as f:
+            f.write(json.dumps(metrics) + "\n")
+        print(f"\033[92mMetrics appended to {results_file}\033[0m")
@@ -1,22 +1,30 @@
-def remove_duplicates():
+import sys
+
+from free_llm_benchmark import normalize_question
+
+def remove_duplicates(filename='todas.txt'):
     # Read all lines from the file
-    with open('todas.txt', 'r', encoding='utf-8') as file:
+    with open(filename, 'r', encoding='utf-8') as file:
         lines = file.readlines()
-    
-    # Remove duplicates using a set while preserving order
+
+    # Remove duplicates using a set while preserving order; lines that only differ
+    # in case, accents or punctuation count as the same question
     seen = set()
     unique_lines = []
     for line in lines:
         line = line.strip()  # Remove leading/trailing whitespace
-        if line and line not in seen:  # Only add non-empty lines that haven't been seen
-            seen.add(line)
+        key = normalize_question(line) or line
+        if line and key not in seen:  # Only add non-empty lines that haven't been seen
+            seen.add(key)
             unique_lines.append(line)
-    
+
     # Write back unique lines to the file
-    with open('todas.txt', 'w', encoding='utf-8') as file:
+    with open(filename, 'w', encoding='utf-8') as file:
         for line in unique_lines:
             file.write(line + '\n')
 
 if __name__ == '__main__':
-    remove_duplicates()
-    print("Duplicate lines have been removed from todas.txt") 
\ No newline at end of file
+    # usage: python duplicate_remover.py [file] (default: todas.txt)
+    filename = sys.argv[1] if len(sys.argv) > 1 else 'todas.txt'
+    remove_duplicates(filename)
+    print(f"Duplicate lines have been removed from {filename}")
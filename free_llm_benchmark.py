@@ -1,15 +1,27 @@
-import requests #type: ignore
+import contextlib
+import dataclasses
 import datetime
-import csv
-import concurrent.futures
-from deep_translator import GoogleTranslator
+import enum
+import functools
+import inspect
+import io
+import json
+import math
 import os
+import queue
+import random
 import re
-import shutil
+import sqlite3
+import string
+import sys
+import threading
 import time
-from openpyxl import Workbook
-from openpyxl.styles import PatternFill, Font, Alignment, Border, Side
-from openpyxl.utils import get_column_letter
+import unicodedata
+from collections import deque
+# requests, deep_translator and openpyxl are imported on first use (get_http_session,
+# get_translator and the Excel writer), as are asyncio (async engine), concurrent.futures
+# (shared_executor and the model pipeline), email.utils, subprocess and argparse (the CLI),
+# and hashlib, html and shutil (cache keys, dedup, reports), so importing the module and commands that need none of them stay fast
 
 
 
@@ -25,72 +37,759 @@ headers = {
     "Content-Type": "application/json"
 }
 
-# Configurable delay and retry settings
-REQUEST_DELAY = .2  # seconds between API requests
+# Configurable rate limit and retry settings
+# Requests are paced by shared token buckets: one for the whole run, one per provider
+# prefix (e.g. "google/") and one per model. Retry-After and X-RateLimit-* response
+# headers block or tighten the matching bucket, so threads stop retrying in lockstep;
+# a retry waits exactly as long as the server asked, or backs off when it gave no delay.
+# Every 429 also halves the provider's rate, which recovers on successful requests.
+GLOBAL_REQUESTS_PER_MINUTE = 300
+PROVIDER_REQUESTS_PER_MINUTE = 120
+MODEL_REQUESTS_PER_MINUTE = 20
+TRANSLATION_REQUESTS_PER_MINUTE = 600  # Google Translate, limited independently of OpenRouter
+RATE_LIMIT_BURST_SECONDS = 5  # bucket capacity, in seconds' worth of requests
 MAX_RETRIES = 3    # number of retries for 429 or 503 errors
 INITIAL_RETRY_BACKOFF = 5 # seconds to wait for the first retry
+MAX_RETRY_BACKOFF = 120 # cap for the jittered exponential backoff
+MAX_CONCURRENT_REQUESTS = 32  # model requests in flight at once, across all questions
+PROVIDER_MAX_CONCURRENT_REQUESTS = 8  # in flight per provider prefix (e.g. "google/"); None for no cap
+CONNECT_TIMEOUT = 10   # seconds to establish a connection to the API
+READ_TIMEOUT = 300     # seconds without receiving any data before a request is abandoned
+QUESTION_DEADLINE = 900  # seconds after a question's first request; unfinished models are recorded as timed out
+# Hedged requests: when a model is slower than its own p95 latency (from at least
+# HEDGE_MIN_SAMPLES earlier answers), a duplicate request is sent and the first reply wins
+HEDGE_REQUESTS = False
+HEDGE_MIN_SAMPLES = 5
+
+# Translation runs as its own pipeline stage: finished model responses wait in a bounded
+# queue for one of TRANSLATION_WORKERS threads, so translation never holds a model slot.
+# When the queue is full, model workers block until translation catches up.
+TRANSLATION_WORKERS = 8
+TRANSLATION_QUEUE_SIZE = 64
+
+# Reports (HTML rows and files, Excel exports, failure moves) are written by one background
+# thread fed through a bounded queue, so the main loop keeps collecting model results
+REPORT_QUEUE_SIZE = 256
+
+# Completion budget (max_tokens) per request: the model's context length minus the
+# estimated prompt tokens, capped at MAX_COMPLETION_TOKENS (or the model's entry in
+# MAX_TOKENS_OVERRIDES) and at the provider's own completion limit from the catalog.
+# Prompt tokens are estimated at CHARS_PER_TOKEN_ESTIMATE, on the safe side.
+MAX_COMPLETION_TOKENS = 4096
+MIN_COMPLETION_TOKENS = 256  # models with less room left for the answer are skipped
+MAX_TOKENS_OVERRIDES = {}  # model_id -> max_tokens, e.g. {"deepseek/deepseek-r1:free": 16384}
+CHARS_PER_TOKEN_ESTIMATE = 3
+PROMPT_TOKEN_OVERHEAD = 16  # chat template tokens around the message
+
+# Degenerate output guard: once the end of a response is the same span of words repeated
+# back-to-back REPETITION_MAX_REPEATS times, it is cut off after the span's second copy
+# (a streamed response stops being read right away). Spans are matched through their
+# REPETITION_NGRAM-word sequences, and spans shorter than that must repeat for as many
+# words as a REPETITION_NGRAM-word span would; repeats scattered through the text (table
+# cells, a recurring phrase) do not count.
+REPETITION_NGRAM = 10
+REPETITION_MAX_REPEATS = 8
+REPETITION_CUTOFF_NOTE = "\n\n[Response cut off: repeated content]"
+
+# Response analysis: every result is labelled once (error class, refusal, repeated word
+# n-grams, language) and the reports, statistics and stores read the labels. A response
+# that was cut off by the repetition guard, or that ends in a loop the guard would have
+# cut, is labelled degenerate; the share of repeated ANALYSIS_NGRAM-grams is only reported,
+# since tables and lists repeat many short sequences without looping.
+ANALYSIS_NGRAM = 4
+
+# Opt-in streaming mode: responses are consumed as server-sent events so each result
+# also records time-to-first-token, inter-token latency percentiles and tokens/sec
+STREAM_RESPONSES = False
+
+# Optional asyncio engine (requires httpx, and h2 for HTTP/2): model requests become
+# coroutines sharing one pooled keep-alive client instead of one OS thread each
+USE_ASYNC_ENGINE = False
+ASYNC_MAX_CONCURRENT_REQUESTS = 512  # in-flight requests when USE_ASYNC_ENGINE is on
+
+# Free-model catalog cache: the /models listing is fetched at most once per TTL
+# and revalidated with ETag/If-Modified-Since; the last good snapshot on disk is
+# used when the endpoint fails
+CATALOG_CACHE_FILE = "models_cache.json"
+CATALOG_CACHE_TTL = 3600  # seconds before the cached catalog is revalidated
+
+# Model health record (persisted in MODEL_HEALTH_FILE): per-model error rate, latency EWMA
+# and last success. After BREAKER_FAILURE_THRESHOLD failures in a row a model's circuit
+# breaker opens and the model is skipped for BREAKER_COOLDOWN seconds; then one question
+# probes it, and every failed probe doubles the cool-down (up to BREAKER_MAX_COOLDOWN).
+# Errors, timeouts and degenerate (looping) answers count as failures; requests that ran
+# out of retries on 429/503 (rate_limited) do not, since the rate limiter handles those
+# and throttling of shared free-tier keys says nothing about the model itself.
+# This works alongside the hand-maintained blacklist.csv.
+MODEL_HEALTH_FILE = "model_health.json"
+HEALTH_EWMA_ALPHA = 0.2
+BREAKER_FAILURE_THRESHOLD = 3
+BREAKER_IGNORED_ERROR_CLASSES = frozenset(["rate_limited"])
+BREAKER_COOLDOWN = 1800
+BREAKER_MAX_COOLDOWN = 24 * 3600
+
+# Persistent translation cache (SQLite), keyed on source/target language and text hash.
+# Least recently used entries are evicted once the stored translations exceed the size cap.
+TRANSLATION_CACHE_FILE = "translation_cache.sqlite3"
+TRANSLATION_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Long texts are split into chunks near TRANSLATION_CHUNK_SIZE chars (never more than
+# TRANSLATION_MAX_CHARS, the translation API limit) and translated concurrently
+TRANSLATION_CHUNK_SIZE = 4000
+TRANSLATION_MAX_CHARS = 4500
+TRANSLATION_CHUNK_WORKERS = 8
+
+# Write-ahead journal: every finished model result is appended and fsynced here, so a
+# run that dies halfway only re-queries the (question, model) pairs that are missing
+RESULT_JOURNAL_FILE = "results_journal.jsonl"
+
+# Indexed results store (SQLite): every model result of every run is kept here as the
+# system of record for reports, leaderboards and cross-run analysis
+RESULTS_DB_FILE = "results.sqlite3"
+LEADERBOARD_FILE = os.path.join("html", "leaderboard.html")
+LATENCY_BUCKET_GROWTH = 1.05  # leaderboard latency histogram resolution (5% wide log buckets)
+
+# Intake dedup: answered questions are indexed in QUESTION_INDEX_FILE, and pending questions
+# that repeat one of them (or an earlier pending one) are dropped before any API call. Exact
+# repeats ignore case, accents and punctuation; near repeats are found with MinHash LSH over
+# character shingles when their Jaccard similarity reaches DEDUP_SIMILARITY. Near repeats are
+# still processed and only listed in the summary, since questions that differ in one topic
+# word ("energia solar" / "energia eolica") score as high as rewordings; set
+# DEDUP_DROP_SIMILARITY (e.g. 0.95) to also drop the near repeats at or above it.
+DEDUP_PENDING_QUESTIONS = True
+QUESTION_INDEX_FILE = "question_index.sqlite3"
+DEDUP_SIMILARITY = 0.7
+DEDUP_DROP_SIMILARITY = None
+DEDUP_SHINGLE_SIZE = 4
+DEDUP_BANDS = 16
+DEDUP_ROWS_PER_BAND = 3
+
+# Sharded runs: the `coordinator` command queues one job per (question, model) in the
+# JOB_QUEUE_FILE SQLite queue, `worker` processes (each with its own API key if given)
+# lease the jobs and store their results there, and the coordinator writes the reports.
+# Workers renew their leases while running; a job whose lease expires (its worker died)
+# goes back to the queue, and after JOB_MAX_ATTEMPTS leases it is recorded as timed out.
+JOB_QUEUE_FILE = "job_queue.sqlite3"
+JOB_LEASE_SECONDS = 120
+JOB_MAX_ATTEMPTS = 3
+JOB_LEASE_BATCH = 4  # jobs a worker leases at a time, so the work spreads over all workers
+JOB_POLL_INTERVAL = 1.0  # seconds between queue checks of idle workers and the coordinator
+# Encoding of the results stored in the job queue: "json", or "msgpack" for smaller records
+# that decode faster (requires msgpack: pip install msgpack). The result journal is always JSON.
+RESULT_CODEC = "json"
+
+# Excel reports are streamed through write-only workbooks. Besides one workbook per
+# question, a batch of several questions also gets one workbook with a sheet per question.
+EXCEL_BATCH_WORKBOOK = True
+EXCEL_CELL_MAX_CHARS = 32767  # longest text Excel accepts in a cell
+
+# QUIET suppresses the per-request and per-response dumps (full prompts, responses and
+# translations) printed from the worker threads; steps, errors and the summary still print.
+# With TRACE_FILE set, timing spans are also written there as a Chrome trace (chrome://tracing).
+QUIET = False
+TRACE_FILE = None
+RUN_ID = datetime.datetime.now().strftime("%Y%m%d-%H%M%S") + f"-{os.getpid()}"
+
+# Shared HTTP session so the threaded engine reuses keep-alive connections to openrouter.ai
+http_session = None
+http_session_lock = threading.Lock()
+
+def get_http_session():
+    """
+    The shared requests session, created on first use.
+    """
+    global http_session
+    if http_session is None:
+        with http_session_lock:
+            if http_session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=MAX_CONCURRENT_REQUESTS))
+                session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=MAX_CONCURRENT_REQUESTS))
+                http_session = session
+    return http_session
+
+shared_executors = {}  # thread name prefix -> ThreadPoolExecutor
+shared_executors_lock = threading.Lock()
+
+def shared_executor(name, max_workers=None):
+    """
+    The process-wide thread pool whose threads are named name, created on first use.
+    """
+    with shared_executors_lock:
+        if name not in shared_executors:
+            import concurrent.futures
+            shared_executors[name] = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        return shared_executors[name]
+
+class RunStats:
+    """
+    Statistics of a run, updated from the worker threads through add() and count(),
+    which take the lock. Each process of a sharded run keeps its own RunStats; workers
+    send theirs to the coordinator with to_dict() and it adds them up with merge().
+    """
+    LISTS = [
+        "successful_questions",
+        "failed_questions",      # (question, reason)
+        "duplicate_questions",   # (question, answered question it repeats, similarity) dropped at intake
+        "near_duplicate_questions",  # (question, similar answered question, similarity) kept at intake
+        "failed_files",          # (moved file, reason)
+        "small_files",           # (file, size) of reports under 50KB
+        "report_errors",         # (question, reason) for every report that failed to be written
+        "failed_models_info",    # (model name, response)
+    ]
+    COUNTERS = [
+        "total_prompted_models",
+        "successful_answers",
+        "hedged_requests",
+        "repetition_cutoffs",    # responses cut off by the repetition guard
+        "refusals",
+        "degenerate_responses",
+        "language_mismatches",   # answers not in English
+        "rate_limited_responses",
+        "request_wait_seconds",
+        "translation_wait_seconds",
+        "translation_cache_hits",
+        "translation_cache_misses",
+    ]
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        for name in self.LISTS:
+            setattr(self, name, [])
+        for name in self.COUNTERS:
+            setattr(self, name, 0)
+
+    def add(self, name, item):
+        with self.lock:
+            getattr(self, name).append(item)
+
+    def count(self, name, amount=1):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    @staticmethod
+    def process_counters():
+        # Kept by the rate limiters and the translation cache of this process
+        return {
+            "rate_limited_responses": rate_limiter.rate_limited_responses,
+            "request_wait_seconds": rate_limiter.throttled_seconds,
+            "translation_wait_seconds": translation_rate_limiter.throttled_seconds,
+            "translation_cache_hits": translation_cache.hits,
+            "translation_cache_misses": translation_cache.misses,
+        }
+
+    def add_process_counters(self):
+        """
+        Add this process's rate limiter and translation cache counters. Call it once,
+        when the process is done sending requests.
+        """
+        self.merge(self.process_counters())
+
+    def to_dict(self, process_counters=False):
+        """
+        JSON-ready copy of the statistics, optionally including this process's counters.
+        """
+        with self.lock:
+            data = {name: list(getattr(self, name)) for name in self.LISTS}
+            data.update((name, getattr(self, name)) for name in self.COUNTERS)
+        if process_counters:
+            for name, value in self.process_counters().items():
+                data[name] += value
+        return data
+
+    def merge(self, data):
+        with self.lock:
+            for name in self.LISTS:
+                getattr(self, name).extend(tuple(item) if isinstance(item, list) else item for item in data.get(name, []))
+            for name in self.COUNTERS:
+                setattr(self, name, getattr(self, name) + data.get(name, 0))
 
 # Global variables for tracking
-failed_questions = []
-failed_files = []  # Track failed files with reasons
-successful_questions = []
-small_files = []  # Track files that are too small
+run_stats = RunStats()
 blacklisted_models = set()  # Track blacklisted models
-total_prompted_models = 0
-successful_answers = 0
-failed_models_info = []
+model_latency_history = {}  # model_id -> recent successful request durations (seconds)
+catalog_snapshot = None  # last good /models listing, mirrored in CATALOG_CACHE_FILE
+catalog_cache = {}  # blacklist key -> (snapshot fetched_at, filtered free models)
+catalog_lock = threading.Lock()
 
-# Create required directories if they don't exist
+# Report directories, created by ensure_output_directories() before reports are written
 HTML_DIR = os.path.join(os.getcwd(), "html")
 HTML_FAILED_DIR = os.path.join(os.getcwd(), "html_failed")
 XCELL_DIR = os.path.join(os.getcwd(), "xcell")
 XCELL_FAILED_DIR = os.path.join(os.getcwd(), "xcell_failed")
 
-for directory in [HTML_DIR, HTML_FAILED_DIR, XCELL_DIR, XCELL_FAILED_DIR]:
-    if not os.path.exists(directory):
+def ensure_output_directories():
+    """
+    Create the report directories if they don't exist.
+    """
+    global HTML_DIR, HTML_FAILED_DIR, XCELL_DIR, XCELL_FAILED_DIR
+    for directory in [HTML_DIR, HTML_FAILED_DIR, XCELL_DIR, XCELL_FAILED_DIR]:
+        if not os.path.exists(directory):
+            try:
+                os.makedirs(directory)
+                print(f"\033[92mCreated directory: {directory}\033[0m")
+            except Exception as e:
+                print(f"\033[31mError creating directory {directory}: {str(e)}\033[0m")
+                if directory == HTML_DIR:
+                    HTML_DIR = "html"
+                    if not os.path.exists(HTML_DIR):
+                        os.makedirs(HTML_DIR)
+                elif directory == HTML_FAILED_DIR:
+                    HTML_FAILED_DIR = "html_failed"
+                    if not os.path.exists(HTML_FAILED_DIR):
+                        os.makedirs(HTML_FAILED_DIR)
+                elif directory == XCELL_DIR:
+                    XCELL_DIR = "xcell"
+                    if not os.path.exists(XCELL_DIR):
+                        os.makedirs(XCELL_DIR)
+                elif directory == XCELL_FAILED_DIR:
+                    XCELL_FAILED_DIR = "xcell_failed"
+                    if not os.path.exists(XCELL_FAILED_DIR):
+                        os.makedirs(XCELL_FAILED_DIR)
+
+def print_detail(message):
+    """
+    Print per-request detail, unless QUIET is set.
+    """
+    if not QUIET:
+        print(message)
+
+def trace_thread_id():
+    # Concurrent asyncio requests share one thread, so each task gets its own trace row
+    # (no asyncio module loaded means no tasks either)
+    asyncio = sys.modules.get("asyncio")
+    try:
+        task = asyncio.current_task() if asyncio else None
+    except RuntimeError:
+        task = None
+    return id(task) if task is not None else threading.get_ident()
+
+class Tracer:
+    """
+    Timing spans for the hot paths (catalog fetch, model query, retry and rate limit
+    waits, translation chunks, report writes). Every span updates in-process counters:
+    count, total and longest duration per span name. While enabled, the spans are also
+    kept as events and export() writes them in the Chrome trace event format.
+    """
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.counters = {}  # span name -> [count, total seconds, max seconds]
+        self.events = []
+        self.thread_names = {}
+        self.origin = time.perf_counter()
+
+    @contextlib.contextmanager
+    def span(self, name, **args):
+        started = time.perf_counter()
         try:
-            os.makedirs(directory)
-            print(f"\033[92mCreated directory: {directory}\033[0m")
-        except Exception as e:
-            print(f"\033[31mError creating directory {directory}: {str(e)}\033[0m")
-            if directory == HTML_DIR:
-                HTML_DIR = "html"
-                if not os.path.exists(HTML_DIR):
-                    os.makedirs(HTML_DIR)
-            elif directory == HTML_FAILED_DIR:
-                HTML_FAILED_DIR = "html_failed"
-                if not os.path.exists(HTML_FAILED_DIR):
-                    os.makedirs(HTML_FAILED_DIR)
-            elif directory == XCELL_DIR:
-                XCELL_DIR = "xcell"
-                if not os.path.exists(XCELL_DIR):
-                    os.makedirs(XCELL_DIR)
-            elif directory == XCELL_FAILED_DIR:
-                XCELL_FAILED_DIR = "xcell_failed"
-                if not os.path.exists(XCELL_FAILED_DIR):
-                    os.makedirs(XCELL_FAILED_DIR)
-
-def check_repeated_content(content, threshold=200):
-    """
-    Check if content contains the same message repeated multiple times.
-    Returns True if content appears to be repeated, False otherwise.
-    """
-    # Split content into words
-    words = content.split()
-    if not words:
+            yield
+        finally:
+            self.record(name, started, time.perf_counter() - started, args)
+
+    def traced(self, name, describe=None):
+        """
+        Decorator running every call of a function (or coroutine function) in a span.
+        describe(*args, **kwargs) may return the span's arguments.
+        """
+        def decorator(fn):
+            if inspect.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def async_wrapper(*args, **kwargs):
+                    with self.span(name, **(describe(*args, **kwargs) if describe else {})):
+                        return await fn(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(name, **(describe(*args, **kwargs) if describe else {})):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def record(self, name, started, duration, args=None):
+        with self.lock:
+            counter = self.counters.get(name)
+            if counter is None:
+                counter = self.counters[name] = [0, 0.0, 0.0]
+            counter[0] += 1
+            counter[1] += duration
+            counter[2] = max(counter[2], duration)
+            if self.enabled:
+                tid = trace_thread_id()
+                if tid not in self.thread_names:
+                    self.thread_names[tid] = threading.current_thread().name
+                self.events.append({"name": name, "ph": "X", "pid": os.getpid(), "tid": tid,
+                                    "ts": round((started - self.origin) * 1e6, 1),
+                                    "dur": round(duration * 1e6, 1), "args": args or {}})
+
+    def summary(self):
+        """
+        (name, count, total seconds, mean seconds, max seconds) per span, slowest total first.
+        """
+        with self.lock:
+            rows = [(name, count, total, total / count, longest)
+                    for name, (count, total, longest) in self.counters.items()]
+        return sorted(rows, key=lambda row: -row[2])
+
+    def export(self, path):
+        """
+        Write the recorded spans as a Chrome trace file. Returns the number of spans.
+        """
+        with self.lock:
+            events = list(self.events)
+            metadata = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+                        for tid, name in self.thread_names.items()]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, f)
+        return len(events)
+
+tracer = Tracer()
+
+WORD_RE = re.compile(r"\S+")
+
+class RepetitionMonitor:
+    """
+    Incremental loop detector for model output.
+    feed() takes the text as it arrives (words split across deltas are handled) and
+    returns True once the text ends in a span of words repeated back-to-back
+    max_repeats times (for spans shorter than n words, repeated for max_repeats * n
+    words). Each n-word sequence is compared with its previous occurrence: in a loop
+    of p words every sequence recurs exactly p words later, so the tail is periodic
+    while that distance stays the same. cutoff is then the length of the text that
+    shows the loop twice: everything up to the end of the span's second copy.
+    """
+    def __init__(self, n=REPETITION_NGRAM, max_repeats=REPETITION_MAX_REPEATS):
+        self.n = n
+        self.max_repeats = max_repeats
+        self.window = deque(maxlen=n)
+        self.last_seen = {}  # n-gram -> index of the last word it ended at
+        self.ends = []  # end offset of every word
+        self.period = None  # distance to the previous occurrence of the current n-gram
+        self.run = 0  # consecutive n-grams that recurred at that same distance
+        self.partial = ""  # trailing text that may continue in the next delta
+        self.consumed = 0  # characters fed before self.partial
+        self.cutoff = None
+
+    def _add_word(self, word, end):
+        index = len(self.ends)
+        self.ends.append(end)
+        self.window.append(word.lower())
+        if len(self.window) < self.n:
+            return False
+        gram = " ".join(self.window)
+        previous = self.last_seen.get(gram)
+        self.last_seen[gram] = index
+        period = index - previous if previous is not None else None
+        if period is None or period != self.period:
+            self.period = period
+            self.run = 1 if period is not None else 0
+            return False
+        self.run += 1
+        # The periodic stretch spans run + n - 1 words after the loop's first copy
+        if self.run + self.n - 1 >= (self.max_repeats - 1) * max(period, self.n):
+            first_copy_start = index - self.run - period - self.n + 2
+            self.cutoff = self.ends[first_copy_start + 2 * period - 1]
+            return True
         return False
-    
-    # Count occurrences of each word
-    word_counts = {}
-    for word in words:
-        word_counts[word] = word_counts.get(word, 0) + 1
-    
-    # Check if any word appears too many times
-    for count in word_counts.values():
-        if count > threshold:
+
+    def feed(self, text):
+        if self.cutoff is not None:
             return True
-    
-    return False
+        text = self.partial + text
+        keep_from = len(text)
+        for match in WORD_RE.finditer(text):
+            if match.end() == len(text):
+                keep_from = match.start()
+                break
+            if self._add_word(match.group(), self.consumed + match.end()):
+                return True
+        self.consumed += keep_from
+        self.partial = text[keep_from:]
+        return False
+
+    def feed_words(self, words):
+        """
+        Feed a complete text already split into words (no cutoff is computed).
+        Returns True if it loops.
+        """
+        return any(self._add_word(word, None) for word in words)
+
+    def finish(self):
+        """
+        Flush the last word once the text is complete. Returns True if repetition was found.
+        """
+        if self.cutoff is None and self.partial:
+            self._add_word(self.partial, self.consumed + len(self.partial))
+            self.partial = ""
+        return self.cutoff is not None
+
+def cut_repeated_content(content):
+    """
+    Cut a response that ends up looping down to the first two copies of the loop.
+    Returns (content, True) if it was cut, (content, False) otherwise.
+    """
+    monitor = RepetitionMonitor()
+    if monitor.feed(content) or monitor.finish():
+        return content[:monitor.cutoff] + REPETITION_CUTOFF_NOTE, True
+    return content, False
+
+# Error classes of the messages this tool puts in place of an answer, as one anchored
+# matcher: the name of the matching group is the class, tried in order. An HTTP status
+# only counts right after the prefix ("404 Client Error", httpx's "Client error '404"),
+# so port=443 in a connection error is not taken for one.
+RESPONSE_ERROR_RE = re.compile(r"""
+      (?P<timeout>API\ Request\ Error(?i:.*?(?:timed\ out|timeout)))
+    | (?P<rate_limited>API\ Request\ Error(?i:.*?failed\ after))
+    | (?P<invalid_json>API\ Request\ Error(?i:.*?invalid\ json))
+    | (?P<connection_error>API\ Request\ Error(?!:\ (?:HTTP\ |(?:Client|Server)\ error\ ')?[45]\d\d\b))
+    | (?P<http_error>API\ Request\ Error:\ (?:HTTP\ |(?:Client|Server)\ error\ ')?[45]\d\d\b)
+    | (?P<deadline>Error:\ Timed\ out)
+    | (?P<exception>Error\ processing\ response\Z)
+    | (?P<empty>Error:\ Empty\ response|No\ response\.?\Z)
+    | (?P<api_error>Error:)
+""", re.VERBOSE | re.DOTALL)
+TRANSPORT_ERROR_CLASSES = frozenset(["timeout", "rate_limited", "invalid_json", "http_error", "connection_error"])
+
+# Refusals and apologies near the start of a response (also in Spanish, for models that answer in it)
+REFUSAL_RE = re.compile(r"""\b(?:
+      i\ apologi[sz]e | i['’]m\ sorry | i\ am\ sorry | i\ cannot | i\ can['’]t | i['’]m\ unable | i\ am\ unable
+    | i['’]m\ not\ able | as\ an\ ai\b | lo\ siento | no\ puedo | no\ soy\ capaz | como\ (?:una\ )?ia\b
+)""", re.VERBOSE | re.IGNORECASE)
+REFUSAL_SCAN_CHARS = 400
+
+LETTERS_RE = re.compile(r"[^\W\d_]+")
+LATIN_LETTERS_RE = re.compile(r"[a-zà-ÿ]")
+LANGUAGE_MARKERS = {
+    "en": frozenset("the and is are was were of to in that it for with as on this be by or from which have".split()),
+    "es": frozenset("el la los las de que y en es por para con una un del se como más pero sus está son".split()),
+}
+
+def classify_error(english_response):
+    """
+    Coarse error class of a model response: "ok" for an answer, otherwise the
+    kind of failure ("timeout", "deadline", "rate_limited", "http_error", ...).
+    """
+    if not english_response:
+        return "empty"
+    match = RESPONSE_ERROR_RE.match(english_response)
+    return match.lastgroup if match else "ok"
+
+def detect_language(words):
+    """
+    Language of a list of lowercase words from its most common function words:
+    "en", "es", "other" for mostly non-Latin script, or "unknown" if unclear.
+    """
+    if not words:
+        return "unknown"
+    latin = sum(1 for word in words if LATIN_LETTERS_RE.match(word))
+    if latin < len(words) / 2:
+        return "other"
+    hits = {language: sum(1 for word in words if word in markers) for language, markers in LANGUAGE_MARKERS.items()}
+    language, count = max(hits.items(), key=lambda item: item[1])
+    if count < 3 or count < 0.7 * sum(hits.values()):
+        return "unknown"
+    return language
+
+def analyze_response(english_response, expected_language="en"):
+    """
+    Label a model response in one pass over its text. Returns a dictionary with
+    error_class (see classify_error), refusal, repeated_ngrams (the share of word
+    n-grams that repeat an earlier one), degenerate (looping or cut off by the
+    repetition guard), language and language_mismatch.
+    """
+    labels = {"error_class": classify_error(english_response), "refusal": False, "repeated_ngrams": 0.0,
+              "degenerate": False, "language": "unknown", "language_mismatch": False}
+    if labels["error_class"] != "ok":
+        return labels
+    labels["refusal"] = bool(REFUSAL_RE.search(english_response, 0, REFUSAL_SCAN_CHARS))
+    words = LETTERS_RE.findall(english_response.lower())
+    grams = len(words) - ANALYSIS_NGRAM + 1
+    if grams > 0:
+        distinct = len(set(zip(*(words[i:] for i in range(ANALYSIS_NGRAM)))))
+        labels["repeated_ngrams"] = round(1 - distinct / grams, 3)
+    labels["degenerate"] = (english_response.endswith(REPETITION_CUTOFF_NOTE)
+                            or RepetitionMonitor().feed_words(english_response.split()))
+    labels["language"] = detect_language(words)
+    labels["language_mismatch"] = labels["language"] not in (expected_language, "unknown")
+    return labels
+
+class ResultStatus(enum.Enum):
+    """
+    How a model request ended.
+    """
+    OK = "ok"                # the model answered (its labels tell refusals and looping apart)
+    ERROR = "error"          # the request or the API failed, see the labels' error_class
+    TIMEOUT = "timeout"      # no answer before the question's deadline or the job's last lease
+    EXCEPTION = "exception"  # processing the response raised an exception
+
+    @classmethod
+    def from_error_class(cls, error_class):
+        if error_class == "ok":
+            return cls.OK
+        if error_class == "deadline":
+            return cls.TIMEOUT
+        if error_class == "exception":
+            return cls.EXCEPTION
+        return cls.ERROR
+
+@dataclasses.dataclass(slots=True)
+class ModelResult:
+    """
+    One model's answer to a question, as it goes from the pipeline to the report
+    writers, the result journal, the results store and the job queue.
+    start_ns/end_ns are time.monotonic_ns() readings (only their difference means
+    anything outside the process) and started_at/recorded_at are Unix times for the
+    reports. Token counts and stream metrics are None when the API did not report them.
+    The analysis labels are computed on construction if not given.
+    """
+    model_id: str
+    model_name: str
+    status: ResultStatus
+    english_response: str
+    spanish_response: str
+    started_at: float | None = None
+    recorded_at: float | None = None
+    start_ns: int | None = None
+    end_ns: int | None = None
+    prompt_tokens: int | None = None
+    completion_tokens: int | None = None
+    total_tokens: int | None = None
+    ttft: float | None = None
+    itl_p50: float | None = None
+    itl_p95: float | None = None
+    tokens_per_sec: float | None = None
+    labels: dict | None = None
+
+    def __post_init__(self):
+        if self.labels is None:
+            self.labels = analyze_response(self.english_response)
+
+    @property
+    def duration(self):
+        """
+        Request duration in seconds, or None if the request never ran.
+        """
+        if self.start_ns is None or self.end_ns is None:
+            return None
+        return (self.end_ns - self.start_ns) / 1e9
+
+    @property
+    def finished_at(self):
+        """
+        Unix time the request ended, or None.
+        """
+        if self.started_at is None or self.duration is None:
+            return None
+        return self.started_at + self.duration
+
+    @property
+    def error_class(self):
+        return self.labels["error_class"]
+
+    @property
+    def characters(self):
+        return len(self.english_response) if self.english_response != "No response" else 0
+
+    @property
+    def chars_per_token(self):
+        return self.characters / self.total_tokens if self.total_tokens else None
+
+    def to_dict(self):
+        """
+        Plain dictionary of the set fields, for JSON or msgpack.
+        """
+        data = {name: getattr(self, name) for name in RESULT_FIELD_NAMES}
+        data["status"] = self.status.value
+        return {name: value for name, value in data.items() if value is not None}
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Rebuild a result from to_dict() output. Result dictionaries journaled by older
+        versions (token dictionary, formatted timestamps and "N/A" placeholders) are
+        converted as well.
+        """
+        if "status" in data:
+            values = {name: data[name] for name in RESULT_FIELD_NAMES if name in data}
+            values["status"] = ResultStatus(values["status"])
+            return cls(**values)
+        tokens = data.get("tokens") if isinstance(data.get("tokens"), dict) else {}
+        duration = as_number(data.get("duration"))
+        english_response = data.get("english_response") or "No response"
+        labels = data.get("labels") if isinstance(data.get("labels"), dict) else analyze_response(english_response)
+        return cls(
+            model_id=data.get("model_id", "Unknown ID"),
+            model_name=data.get("model_name", "Unknown"),
+            status=ResultStatus.from_error_class(labels["error_class"]),
+            english_response=english_response,
+            spanish_response=data.get("spanish_response") or "Translation failed",
+            started_at=parse_report_time(data.get("start_time")),
+            recorded_at=parse_report_time(data.get("request_time")),
+            start_ns=0 if duration is not None else None,
+            end_ns=round(duration * 1e9) if duration is not None else None,
+            prompt_tokens=as_int(tokens.get("prompt_tokens")),
+            completion_tokens=as_int(tokens.get("completion_tokens")),
+            total_tokens=as_int(tokens.get("total_tokens")),
+            ttft=as_number(data.get("ttft")),
+            itl_p50=as_number(data.get("itl_p50")),
+            itl_p95=as_number(data.get("itl_p95")),
+            tokens_per_sec=as_number(data.get("tokens_per_sec")),
+            labels=labels)
+
+RESULT_FIELD_NAMES = tuple(field.name for field in dataclasses.fields(ModelResult))
+
+def as_number(value):
+    """
+    value if it is an int or float (not a bool), else None ("N/A", missing...).
+    """
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+def as_int(value):
+    value = as_number(value)
+    return int(value) if value is not None else None
+
+def parse_report_time(value):
+    """
+    Unix time from a '%Y-%m-%d %H:%M:%S' timestamp, or None.
+    """
+    try:
+        return datetime.datetime.strptime(value, '%Y-%m-%d %H:%M:%S').timestamp()
+    except (TypeError, ValueError):
+        return None
+
+def format_report_time(value):
+    """
+    '%Y-%m-%d %H:%M:%S' timestamp of a Unix time, or "N/A" for None.
+    """
+    if value is None:
+        return "N/A"
+    return datetime.datetime.fromtimestamp(value).strftime('%Y-%m-%d %H:%M:%S')
+
+def encode_result(result, codec=None):
+    """
+    Serialize a ModelResult with codec (default RESULT_CODEC): a compact JSON
+    string, or msgpack bytes.
+    """
+    data = result.to_dict()
+    if (codec or RESULT_CODEC) == "msgpack":
+        try:
+            import msgpack
+        except ImportError:
+            raise RuntimeError("RESULT_CODEC = 'msgpack' requires msgpack (pip install msgpack)")
+        return msgpack.packb(data, use_bin_type=True)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+def decode_result(data):
+    """
+    Inverse of encode_result; the codec follows from the type (bytes are msgpack).
+    """
+    if isinstance(data, bytes):
+        import msgpack
+        return ModelResult.from_dict(msgpack.unpackb(data, raw=False))
+    return ModelResult.from_dict(json.loads(data))
 
 def load_blacklist():
     """
@@ -115,61 +814,442 @@ def load_blacklist():
     
     return blacklisted
 
-def load_free_models():
+def blacklist_cache_key(blacklist):
     """
-    Fetch available models from the API, filtering only for free models where pricing is 0.
+    Stable key for a set of blacklisted model IDs, used to key the filtered catalog cache.
+    """
+    import hashlib
+    return hashlib.sha256("\n".join(sorted(blacklist)).encode("utf-8")).hexdigest()
+
+def filter_free_models(items, blacklist):
+    """
+    Filter a raw /models listing down to free models that are not blacklisted.
     Returns a dictionary keyed by model IDs containing model name and context length.
     """
+    free_models = {}
+    for item in items:
+        model_id = item.get("id", "Unknown ID")
+        
+        # Skip blacklisted models
+        if model_id in blacklist:
+            continue
+            
+        name = item.get("name", model_id)
+        context_length = item.get("context_length", 100)  # default if missing
+        pricing = item.get("pricing", {})
+        prompt_cost = pricing.get("prompt")
+        completion_cost = pricing.get("completion")
+
+        # Convert pricing values to float for proper comparison.
+        try:
+            prompt_cost_val = float(prompt_cost) if prompt_cost is not None else None
+            completion_cost_val = float(completion_cost) if completion_cost is not None else None
+        except (TypeError, ValueError):
+            continue
+
+        if model_id.endswith(":free") or (prompt_cost_val == 0 and completion_cost_val == 0):
+            free_models[model_id] = {
+                "name": name,
+                "context_length": context_length,
+                "max_completion_tokens": (item.get("top_provider") or {}).get("max_completion_tokens")
+            }
+    return free_models
+
+def read_catalog_snapshot():
+    """
+    Load the last good model catalog from CATALOG_CACHE_FILE.
+    Returns the snapshot dictionary or None if there is no usable file.
+    """
     try:
-        response = requests.get(MODEL_LIST_URL, headers=headers)
-        response.raise_for_status()
-        data = response.json()
+        with open(CATALOG_CACHE_FILE, "r", encoding="utf-8") as f:
+            snapshot = json.load(f)
+        if isinstance(snapshot.get("data"), list):
+            return snapshot
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"\033[31mError reading model catalog cache: {str(e)}\033[0m")
+    return None
 
-        free_models = {}
-        if not data or not isinstance(data.get("data", []), list):
-            print("No models available or invalid API response.")
-            return {}
+def write_catalog_snapshot(snapshot):
+    """
+    Atomically replace CATALOG_CACHE_FILE with the given snapshot.
+    """
+    try:
+        tmp_file = CATALOG_CACHE_FILE + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_file, CATALOG_CACHE_FILE)
+    except Exception as e:
+        print(f"\033[31mError writing model catalog cache: {str(e)}\033[0m")
 
-        for item in data.get("data", []):
-            model_id = item.get("id", "Unknown ID")
-            
-            # Skip blacklisted models
-            if model_id in blacklisted_models:
-                continue
-                
-            name = item.get("name", model_id)
-            context_length = item.get("context_length", 100)  # default if missing
-            pricing = item.get("pricing", {})
-            prompt_cost = pricing.get("prompt")
-            completion_cost = pricing.get("completion")
+@tracer.traced("catalog_fetch")
+def refresh_catalog_snapshot(snapshot):
+    """
+    Revalidate the model catalog against the API with a conditional request.
+    Returns the new snapshot, or the given one (refreshed) if the server answered 304.
+    Raises requests.exceptions.RequestException or ValueError on failure.
+    """
+    request_headers = dict(headers)
+    if snapshot:
+        if snapshot.get("etag"):
+            request_headers["If-None-Match"] = snapshot["etag"]
+        if snapshot.get("last_modified"):
+            request_headers["If-Modified-Since"] = snapshot["last_modified"]
+
+    response = get_http_session().get(MODEL_LIST_URL, headers=request_headers, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+    if response.status_code == 304 and snapshot:
+        print("\033[92mModel catalog not modified since last fetch\033[0m")
+        snapshot = dict(snapshot, fetched_at=time.time())
+        write_catalog_snapshot(snapshot)
+        return snapshot
+
+    response.raise_for_status()
+    data = response.json()
+    if not data or not isinstance(data.get("data", []), list):
+        raise ValueError("No models available or invalid API response.")
+
+    snapshot = {
+        "fetched_at": time.time(),
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "data": data.get("data", [])
+    }
+    write_catalog_snapshot(snapshot)
+    print(f"\033[92mFetched model catalog ({len(snapshot['data'])} models)\033[0m")
+    return snapshot
+
+def load_free_models(force_refresh=False):
+    """
+    Fetch available models from the API, filtering only for free models where pricing is 0.
+    Returns a dictionary keyed by model IDs containing model name and context length.
+    The catalog is cached in memory and in CATALOG_CACHE_FILE for CATALOG_CACHE_TTL
+    seconds; if the API fails, the last good snapshot is used instead.
+    """
+    global catalog_snapshot
+    with catalog_lock:
+        if catalog_snapshot is None:
+            catalog_snapshot = read_catalog_snapshot()
 
-            # Convert pricing values to float for proper comparison.
+        is_fresh = catalog_snapshot and time.time() - catalog_snapshot.get("fetched_at", 0) < CATALOG_CACHE_TTL
+        if force_refresh or not is_fresh:
+            import requests
             try:
-                prompt_cost_val = float(prompt_cost) if prompt_cost is not None else None
-                completion_cost_val = float(completion_cost) if completion_cost is not None else None
-            except (TypeError, ValueError):
-                continue
+                catalog_snapshot = refresh_catalog_snapshot(catalog_snapshot)
+            except (requests.exceptions.RequestException, ValueError) as e:
+                print(f"Error: {type(e).__name__} - {e}")
+                if not catalog_snapshot:
+                    return {}
+                age = (time.time() - catalog_snapshot.get("fetched_at", 0)) / 60
+                print(f"\033[93mUsing cached model catalog from {age:.0f} minutes ago\033[0m")
 
-            if model_id.endswith(":free") or (prompt_cost_val == 0 and completion_cost_val == 0):
-                free_models[model_id] = {
-                    "name": name,
-                    "context_length": context_length
-                }
-        return free_models
+        key = blacklist_cache_key(blacklisted_models)
+        cached = catalog_cache.get(key)
+        if cached and cached[0] == catalog_snapshot.get("fetched_at"):
+            return dict(cached[1])
+
+        free_models = filter_free_models(catalog_snapshot["data"], blacklisted_models)
+        catalog_cache[key] = (catalog_snapshot.get("fetched_at"), free_models)
+        return dict(free_models)
+
+class ModelHealth:
+    """
+    Persistent per-model health record with a circuit breaker per model.
+    record() updates a model's request counts, rolling error rate (an EWMA of failures),
+    latency EWMA and last success/failure after every request. allow() says whether a
+    model may be queried: closed breakers always, open ones only after their cool-down,
+    and then only for one probing question at a time. Safe to share between threads;
+    the records are read lazily from path and written back by save().
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.models = None
+
+    def _records(self):
+        if self.models is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.models = json.load(f)
+            except FileNotFoundError:
+                self.models = {}
+            except (OSError, ValueError) as e:
+                print(f"\033[31mError reading {self.path}, starting a new health record: {str(e)}\033[0m")
+                self.models = {}
+        return self.models
+
+    def _record(self, model_id):
+        models = self._records()
+        record = models.get(model_id)
+        if record is None:
+            record = models[model_id] = {
+                "requests": 0, "failures": 0, "error_rate": 0.0, "latency_ewma": None,
+                "last_success": None, "last_failure": None, "last_error": None,
+                "consecutive_failures": 0, "open_until": 0, "cooldown": 0, "probe_until": 0
+            }
+        return record
+
+    def record(self, model_id, error_class, duration=None, degenerate=False):
+        """
+        Update model_id's health with one finished request ("ok" or its error class).
+        A degenerate answer counts as a failure; error classes in
+        BREAKER_IGNORED_ERROR_CLASSES only count as a request.
+        """
+        now = time.time()
+        if error_class == "ok" and degenerate:
+            error_class = "degenerate"
+        ok = error_class == "ok"
+        with self.lock:
+            record = self._record(model_id)
+            record["requests"] += 1
+            record["probe_until"] = 0
+            if error_class in BREAKER_IGNORED_ERROR_CLASSES:
+                return
+            record["error_rate"] += HEALTH_EWMA_ALPHA * ((0.0 if ok else 1.0) - record["error_rate"])
+            if ok:
+                if isinstance(duration, (int, float)):
+                    previous = record["latency_ewma"]
+                    record["latency_ewma"] = duration if previous is None else previous + HEALTH_EWMA_ALPHA * (duration - previous)
+                record["last_success"] = now
+                record["consecutive_failures"] = 0
+                record["open_until"] = 0
+                record["cooldown"] = 0
+                return
+            record["failures"] += 1
+            record["last_failure"] = now
+            record["last_error"] = error_class
+            record["consecutive_failures"] += 1
+            # Open the breaker, or reopen it after a failed probe for twice as long.
+            # Failures of requests sent before it opened do not extend the cool-down.
+            if record["consecutive_failures"] >= BREAKER_FAILURE_THRESHOLD and now >= record["open_until"]:
+                record["cooldown"] = min(record["cooldown"] * 2 if record["cooldown"] else BREAKER_COOLDOWN,
+                                         BREAKER_MAX_COOLDOWN)
+                record["open_until"] = now + record["cooldown"]
+                print(f"\033[31mCircuit breaker opened for {model_id} after {record['consecutive_failures']} "
+                      f"failures in a row, skipping it for {record['cooldown']/60:.0f} minutes\033[0m")
+
+    def allow(self, model_id):
+        """
+        True if model_id may be queried. Once an open breaker's cool-down is over, the
+        first caller gets True and probes the model; the others get False until the
+        probe's result is recorded (or QUESTION_DEADLINE passes without one).
+        """
+        now = time.time()
+        with self.lock:
+            record = self._records().get(model_id)
+            if record is None or not record["open_until"]:
+                return True
+            if now < record["open_until"] or now < record["probe_until"]:
+                return False
+            record["probe_until"] = now + QUESTION_DEADLINE
+            print(f"\033[93mProbing {model_id} after its circuit breaker cool-down\033[0m")
+            return True
+
+    def latency(self, model_id):
+        """
+        Latency EWMA of model_id's successful requests in seconds, or None.
+        """
+        with self.lock:
+            record = self._records().get(model_id)
+            return record["latency_ewma"] if record else None
+
+    def open_breakers(self):
+        """
+        (model_id, record) for every model currently skipped, soonest retried first.
+        """
+        now = time.time()
+        with self.lock:
+            skipped = [(model_id, dict(record)) for model_id, record in self._records().items()
+                       if record["open_until"] > now]
+        return sorted(skipped, key=lambda item: item[1]["open_until"])
+
+    def save(self):
+        with self.lock:
+            if self.models is None:
+                return
+            data = json.dumps(self.models, indent=1)
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"\033[31mError saving model health to {self.path}: {str(e)}\033[0m")
+
+model_health = ModelHealth(MODEL_HEALTH_FILE)
+
+class TranslationCache:
+    """
+    Content-addressed cache of translations stored in SQLite.
+    Entries are keyed on (source, target, sha256 of text) and evicted least recently
+    used first once the stored translations exceed max_bytes. Safe to share between
+    threads; hit and miss counters are kept for the end-of-run summary.
+    """
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.conn = None
+        self.disabled = False
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self):
+        # Open lazily so importing the module never touches the cache file
+        if self.conn is None and not self.disabled:
+            try:
+                self.conn = sqlite3.connect(self.path, check_same_thread=False)
+                self.conn.execute("""CREATE TABLE IF NOT EXISTS translations (
+                    key TEXT PRIMARY KEY,
+                    source TEXT NOT NULL,
+                    target TEXT NOT NULL,
+                    translation TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_used REAL NOT NULL)""")
+                self.conn.execute("CREATE INDEX IF NOT EXISTS translations_last_used ON translations (last_used)")
+                self.conn.commit()
+                self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM translations").fetchone()[0]
+            except sqlite3.Error as e:
+                print(f"\033[31mError opening translation cache {self.path}: {str(e)}. Caching disabled.\033[0m")
+                self.conn = None
+                self.disabled = True
+        return self.conn
+
+    @staticmethod
+    def make_key(source, target, text):
+        import hashlib
+        return hashlib.sha256(f"{source}\0{target}\0{text}".encode("utf-8")).hexdigest()
+
+    def get(self, source, target, text):
+        """
+        Return the cached translation or None, updating the LRU timestamp on a hit.
+        """
+        key = self.make_key(source, target, text)
+        with self.lock:
+            conn = self._connect()
+            row = None
+            if conn:
+                try:
+                    row = conn.execute("SELECT translation FROM translations WHERE key = ?", (key,)).fetchone()
+                    if row:
+                        conn.execute("UPDATE translations SET last_used = ? WHERE key = ?", (time.time(), key))
+                        conn.commit()
+                except sqlite3.Error as e:
+                    print(f"\033[31mError reading translation cache: {str(e)}\033[0m")
+                    row = None
+            if row:
+                self.hits += 1
+                return row[0]
+            self.misses += 1
+            return None
+
+    def put(self, source, target, text, translation):
+        """
+        Store a translation and evict the least recently used entries if over the size cap.
+        """
+        key = self.make_key(source, target, text)
+        size = len(translation.encode("utf-8"))
+        with self.lock:
+            conn = self._connect()
+            if not conn:
+                return
+            try:
+                old = conn.execute("SELECT size FROM translations WHERE key = ?", (key,)).fetchone()
+                conn.execute("INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?, ?)",
+                             (key, source, target, translation, size, time.time()))
+                self.total_bytes += size - (old[0] if old else 0)
+                if self.total_bytes > self.max_bytes:
+                    evicted = []
+                    for old_key, old_size in conn.execute("SELECT key, size FROM translations ORDER BY last_used"):
+                        if self.total_bytes <= self.max_bytes:
+                            break
+                        evicted.append((old_key,))
+                        self.total_bytes -= old_size
+                    conn.executemany("DELETE FROM translations WHERE key = ?", evicted)
+                conn.commit()
+            except sqlite3.Error as e:
+                print(f"\033[31mError writing translation cache: {str(e)}\033[0m")
+
+translation_cache = TranslationCache(TRANSLATION_CACHE_FILE, TRANSLATION_CACHE_MAX_BYTES)
+
+# Chunk boundaries in order of preference: paragraph, sentence, line, word
+TRANSLATION_BOUNDARIES = [
+    re.compile(r"\n\s*\n"),
+    re.compile(r"(?<=[.!?])\s+"),
+    re.compile(r"\n"),
+    re.compile(r"\s+"),
+]
+
+def split_for_translation(text, chunk_size=TRANSLATION_CHUNK_SIZE, max_chars=TRANSLATION_MAX_CHARS):
+    """
+    Split text into chunks of at most max_chars, cutting at the paragraph, sentence,
+    line or word boundary closest to chunk_size (searching both before and after it).
+    Returns a list of (chunk, separator) tuples, where separator is the whitespace
+    that followed the chunk in the original text.
+    """
+    pieces = []
+    pos = 0
+    while len(text) - pos > max_chars:
+        window = text[pos:pos + max_chars]
+        cut = None
+        for boundary in TRANSLATION_BOUNDARIES:
+            # Ignore boundaries in the first half of the window to avoid tiny chunks
+            matches = [m for m in boundary.finditer(window, chunk_size // 2)]
+            if matches:
+                best = min(matches, key=lambda m: abs(m.start() - chunk_size))
+                cut = (best.start(), best.end())
+                break
+        if cut is None:
+            # No whitespace at all (e.g. a long URL or base64 blob): hard cut at the limit
+            cut = (max_chars, max_chars)
+        pieces.append((window[:cut[0]], window[cut[0]:cut[1]]))
+        pos += cut[1]
+    pieces.append((text[pos:], ""))
+    return pieces
+
+translator_local = threading.local()  # per-thread GoogleTranslator instances
+GoogleTranslator = None  # deep_translator.GoogleTranslator, imported by get_translator()
+
+def get_translator(source, target):
+    """
+    Return a GoogleTranslator for the language pair, reused within the calling thread.
+    """
+    global GoogleTranslator
+    if GoogleTranslator is None:
+        import deep_translator
+        GoogleTranslator = deep_translator.GoogleTranslator
+    translators = getattr(translator_local, "translators", None)
+    if translators is None:
+        translators = translator_local.translators = {}
+    if (source, target) not in translators:
+        translators[(source, target)] = GoogleTranslator(source=source, target=target)
+    return translators[(source, target)]
 
-    except requests.exceptions.RequestException as e:
-        print(f"Error: {type(e).__name__} - {e}")
-        return {}
+@tracer.traced("translation_chunk", lambda source, target, chunk: {"target": target, "chars": len(chunk)})
+def translate_chunk(source, target, chunk):
+    """
+    Translate one piece of text (at most TRANSLATION_MAX_CHARS), going through the translation cache.
+    """
+    cached = translation_cache.get(source, target, chunk)
+    if cached is not None:
+        print_detail(f"\033[92m- Translation cache hit ({len(chunk)} chars)\033[0m")
+        return cached
+    translation_rate_limiter.wait()
+    translation = get_translator(source, target).translate(chunk)
+    if translation:
+        translation_cache.put(source, target, chunk, translation)
+    return translation
 
 def translate_text(text, target_language, model_id=None):
     """
     Translate text using deep-translator library.
     target_language should be either 'english' or 'spanish'
     """
-    print(f"\n\033[93mTranslation Debug Info:\033[0m")
-    print(f"\033[93m- Target Language: {target_language}\033[0m")
+    print_detail(f"\n\033[93mTranslation Debug Info:\033[0m")
+    print_detail(f"\033[93m- Target Language: {target_language}\033[0m")
     # Print first 100 chars of text to translate
-    print(f"\033[93m- Text to translate (first 100 chars): {text[:100]}...\033[0m")
+    print_detail(f"\033[93m- Text to translate (first 100 chars): {text[:100]}...\033[0m")
     
     try:
         # Map target_language to language codes
@@ -186,44 +1266,33 @@ def translate_text(text, target_language, model_id=None):
             source = 'en'
             target = 'es'
 
-        translator = GoogleTranslator(source=source, target=target)
-
-        if len(text) > 4500:
-            print(f"\033[93m- Text is long ({len(text)} chars), splitting into chunks for translation.\033[0m")
-            chunks = []
-            start_index = 0
-            while start_index < len(text):
-                search_start_pos = start_index + 4000
-                if search_start_pos >= len(text):
-                    end_index = len(text)
-                else:
-                    period_pos = text.find('.', search_start_pos)
-                    if period_pos != -1:
-                        end_index = period_pos + 1
-                    else:
-                        end_index = len(text)
-                
-                chunks.append(text[start_index:end_index])
-                start_index = end_index
+        if len(text) > TRANSLATION_MAX_CHARS:
+            print_detail(f"\033[93m- Text is long ({len(text)} chars), splitting into chunks for translation.\033[0m")
+            pieces = split_for_translation(text)
 
-            translated_chunks = []
-            for i, chunk in enumerate(chunks):
-                print(f"\033[93m- Translating chunk {i+1}/{len(chunks)} ({len(chunk)} chars)...\033[0m")
-                translated_chunk = translator.translate(chunk)
+            def translate_piece(i, chunk):
+                print_detail(f"\033[93m- Translating chunk {i+1}/{len(pieces)} ({len(chunk)} chars)...\033[0m")
+                if not chunk.strip():
+                    return chunk
+                translated_chunk = translate_chunk(source, target, chunk)
                 if translated_chunk:
-                    translated_chunks.append(translated_chunk)
-                else:
-                    print(f"\033[31m- Translation failed for chunk {i+1}\033[0m")
-                    translated_chunks.append("[Translation for this chunk failed]")
+                    return translated_chunk
+                print(f"\033[31m- Translation failed for chunk {i+1}\033[0m")
+                return "[Translation for this chunk failed]"
+
+            # Translate chunks concurrently; map() returns them in the original order
+            translated_chunks = shared_executor("translate-chunk", TRANSLATION_CHUNK_WORKERS).map(
+                translate_piece, range(len(pieces)), [chunk for chunk, _ in pieces])
+            translated_chunks = [translated + separator for translated, (_, separator) in zip(translated_chunks, pieces)]
 
             translation = "".join(translated_chunks)
         else:
-            # Perform translation for texts shorter than 4500 chars
-            print(f"\033[93m- Sending translation request for the whole text ({len(text)} chars)...\033[0m")
-            translation = translator.translate(text)
+            # Perform translation for texts up to TRANSLATION_MAX_CHARS chars
+            print_detail(f"\033[93m- Sending translation request for the whole text ({len(text)} chars)...\033[0m")
+            translation = translate_chunk(source, target, text)
         
         if translation:
-            print(f"\033[92m- Translation successful.\033[0m")
+            print_detail(f"\033[92m- Translation successful.\033[0m")
             return translation
         else:
             print(f"\033[31m- Translation failed: No translation received\033[0m")
@@ -235,152 +1304,585 @@ def translate_text(text, target_language, model_id=None):
         print(f"\033[31m- Error Message: {str(e)}\033[0m")
         return None
 
-def query_model(model_id, prompt, max_tokens):
+def model_provider(model_id):
     """
-    Sends a query to the OpenRouter API for the given model using the provided prompt and max_tokens.
-    Returns a tuple containing the processed response text and the raw response data.
-    Implements retry logic for 429 and 503 errors with exponential backoff.
+    Provider prefix of a model ID ("google" for "google/gemma-3-27b-it:free").
     """
-    payload = {
-        "messages": [{  
-            "role": "user",
-            "content": f"{prompt}." 
-        }],
-        "model": model_id,
-        "max_tokens": max_tokens
-    }
-    attempt = 0
-    while attempt <= MAX_RETRIES:
-        print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Sending request to {model_id} (attempt {attempt+1})")
-        try:
-            response = requests.post(API_URL, headers=headers, json=payload)
-            
-            if response.status_code in [429, 503]:
-                wait_time = INITIAL_RETRY_BACKOFF * (2 ** attempt)
-                print(f"\033[31mReceived {response.status_code} error. Waiting {wait_time} seconds before retry...\033[0m")
-                time.sleep(wait_time)
-                attempt += 1
-                continue
+    return model_id.split("/")[0]
 
-            response.raise_for_status()
-            try:
-                data = response.json()
-            except requests.exceptions.JSONDecodeError:
+class RateLimiter:
+    """
+    Token-bucket rate limiter shared by every worker of a run.
+    reserve(model_id) books a slot in the global bucket and, when configured, in the
+    model's provider and model buckets, and returns how long the caller must wait
+    before sending (sleep it with time.sleep or asyncio.sleep). observe() adapts the
+    buckets to the response: Retry-After blocks the model, an exhausted X-RateLimit
+    quota blocks everything until its reset, and 429s halve the rate of the model's
+    provider (and of the model, without Retry-After), which then recover on successful
+    requests. retry_wait() says how long to sleep before retrying a 429/503.
+    """
+    def __init__(self, global_rpm, provider_rpm=None, model_rpm=None, burst_seconds=RATE_LIMIT_BURST_SECONDS):
+        self.rpm = {"global": global_rpm, "provider": provider_rpm, "model": model_rpm}
+        self.burst_seconds = burst_seconds
+        self.lock = threading.Lock()
+        self.buckets = {}  # key -> [requests per minute, theoretical arrival time, blocked until]
+        self.throttled_seconds = 0.0
+        self.rate_limited_responses = 0
+
+    def _keys(self, model_id):
+        keys = [("global", "*")]
+        if model_id and self.rpm["provider"]:
+            keys.append(("provider", model_provider(model_id)))
+        if model_id and self.rpm["model"]:
+            keys.append(("model", model_id))
+        return keys
+
+    def _bucket(self, kind, key):
+        bucket = self.buckets.get((kind, key))
+        if bucket is None:
+            bucket = self.buckets[(kind, key)] = [self.rpm[kind], 0.0, 0.0]
+        return bucket
+
+    def reserve(self, model_id=None):
+        """
+        Book the next request for model_id. Returns the number of seconds to wait.
+        """
+        with self.lock:
+            now = time.monotonic()
+            buckets = [self._bucket(kind, key) for kind, key in self._keys(model_id)]
+            # Each bucket allows bursts of up to burst_seconds worth of requests
+            start = now
+            for rpm, arrival, blocked_until in buckets:
+                burst = max(rpm * self.burst_seconds / 60, 1)
+                start = max(start, arrival - (burst - 1) * 60 / rpm, blocked_until)
+            for bucket in buckets:
+                bucket[1] = max(bucket[1], start) + 60 / bucket[0]
+            self.throttled_seconds += start - now
+            return start - now
+
+    def wait(self, model_id=None):
+        delay = self.reserve(model_id)
+        if delay > 0:
+            with tracer.span("rate_limit_wait"):
+                time.sleep(delay)
+
+    def observe(self, model_id, status_code, response_headers):
+        """
+        Adapt the buckets to a response's status code and rate limit headers.
+        For a 429/503 returns the delay the server asked for (see server_delay), which
+        the matching bucket is now blocked for, or None if it gave none.
+        """
+        now = time.monotonic()
+        retry_after = parse_retry_after(response_headers.get("Retry-After"))
+        limit = response_headers.get("X-RateLimit-Limit")
+        remaining = response_headers.get("X-RateLimit-Remaining")
+        reset = parse_rate_limit_reset(response_headers.get("X-RateLimit-Reset"))
+        with self.lock:
+            global_bucket = self._bucket("global", "*")
+            model_bucket = self._bucket("model", model_id) if model_id and self.rpm["model"] else global_bucket
+            provider_bucket = (self._bucket("provider", model_provider(model_id))
+                               if model_id and self.rpm["provider"] else None)
+            if limit and limit.isdigit() and 0 < int(limit) < global_bucket[0]:
+                global_bucket[0] = int(limit)
+            if remaining == "0" and reset:
+                global_bucket[2] = max(global_bucket[2], now + reset)
+            if status_code in [429, 503]:
+                self.rate_limited_responses += 1
+                if retry_after is not None:
+                    model_bucket[2] = max(model_bucket[2], now + retry_after)
+                elif status_code == 429 and model_bucket is not global_bucket:
+                    model_bucket[0] = max(model_bucket[0] / 2, 1)
+                if status_code == 429 and provider_bucket:
+                    provider_bucket[0] = max(provider_bucket[0] / 2, 1)
+                return self.server_delay(response_headers)
+            elif status_code < 400:
+                # Additive recovery towards the configured per-model and per-provider rates
+                if model_bucket is not global_bucket:
+                    model_bucket[0] = min(model_bucket[0] + 1, self.rpm["model"])
+                if provider_bucket:
+                    provider_bucket[0] = min(provider_bucket[0] + 1, self.rpm["provider"])
+        return None
+
+    @staticmethod
+    def server_delay(response_headers):
+        """
+        Seconds the server asked to wait before retrying: its Retry-After, or the
+        X-RateLimit-Reset of an exhausted quota. None if it did not say.
+        """
+        retry_after = parse_retry_after(response_headers.get("Retry-After"))
+        if retry_after is not None:
+            return retry_after
+        if response_headers.get("X-RateLimit-Remaining") == "0":
+            return parse_rate_limit_reset(response_headers.get("X-RateLimit-Reset"))
+        return None
+
+    def retry_wait(self, server_delay, attempt):
+        """
+        Seconds to sleep before retrying a 429/503 on top of the next reserve(): none
+        when the server gave a delay, since observe() blocked the buckets until then,
+        otherwise jittered exponential backoff.
+        """
+        return 0.0 if server_delay is not None else self.backoff(attempt)
+
+    @staticmethod
+    def backoff(attempt):
+        """
+        Jittered exponential backoff: half of the capped exponential delay plus a random
+        share of the other half, so workers that failed together do not retry together.
+        """
+        delay = min(MAX_RETRY_BACKOFF, INITIAL_RETRY_BACKOFF * (2 ** attempt))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+def parse_retry_after(value):
+    """
+    Seconds to wait from a Retry-After header (delta-seconds or HTTP date), or None.
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    import email.utils
+    try:
+        return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+def parse_rate_limit_reset(value):
+    """
+    Seconds until an X-RateLimit-Reset time, given as epoch milliseconds, epoch seconds
+    or a delta in seconds. Returns None if missing or invalid.
+    """
+    try:
+        reset = float(value)
+    except (TypeError, ValueError):
+        return None
+    if reset > 1e12:
+        reset = reset / 1000 - time.time()
+    elif reset > 1e9:
+        reset = reset - time.time()
+    return max(reset, 0.0)
+
+rate_limiter = RateLimiter(GLOBAL_REQUESTS_PER_MINUTE, PROVIDER_REQUESTS_PER_MINUTE, MODEL_REQUESTS_PER_MINUTE)
+translation_rate_limiter = RateLimiter(TRANSLATION_REQUESTS_PER_MINUTE)
+
+def build_query_payload(model_id, prompt, max_tokens):
+    """
+    Build the chat completion request body sent to OpenRouter.
+    """
+    payload = {
+        "messages": [{  
+            "role": "user",
+            "content": f"{prompt}." 
+        }],
+        "model": model_id,
+        "max_tokens": max_tokens
+    }
+    if STREAM_RESPONSES:
+        payload["stream"] = True
+    return payload
+
+def estimate_prompt_tokens(prompt):
+    """
+    Rough upper estimate of the tokens a prompt takes, without a tokenizer.
+    """
+    return math.ceil(len(prompt) / CHARS_PER_TOKEN_ESTIMATE) + PROMPT_TOKEN_OVERHEAD
+
+def completion_budget(model_id, details, prompt):
+    """
+    max_tokens for one request: what is left of the model's context after the prompt,
+    capped at MAX_COMPLETION_TOKENS (or the model's MAX_TOKENS_OVERRIDES entry) and at
+    the provider's completion limit. Returns None if less than MIN_COMPLETION_TOKENS is left.
+    """
+    try:
+        available = int(details["context_length"]) - estimate_prompt_tokens(prompt)
+    except (KeyError, TypeError, ValueError):
+        available = MAX_COMPLETION_TOKENS
+    cap = MAX_TOKENS_OVERRIDES.get(model_id, MAX_COMPLETION_TOKENS)
+    provider_limit = details.get("max_completion_tokens")
+    if isinstance(provider_limit, int) and provider_limit > 0:
+        cap = min(cap, provider_limit)
+    budget = min(cap, available)
+    return budget if budget >= MIN_COMPLETION_TOKENS else None
+
+def percentile(values, pct):
+    """
+    Linear-interpolated percentile (0-100) of a list of numbers, or None if it is empty.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+class StreamAccumulator:
+    """
+    Consumes the server-sent event lines of a streamed chat completion.
+    Collects the content deltas and the final usage block, and timestamps every
+    content delta to measure time-to-first-token and inter-token latency.
+    completion() returns a dictionary shaped like a non-streamed response, with
+    the timing metrics under "stream_metrics".
+    """
+    def __init__(self, request_started):
+        self.request_started = request_started  # time.perf_counter() when the request was sent
+        self.parts = []
+        self.delta_times = []
+        self.usage = None
+        self.error = None
+        self.repetition = RepetitionMonitor()
+        self.cut_off = False  # set once the output starts looping; stop reading then
+
+    def feed_line(self, line):
+        # Blank lines separate events; lines starting with ":" are keep-alive comments
+        if not line or line.startswith(":") or not line.startswith("data:"):
+            return
+        payload = line[5:].strip()
+        if payload == "[DONE]":
+            return
+        chunk = json.loads(payload)
+        if chunk.get("error"):
+            self.error = chunk["error"]
+        for choice in chunk.get("choices") or []:
+            content = (choice.get("delta") or {}).get("content")
+            if content:
+                self.parts.append(content)
+                self.delta_times.append(time.perf_counter())
+                if not self.cut_off and self.repetition.feed(content):
+                    self.cut_off = True
+        if chunk.get("usage"):
+            self.usage = chunk["usage"]
+
+    def metrics(self):
+        """
+        Time-to-first-token and inter-token latency (seconds) and completion tokens/sec.
+        Tokens/sec uses the reported completion tokens, or the number of deltas if missing.
+        """
+        if not self.delta_times:
+            return {"ttft": None, "itl_p50": None, "itl_p95": None, "tokens_per_sec": None}
+        gaps = [b - a for a, b in zip(self.delta_times, self.delta_times[1:])]
+        completion_tokens = (self.usage or {}).get("completion_tokens") or len(self.delta_times)
+        generation_time = self.delta_times[-1] - self.delta_times[0]
+        return {
+            "ttft": self.delta_times[0] - self.request_started,
+            "itl_p50": percentile(gaps, 50),
+            "itl_p95": percentile(gaps, 95),
+            "tokens_per_sec": completion_tokens / generation_time if generation_time > 0 else None
+        }
+
+    def completion(self):
+        if self.error and not self.parts:
+            message = self.error.get("message", str(self.error)) if isinstance(self.error, dict) else str(self.error)
+            content = f"Error: {message}"
+        else:
+            content = "".join(self.parts)
+            if self.cut_off:
+                content = content[:self.repetition.cutoff] + REPETITION_CUTOFF_NOTE
+        data = {"choices": [{"message": {"content": content}}], "stream_metrics": self.metrics()}
+        if self.cut_off:
+            data["repetition_cutoff"] = True
+        if self.usage:
+            data["usage"] = self.usage
+        return data
+
+def parse_completion_response(data):
+    """
+    Extract the response text from a decoded chat completion.
+    Returns a tuple containing the processed response text and the raw response data.
+    Looping responses are cut off at their first repetition.
+    """
+    if data and "choices" in data:
+        choices = data.get("choices", [])
+        if choices and isinstance(choices, list):
+            # Get the message content
+            message = choices[0].get("message", {})
+            processed_response = message.get("content", "No response.")
+            if isinstance(processed_response, str) and not data.get("repetition_cutoff"):
+                processed_response, data["repetition_cutoff"] = cut_repeated_content(processed_response)
+            if data.get("repetition_cutoff"):
+                run_stats.count("repetition_cutoffs")
+            if not isinstance(processed_response, str) or not processed_response.strip():
+                return "Error: Empty response received.", data
+        else:
+            processed_response = "Error: Invalid API structure."
+    else:
+        processed_response = "Error: No valid response received."
+    return processed_response, data
+
+@tracer.traced("model_query", lambda model_id, prompt, max_tokens: {"model": model_id})
+def query_model(model_id, prompt, max_tokens):
+    """
+    Sends a query to the OpenRouter API for the given model using the provided prompt and max_tokens.
+    Returns a tuple containing the processed response text and the raw response data.
+    Requests are paced by the shared rate_limiter; 429 and 503 errors are retried
+    after the delay the server asked for, or with jittered exponential backoff.
+    """
+    import requests
+    payload = build_query_payload(model_id, prompt, max_tokens)
+    attempt = 0
+    while attempt <= MAX_RETRIES:
+        print_detail(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Sending request to {model_id} (attempt {attempt+1})")
+        try:
+            rate_limiter.wait(model_id)
+            request_started = time.perf_counter()
+            response = get_http_session().post(API_URL, headers=headers, json=payload, stream=STREAM_RESPONSES,
+                                               timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+            server_delay = rate_limiter.observe(model_id, response.status_code, response.headers)
+            
+            if response.status_code in [429, 503]:
+                wait_time = rate_limiter.retry_wait(server_delay, attempt)
+                print(f"\033[31mReceived {response.status_code} error. Waiting "
+                      f"{wait_time if server_delay is None else server_delay:.1f} seconds before retry...\033[0m")
+                response.close()
+                if wait_time:
+                    with tracer.span("retry_wait", model=model_id, status=response.status_code):
+                        time.sleep(wait_time)
+                attempt += 1
+                continue
+
+            response.raise_for_status()
+            if STREAM_RESPONSES:
+                stream = StreamAccumulator(request_started)
+                # SSE is always UTF-8, but requests would assume ISO-8859-1 for text/event-stream
+                response.encoding = "utf-8"
+                try:
+                    for line in response.iter_lines(decode_unicode=True):
+                        stream.feed_line(line)
+                        if stream.cut_off:
+                            print(f"\033[93mStream from {model_id} started repeating itself, cutting it off\033[0m")
+                            break
+                        if time.perf_counter() - request_started > QUESTION_DEADLINE:
+                            print(f"\033[31mStream from {model_id} exceeded {QUESTION_DEADLINE}s, keeping partial response\033[0m")
+                            break
+                except ValueError:
+                    return f"API Request Error: Invalid JSON in stream from model {model_id}", {}
+                finally:
+                    response.close()
+                return parse_completion_response(stream.completion())
+
+            try:
+                data = response.json()
+            except requests.exceptions.JSONDecodeError:
                 return f"API Request Error: Invalid JSON response from model {model_id}. Response text: {response.text}", {}
 
-            if data and "choices" in data:
-                choices = data.get("choices", [])
-                if choices and isinstance(choices, list):
-                    # Get the message content
-                    message = choices[0].get("message", {})
-                    processed_response = message.get("content", "No response.")
-                    # Check if the response contains error indicators or chain of thought
-                    if any(indicator in processed_response.lower() for indicator in ["error:", "i apologize", "i'm sorry", "i cannot", "i don't", "i'm not sure", "i'm unable"]):
-                        # Keep the error message or chain of thought as is
-                        return processed_response, data
-                    elif not processed_response.strip():
-                        return "Error: Empty response received.", data
-                else:
-                    processed_response = "Error: Invalid API structure."
-            else:
-                processed_response = "Error: No valid response received."
-            return processed_response, data
+            return parse_completion_response(data)
         except requests.exceptions.RequestException as e:
-            if hasattr(e, 'response') and e.response is not None and e.response.status_code in [429, 503]:
-                wait_time = INITIAL_RETRY_BACKOFF * (2 ** attempt)
-                print(f"\033[31mCaught {e.response.status_code} error in exception. Waiting {wait_time} seconds before retry...\033[0m")
-                time.sleep(wait_time)
+            # 429 and 503 were retried above, before raise_for_status()
+            return f"API Request Error: {str(e)}", {}
+    return f"API Request Error: Failed after {MAX_RETRIES+1} attempts", {}
+
+@tracer.traced("model_query", lambda client, model_id, prompt, max_tokens: {"model": model_id})
+async def query_model_async(client, model_id, prompt, max_tokens):
+    """
+    Asyncio version of query_model using a shared httpx.AsyncClient.
+    Retry waits are asyncio sleeps, so a backing-off request holds no thread.
+    Returns the same (processed response text, raw response data) tuple as query_model.
+    """
+    import asyncio
+    import httpx
+
+    payload = build_query_payload(model_id, prompt, max_tokens)
+    attempt = 0
+    while attempt <= MAX_RETRIES:
+        print_detail(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Sending request to {model_id} (attempt {attempt+1})")
+        try:
+            delay = rate_limiter.reserve(model_id)
+            if delay > 0:
+                with tracer.span("rate_limit_wait"):
+                    await asyncio.sleep(delay)
+            request_started = time.perf_counter()
+            request = client.build_request("POST", API_URL, headers=headers, json=payload)
+            response = await client.send(request, stream=STREAM_RESPONSES)
+            server_delay = rate_limiter.observe(model_id, response.status_code, response.headers)
+
+            if response.status_code in [429, 503]:
+                wait_time = rate_limiter.retry_wait(server_delay, attempt)
+                print(f"\033[31mReceived {response.status_code} error. Waiting "
+                      f"{wait_time if server_delay is None else server_delay:.1f} seconds before retry...\033[0m")
+                await response.aclose()
+                if wait_time:
+                    with tracer.span("retry_wait", model=model_id, status=response.status_code):
+                        await asyncio.sleep(wait_time)
                 attempt += 1
                 continue
+
+            if STREAM_RESPONSES:
+                stream = StreamAccumulator(request_started)
+                try:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        stream.feed_line(line)
+                        if stream.cut_off:
+                            print(f"\033[93mStream from {model_id} started repeating itself, cutting it off\033[0m")
+                            break
+                        if time.perf_counter() - request_started > QUESTION_DEADLINE:
+                            print(f"\033[31mStream from {model_id} exceeded {QUESTION_DEADLINE}s, keeping partial response\033[0m")
+                            break
+                except ValueError:
+                    return f"API Request Error: Invalid JSON in stream from model {model_id}", {}
+                finally:
+                    await response.aclose()
+                return parse_completion_response(stream.completion())
+
+            response.raise_for_status()
+            try:
+                data = response.json()
+            except ValueError:
+                return f"API Request Error: Invalid JSON response from model {model_id}. Response text: {response.text}", {}
+
+            return parse_completion_response(data)
+        except httpx.HTTPError as e:
             return f"API Request Error: {str(e)}", {}
-        break
     return f"API Request Error: Failed after {MAX_RETRIES+1} attempts", {}
 
+EXCEL_HEADERS = [
+    "Model", "Model ID", "Prompt Tokens", "Completion Tokens",
+    "Total Tokens", "Characters", "Chars/Token",
+    "Duration (s)", "TTFT (s)", "Inter-token p50 (s)", "Inter-token p95 (s)", "Tokens/s",
+    "English Response", "Spanish Translation"
+]
+EXCEL_COLUMN_WIDTHS = [30, 30, 12, 12, 12, 12, 12, 12, 12, 12, 12, 12, 80, 80]
+EXCEL_SHEET_TITLE_RE = re.compile(r"[\\/*?:\[\]]")
+# Control characters Excel rejects in cells (openpyxl's ILLEGAL_CHARACTERS_RE)
+ILLEGAL_CHARACTERS_RE = re.compile(r"[\000-\010]|[\013-\014]|[\016-\037]")
+
+def excel_styles():
+    """
+    Named styles shared by every cell of a report workbook.
+    A NamedStyle is bound to one workbook, so each workbook gets its own set.
+    """
+    from openpyxl.styles import PatternFill, Font, Alignment, Border, Side, NamedStyle
+    border = Border(
+        left=Side(style='thin'),
+        right=Side(style='thin'),
+        top=Side(style='thin'),
+        bottom=Side(style='thin')
+    )
+    header = NamedStyle(name="report_header")
+    header.fill = PatternFill(start_color="34495E", end_color="34495E", fill_type="solid")
+    header.font = Font(color="FFFFFF", bold=True)
+    header.border = border
+    header.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
+
+    label = NamedStyle(name="report_label")
+    label.font = Font(bold=True)
+    label.alignment = Alignment(vertical='top')
+
+    cell = NamedStyle(name="report_cell")
+    cell.border = border
+    cell.alignment = Alignment(wrap_text=True, vertical='top')
+    return [header, label, cell]
+
+def excel_cell_value(value):
+    """
+    Make a value safe for a worksheet cell: strip the control characters Excel rejects
+    and cut text to the cell size limit.
+    """
+    if isinstance(value, str):
+        value = ILLEGAL_CHARACTERS_RE.sub("", value)
+        if len(value) > EXCEL_CELL_MAX_CHARS:
+            value = value[:EXCEL_CELL_MAX_CHARS - 3] + "..."
+    return value
+
+def excel_sheet_title(title, used_titles):
+    """
+    Turn a question into a unique worksheet name: at most 31 characters, without the characters Excel forbids in sheet names.
+    """
+    title = EXCEL_SHEET_TITLE_RE.sub("_", ILLEGAL_CHARACTERS_RE.sub("", title)).strip("' ") or "Sheet"
+    candidate = title[:31]
+    number = 2
+    while candidate.lower() in used_titles:
+        suffix = f" ({number})"
+        candidate = title[:31 - len(suffix)] + suffix
+        number += 1
+    used_titles.add(candidate.lower())
+    return candidate
+
+def or_na(value):
+    return "N/A" if value is None else value
+
+def excel_result_row(result):
+    """
+    Values of one ModelResult in EXCEL_HEADERS order.
+    """
+    efficiency = result.chars_per_token
+    return [
+        result.model_name, result.model_id, or_na(result.prompt_tokens), or_na(result.completion_tokens),
+        or_na(result.total_tokens), result.characters, f"{efficiency:.2f}" if efficiency is not None else "N/A",
+        or_na(result.duration), or_na(result.ttft), or_na(result.itl_p50),
+        or_na(result.itl_p95), or_na(result.tokens_per_sec),
+        result.english_response, result.spanish_response
+    ]
+
+class ExcelReportWriter:
+    """
+    Writes model results to an openpyxl write-only workbook, one sheet per question.
+    Rows are streamed to each sheet's temporary file instead of being kept as cell
+    objects, so memory stays flat however many rows are written, and all cells share
+    the workbook's named styles. The workbook is saved once, by save().
+    """
+    def __init__(self, filename):
+        from openpyxl import Workbook
+        from openpyxl.cell import WriteOnlyCell
+        self.cell_class = WriteOnlyCell
+        self.filename = filename
+        self.workbook = Workbook(write_only=True)
+        for style in excel_styles():
+            self.workbook.add_named_style(style)
+        self.sheet_titles = set()
+        self.sheets = 0
+
+    def _cells(self, sheet, values, style):
+        cells = []
+        for value in values:
+            cell = self.cell_class(sheet, value=excel_cell_value(value))
+            cell.style = style
+            cells.append(cell)
+        return cells
+
+    def add_sheet(self, title, original_spanish_prompt, english_prompt, results):
+        from openpyxl.utils import get_column_letter
+        sheet = self.workbook.create_sheet(excel_sheet_title(title, self.sheet_titles))
+        for col, width in enumerate(EXCEL_COLUMN_WIDTHS, 1):
+            sheet.column_dimensions[get_column_letter(col)].width = width
+        sheet.append(self._cells(sheet, ["Original Spanish Question:", original_spanish_prompt], "report_label"))
+        sheet.append(self._cells(sheet, ["English Translation:", english_prompt], "report_label"))
+        sheet.append([])
+        sheet.append(self._cells(sheet, EXCEL_HEADERS, "report_header"))
+        for result in results:
+            sheet.append(self._cells(sheet, excel_result_row(result), "report_cell"))
+        self.sheets += 1
+
+    def save(self):
+        """
+        Save the workbook and return its filename. A workbook that fails to save
+        is moved to xcell_failed and the error re-raised.
+        """
+        tmp_filename = self.filename + ".part"
+        try:
+            self.workbook.save(tmp_filename)
+            os.replace(tmp_filename, self.filename)
+        except Exception as e:
+            safe_move_file(tmp_filename, f"failed to save Excel report: {str(e)}", is_excel=True)
+            raise
+        return self.filename
+
 def create_excel_report_for_prompt(original_spanish_prompt, english_prompt, results, timestamp, safe_prompt):
     """
     Creates an Excel report with the same information as the HTML report.
     Returns the filename if successful, None if failed.
     """
     filename = os.path.join(XCELL_DIR, f"{safe_prompt}_{timestamp}.xlsx")
-    
+
     try:
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Model Responses"
-        
-        # Set up styles
-        header_fill = PatternFill(start_color="34495E", end_color="34495E", fill_type="solid")
-        header_font = Font(color="FFFFFF", bold=True)
-        border = Border(
-            left=Side(style='thin'),
-            right=Side(style='thin'),
-            top=Side(style='thin'),
-            bottom=Side(style='thin')
-        )
-        
-        # Write headers
-        headers = [
-            "Model", "Model ID", "Prompt Tokens", "Completion Tokens", 
-            "Total Tokens", "Characters", "Chars/Token", 
-            "English Response", "Spanish Translation"
-        ]
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col)
-            cell.value = header
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.border = border
-            cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-        
-        # Write data
-        row = 2
-        for result in results:
-            model_name = result["model_name"]
-            model_id = result.get("model_id", "Unknown ID")
-            
-            # Process token information
-            tokens = result.get("tokens", {})
-            if isinstance(tokens, dict):
-                prompt_tokens = tokens.get("prompt_tokens", "N/A")
-                completion_tokens = tokens.get("completion_tokens", "N/A")
-                total_tokens = tokens.get("total_tokens", "N/A")
-            else:
-                prompt_tokens = "N/A"
-                completion_tokens = "N/A"
-                total_tokens = tokens
-            
-            # Calculate character counts and efficiency
-            english_response = result.get("english_response", "No response")
-            char_count = len(english_response) if english_response != "No response" else 0
-            
-            if isinstance(total_tokens, (int, float)) and total_tokens > 0:
-                efficiency = f"{char_count/total_tokens:.2f}"
-            else:
-                efficiency = "N/A"
-            
-            # Write row data
-            row_data = [
-                model_name, model_id, prompt_tokens, completion_tokens,
-                total_tokens, char_count, efficiency,
-                english_response, result.get("spanish_response", "Translation failed")
-            ]
-            
-            for col, value in enumerate(row_data, 1):
-                cell = ws.cell(row=row, column=col)
-                cell.value = value
-                cell.border = border
-                cell.alignment = Alignment(wrap_text=True, vertical='top')
-        
-        # Adjust column widths
-        for col in range(1, len(headers) + 1):
-            ws.column_dimensions[get_column_letter(col)].width = 20
-        
-        # Save the workbook
-        wb.save(filename)
-        return filename
-        
+        writer = ExcelReportWriter(filename)
+        writer.add_sheet("Model Responses", original_spanish_prompt, english_prompt, results)
+        return writer.save()
     except Exception as e:
         print(f"\033[31mError creating Excel report: {str(e)}\033[0m")
+        run_stats.add("report_errors", (original_spanish_prompt, f"Excel report: {str(e)}"))
         return None
 
 def safe_move_file(filename, reason, is_excel=False):
@@ -388,6 +1890,7 @@ def safe_move_file(filename, reason, is_excel=False):
     Safely move a file to the failed directory, handling any permission errors.
     Returns True if move was successful, False otherwise.
     """
+    import shutil
     try:
         if os.path.exists(filename):
             # Get the base filename
@@ -397,22 +1900,13 @@ def safe_move_file(filename, reason, is_excel=False):
             dest_path = os.path.join(dest_dir, base_filename)
             # Move the file
             shutil.move(filename, dest_path)
-            failed_files.append((dest_path, reason))
+            run_stats.add("failed_files", (dest_path, reason))
             return True
     except Exception as e:
         print(f"\033[31mError moving file {filename}: {str(e)}\033[0m")
     return False
 
-def create_html_report_for_prompt(original_spanish_prompt, english_prompt, results):
-    """
-    Creates an HTML report with the original Spanish prompt, English translation,
-    and responses from all models in both languages.
-    """
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    safe_prompt = "".join(c for c in original_spanish_prompt if c.isalnum() or c in (' ', '_')).strip().replace(" ", "_")[:20]
-    html_filename = os.path.join(HTML_DIR, f"{safe_prompt}_{timestamp}.html")
-
-    html_content = f"""<!DOCTYPE html>
+HTML_REPORT_HEADER = string.Template("""<!DOCTYPE html>
 <html>
 <head>
     <meta charset="UTF-8">
@@ -421,9 +1915,9 @@ def create_html_report_for_prompt(original_spanish_prompt, english_prompt, resul
 </head>
 <body>
     <h1>Original Spanish Question:</h1>
-    <p>{original_spanish_prompt}</p>
+    <p>$original_spanish_prompt</p>
     <h2>English Translation (by Gemini):</h2>
-    <p>{english_prompt}</p>
+    <p>$english_prompt</p>
     <table>
         <thead>
             <tr>
@@ -432,6 +1926,9 @@ def create_html_report_for_prompt(original_spanish_prompt, english_prompt, resul
                 <th>Start Time</th> <!-- New column -->
                 <th>End Time</th> <!-- New column -->
                 <th>Duration (s)</th> <!-- New column -->
+                <th>TTFT (s)</th>
+                <th>Inter-token p50/p95 (ms)</th>
+                <th>Tokens/s</th>
                 <th>Token Usage</th>
                 <th>Characters</th>
                 <th>Chars/Token</th>
@@ -441,80 +1938,27 @@ def create_html_report_for_prompt(original_spanish_prompt, english_prompt, resul
             </tr>
         </thead>
         <tbody>
-    """
-
-    for result in results:
-        model_name = result["model_name"]
-        model_id = result.get("model_id", "Unknown ID")
-        request_time = result.get("request_time", "N/A")
-        start_time = result.get("start_time", "N/A")  # New field
-        end_time = result.get("end_time", "N/A")  # New field
-        duration = result.get("duration", "N/A")  # New field
-
-        # Process token information
-        tokens = result.get("tokens", {})
-        if isinstance(tokens, dict):
-            prompt_tokens = tokens.get("prompt_tokens", "N/A")
-            completion_tokens = tokens.get("completion_tokens", "N/A")
-            total_tokens = tokens.get("total_tokens", "N/A")
-            token_info = f'<div class="token-info">Prompt: {prompt_tokens}<br>Completion: {completion_tokens}<br>Total: {total_tokens}</div>'
-        else:
-            token_info = f'<div class="token-info">Total: {tokens}</div>'
-            total_tokens = tokens
+    """)
 
-        # Calculate character counts and efficiency
-        english_response = result.get("english_response", "No response")
-        char_count = len(english_response) if english_response != "No response" else 0
-
-        if isinstance(total_tokens, (int, float)) and total_tokens > 0:
-            efficiency = f"{char_count/total_tokens:.2f}"
-        else:
-            efficiency = "N/A"
-
-        char_info = f'<div class="char-info">{char_count:,}</div>'  
-        efficiency_info = f'<div class="efficiency">{efficiency}</div>'
-
-        # Format English response
-        if english_response:
-            formatted_response = english_response.replace("\n", "<br>")
-            if any(indicator in english_response.lower() for indicator in ["error:", "i apologize", "i'm sorry", "i cannot", "i don't", "i'm not sure", "i'm unable"]):
-                english_response = f'<div class="chain-of-thought">{formatted_response}</div>'
-            elif english_response.startswith("Error:"):
-                english_response = f'<div class="error-message">{formatted_response}</div>'
-            else:
-                english_response = formatted_response
-        else:
-            english_response = '<div class="error-message">No response</div>'
-            
-        # Format Spanish response
-        spanish_response = result.get("spanish_response", "Translation failed")
-        if spanish_response:
-            formatted_response = spanish_response.replace("\n", "<br>")
-            if any(indicator in spanish_response.lower() for indicator in ["error:", "lo siento", "no puedo", "no estoy seguro", "no soy capaz"]):
-                spanish_response = f'<div class="chain-of-thought">{formatted_response}</div>'
-            elif spanish_response.startswith("Error:"):
-                spanish_response = f'<div class="error-message">{formatted_response}</div>'
-            else:
-                spanish_response = formatted_response
-        else:
-            spanish_response = '<div class="error-message">Translation failed</div>'
-        
-        html_content += f"""<tr>
-            <td>{model_name}<br><span class=\"model-id\">{model_id}</span></td>
-            <td>{request_time}</td>
-            <td>{start_time}</td> <!-- New field -->
-            <td>{end_time}</td> <!-- New field -->
-            <td>{duration if isinstance(duration, (int, float)) else 'N/A'}</td> <!-- Fixed formatting -->
-            <td>{token_info}</td>
-            <td>{char_info}</td>
-            <td>{efficiency_info}</td>
-            <td>{start_time} - {end_time}</td> <!-- New column for timestamps -->
-            <td class=\"response-cell\"><div class=\"english-response\">{english_response}</div></td>
-            <td class=\"response-cell\"><div class=\"spanish-response\">{spanish_response}</div></td>
+HTML_REPORT_ROW = string.Template("""<tr>
+            <td>$model_name<br><span class="model-id">$model_id</span></td>
+            <td>$request_time</td>
+            <td>$start_time</td> <!-- New field -->
+            <td>$end_time</td> <!-- New field -->
+            <td>$duration</td> <!-- Fixed formatting -->
+            <td>$ttft</td>
+            <td>$itl</td>
+            <td>$tokens_per_sec</td>
+            <td>$token_info</td>
+            <td>$char_info</td>
+            <td>$efficiency_info</td>
+            <td>$start_time - $end_time</td> <!-- New column for timestamps -->
+            <td class="response-cell"><div class="english-response">$english_response</div></td>
+            <td class="response-cell"><div class="spanish-response">$spanish_response</div></td>
         </tr>
-        """
+        """)
 
-    html_content += """
+HTML_REPORT_FOOTER = """
         </tbody>
     </table>
     <div class="footer">
@@ -541,138 +1985,1552 @@ def create_html_report_for_prompt(original_spanish_prompt, english_prompt, resul
         });
     </script>
 </body>
-</html>"""
+</html>"""
+
+def format_response_html(response, labels, missing_message):
+    """
+    Escape a model response for HTML and wrap errors/refusals (per the result's
+    analysis labels) in their CSS classes.
+    """
+    import html
+    if not response:
+        return f'<div class="error-message">{missing_message}</div>'
+    formatted_response = html.escape(response).replace("\n", "<br>")
+    if labels["error_class"] != "ok":
+        return f'<div class="error-message">{formatted_response}</div>'
+    elif labels["refusal"] or labels["degenerate"]:
+        return f'<div class="chain-of-thought">{formatted_response}</div>'
+    return formatted_response
+
+def render_html_report_row(result):
+    """
+    Render one ModelResult as a table row of the HTML report.
+    """
+    import html
+    # Process token information
+    if result.prompt_tokens is None and result.completion_tokens is None:
+        token_info = f'<div class="token-info">Total: {or_na(result.total_tokens)}</div>'
+    else:
+        token_info = (f'<div class="token-info">Prompt: {or_na(result.prompt_tokens)}<br>'
+                      f'Completion: {or_na(result.completion_tokens)}<br>Total: {or_na(result.total_tokens)}</div>')
+
+    efficiency = result.chars_per_token
+    efficiency = f"{efficiency:.2f}" if efficiency is not None else "N/A"
+    labels = result.labels
+    return HTML_REPORT_ROW.substitute(
+        model_name=html.escape(result.model_name),
+        model_id=html.escape(result.model_id),
+        request_time=format_report_time(result.recorded_at),
+        start_time=format_report_time(result.started_at),
+        end_time=format_report_time(result.finished_at),
+        duration=or_na(result.duration),
+        ttft=f"{result.ttft:.3f}" if result.ttft is not None else 'N/A',
+        itl=f"{result.itl_p50*1000:.1f} / {result.itl_p95*1000:.1f}" if result.itl_p50 is not None else 'N/A',
+        tokens_per_sec=f"{result.tokens_per_sec:.1f}" if result.tokens_per_sec is not None else 'N/A',
+        token_info=token_info,
+        char_info=f'<div class="char-info">{result.characters:,}</div>',
+        efficiency_info=f'<div class="efficiency">{efficiency}</div>',
+        english_response=format_response_html(result.english_response, labels, "No response"),
+        spanish_response=format_response_html(result.spanish_response, labels, "Translation failed")
+    )
+
+class HtmlReportWriter:
+    """
+    Streams an HTML report to disk (or to an in-memory buffer when filename is None)
+    one row at a time, so memory stays bounded however many models answer.
+    The file is written as <filename>.part and only renamed when close() completes it.
+    """
+    def __init__(self, original_spanish_prompt, english_prompt, filename=None):
+        import html
+        self.filename = filename
+        self.size = 0  # bytes written so far
+        if filename:
+            self.part_filename = filename + ".part"
+            self.file = open(self.part_filename, "wb")
+        else:
+            self.part_filename = None
+            self.file = io.BytesIO()
+        self._write(HTML_REPORT_HEADER.substitute(
+            original_spanish_prompt=html.escape(original_spanish_prompt),
+            english_prompt=html.escape(english_prompt)))
+
+    def _write(self, text):
+        data = text.encode("utf-8")
+        self.file.write(data)
+        self.size += len(data)
+
+    def write_row(self, result):
+        self._write(render_html_report_row(result))
+
+    def close(self):
+        """
+        Write the footer and complete the file. Returns the report size in bytes.
+        """
+        self._write(HTML_REPORT_FOOTER)
+        if self.filename:
+            self.file.close()
+            os.replace(self.part_filename, self.filename)
+        return self.size
+
+    def getvalue(self):
+        """
+        The report as a string (in-memory writers only).
+        """
+        return self.file.getvalue().decode("utf-8")
+
+    def discard(self):
+        """
+        Close the writer and delete the partial file.
+        """
+        self.file.close()
+        if self.part_filename and os.path.exists(self.part_filename):
+            os.remove(self.part_filename)
+
+def report_file_stem(original_spanish_prompt):
+    """
+    Returns (safe_prompt, timestamp) used to name a question's report files.
+    """
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    safe_prompt = "".join(c for c in original_spanish_prompt if c.isalnum() or c in (' ', '_')).strip().replace(" ", "_")[:20]
+    return safe_prompt, timestamp
+
+def open_html_report(original_spanish_prompt, english_prompt):
+    """
+    Start a streamed HTML report for a question in HTML_DIR.
+    """
+    safe_prompt, timestamp = report_file_stem(original_spanish_prompt)
+    html_filename = os.path.join(HTML_DIR, f"{safe_prompt}_{timestamp}.html")
+    # Reports of a batch are opened within the same second; keep similar questions apart
+    suffix = 1
+    while os.path.exists(html_filename) or os.path.exists(html_filename + ".part"):
+        suffix += 1
+        html_filename = os.path.join(HTML_DIR, f"{safe_prompt}_{suffix}_{timestamp}.html")
+    if suffix > 1:
+        safe_prompt = f"{safe_prompt}_{suffix}"
+    writer = HtmlReportWriter(original_spanish_prompt, english_prompt, html_filename)
+    writer.safe_prompt, writer.timestamp = safe_prompt, timestamp
+    return writer
+
+def create_html_report_for_prompt(original_spanish_prompt, english_prompt, results, writer=None):
+    """
+    Creates an HTML report with the original Spanish prompt, English translation,
+    and responses from all models in both languages.
+    If writer is given, its rows have already been streamed as the results arrived
+    and only the report is completed; otherwise all results are written now.
+    """
+    try:
+        if writer is None:
+            writer = open_html_report(original_spanish_prompt, english_prompt)
+            for result in results:
+                writer.write_row(result)
+        html_filename = writer.filename
+        file_size = writer.close()
+    except Exception as e:
+        print(f"\033[31mError writing HTML report for {original_spanish_prompt}: {str(e)}\033[0m")
+        run_stats.add("report_errors", (original_spanish_prompt, f"HTML report: {str(e)}"))
+        if writer is not None:
+            writer.discard()
+        return None
+
+    # Check file size
+    try:
+        if file_size < 50 * 1024:  # 50KB in bytes
+            if safe_move_file(html_filename, f"file too small ({file_size/1024:.1f}KB)"):
+                run_stats.add("small_files", (html_filename, file_size))
+                print(f"\033[31mMoved HTML file {html_filename} to html_failed due to small size ({file_size/1024:.1f}KB)\033[0m")
+            return None
+
+        # If HTML is valid, create Excel report. The HTML report stands on its own,
+        # so it is kept even if the Excel export fails.
+        excel_filename = create_excel_report_for_prompt(original_spanish_prompt, english_prompt, results, writer.timestamp, writer.safe_prompt)
+        if excel_filename:
+            print(f"Excel report saved as '{excel_filename}'")
+        else:
+            print(f"\033[31mFailed to create Excel report, keeping the HTML report\033[0m")
+
+        print(f"HTML report saved as '{html_filename}' ({file_size/1024:.1f}KB)")
+        return html_filename
+    except Exception as e:
+        print(f"\033[31mError processing file {html_filename}: {str(e)}\033[0m")
+        run_stats.add("report_errors", (original_spanish_prompt, f"HTML report: {str(e)}"))
+        return None
+
+class BackgroundReportWriter:
+    """
+    Runs report work (HTML rows and reports, the 50KB check, Excel exports, failure moves
+    and the run statistics) on one background thread, fed through a bounded queue of
+    REPORT_QUEUE_SIZE tasks. Tasks run in submission order. When the queue is full,
+    submit() blocks until the writer catches up. Leaving the context flushes every queued task.
+    """
+    def __init__(self, maxsize=REPORT_QUEUE_SIZE):
+        self.tasks = queue.Queue(maxsize=maxsize)
+        self.thread = threading.Thread(target=self._run, name="report-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, question, fn, *args):
+        self.tasks.put((question, fn, args))
+
+    def _run(self):
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                return
+            question, fn, args = task
+            try:
+                fn(*args)
+            except Exception as e:
+                print(f"\033[31mError writing report for {question}: {str(e)}\033[0m")
+                run_stats.add("report_errors", (question, str(e)))
+
+    def close(self):
+        """
+        Wait for every queued task to finish and stop the writer thread.
+        """
+        self.tasks.put(None)
+        self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def translate_model_response(details, english_response, labels):
+    """
+    Translate a model's English response back to Spanish.
+    Error messages (per the response's analysis labels) are passed through untranslated.
+    """
+    # Only translate if not an error message
+    if labels["error_class"] == "ok":
+        print_detail(f"\n\033[95mTranslating response from {details['name']} back to Spanish using Gemini...\033[0m")
+        print_detail(f"\033[95mEnglish text to translate: {english_response}\033[0m")
+        spanish_response = translate_text(english_response, "spanish", GEMINI_MODEL)
+
+        if not spanish_response:
+            print(f"\033[31mWarning: Translation failed for {details['name']} ({len(english_response)} chars)\033[0m")
+            print_detail(f"\033[31m- Original English response: {english_response}\033[0m")
+            print_detail(f"\033[31m- Translation model used: {GEMINI_MODEL}\033[0m")
+            spanish_response = "Translation failed"
+        else:
+            print_detail(f"\033[95mSpanish translation (by Gemini): {spanish_response}\033[0m")
+    else:
+        print_detail(f"\n\033[93mSkipping translation for error message\033[0m")
+        spanish_response = english_response  # Use the same error message in Spanish
+    return spanish_response
+
+def build_model_result(model_id, details, english_response, spanish_response, raw_data, started_at, start_ns, end_ns, labels=None):
+    """
+    Assemble the ModelResult of an answered request.
+    started_at is the wall-clock start (Unix time), start_ns/end_ns the monotonic
+    clock readings around the request; labels are the response's analyze_response()
+    labels, computed here if not given.
+    """
+    # Process token information
+    usage = (raw_data or {}).get("usage") or {}
+    print_detail(f"\033[94mToken usage: {usage or 'N/A'}\033[0m")
+
+    # Streaming metrics are only available when STREAM_RESPONSES is on
+    stream_metrics = (raw_data or {}).get("stream_metrics") or {}
+    if stream_metrics.get("ttft") is not None:
+        print_detail(f"\033[94mTime to first token: {stream_metrics['ttft']:.2f}s, "
+              f"tokens/sec: {stream_metrics['tokens_per_sec'] or 0:.1f}\033[0m")
+
+    print_detail(f"\033[96m{'='*80}\033[0m")
+    labels = labels or analyze_response(english_response)
+    return ModelResult(
+        model_id=model_id,
+        model_name=details["name"],
+        status=ResultStatus.from_error_class(labels["error_class"]),
+        english_response=english_response,
+        spanish_response=spanish_response,
+        started_at=started_at,
+        recorded_at=time.time(),
+        start_ns=start_ns,
+        end_ns=end_ns,
+        prompt_tokens=as_int(usage.get("prompt_tokens")),
+        completion_tokens=as_int(usage.get("completion_tokens")),
+        total_tokens=as_int(usage.get("total_tokens")),
+        ttft=as_number(stream_metrics.get("ttft")),
+        itl_p50=as_number(stream_metrics.get("itl_p50")),
+        itl_p95=as_number(stream_metrics.get("itl_p95")),
+        tokens_per_sec=as_number(stream_metrics.get("tokens_per_sec")),
+        labels=labels)
+
+def build_timeout_result(model_id, details, waited):
+    """
+    Result for a model that had not answered when its question's deadline passed.
+    """
+    print(f"\033[31m{details['name']} timed out after {waited:.0f} seconds\033[0m")
+    end_ns = time.monotonic_ns()
+    return ModelResult(
+        model_id=model_id,
+        model_name=details["name"],
+        status=ResultStatus.TIMEOUT,
+        english_response=f"Error: Timed out after {waited:.0f} seconds",
+        spanish_response=f"Error: Sin respuesta tras {waited:.0f} segundos",
+        recorded_at=time.time(),
+        start_ns=end_ns - round(waited * 1e9),
+        end_ns=end_ns)
+
+def build_error_result(model_id, details, e):
+    """
+    Result for a model whose processing raised an exception.
+    """
+    print(f"\033[31mError processing {details['name']}: {str(e)}\033[0m")
+    print(f"\033[31m- Error Type: {type(e).__name__}\033[0m")
+    print(f"\033[31m- Error Message: {str(e)}\033[0m")
+    return ModelResult(
+        model_id=model_id,
+        model_name=details["name"],
+        status=ResultStatus.EXCEPTION,
+        english_response="Error processing response",
+        spanish_response="Error processing response",
+        recorded_at=time.time())
+
+def record_model_latency(model_id, duration):
+    """
+    Remember the duration of a successful request, for hedging decisions.
+    """
+    history = model_latency_history.get(model_id)
+    if history is None:
+        history = model_latency_history[model_id] = deque(maxlen=100)
+    history.append(duration)
+
+def hedge_delay_for(model_id):
+    """
+    Seconds to wait before hedging a request to model_id: its p95 latency, or None
+    if hedging is off or there are not enough samples yet.
+    """
+    if not HEDGE_REQUESTS:
+        return None
+    history = model_latency_history.get(model_id)
+    if not history or len(history) < HEDGE_MIN_SAMPLES:
+        return None
+    return percentile(list(history), 95)
+
+def expected_latency(model_id):
+    """
+    Expected request duration of model_id in seconds: its latency EWMA from the model
+    health record, else the median of this run's history, or None if it never answered.
+    """
+    latency = model_health.latency(model_id)
+    if latency is None:
+        history = model_latency_history.get(model_id)
+        if history:
+            latency = percentile(list(history), 50)
+    return latency
+
+def schedule_models(model_args):
+    """
+    Order a question's model requests longest-processing-time first, so the slowest
+    models start first and do not set the question's tail latency by starting last.
+    Models without any latency history go first, since they may well be slow.
+    """
+    estimates = {args[0]: expected_latency(args[0]) for args in model_args}
+    return sorted(model_args, key=lambda args: (estimates[args[0]] is not None, -(estimates[args[0]] or 0)))
+
+def is_transport_error(response_text):
+    return classify_error(response_text) in TRANSPORT_ERROR_CLASSES
+
+def query_model_hedged(model_id, prompt, max_tokens, hedge_after):
+    """
+    query_model with a hedge: if no reply arrives within hedge_after seconds, send a
+    duplicate request and return whichever reply arrives first (preferring one that
+    is not a transport error). The losing request is left to finish in the background.
+    Both requests run on the "hedge" pool, sized so every model-query thread can have a
+    request and its hedge in flight; hedge_after counts from when the primary starts.
+    """
+    import concurrent.futures
+    hedge_executor = shared_executor("hedge", 2 * MAX_CONCURRENT_REQUESTS)
+    started = threading.Event()
+
+    def run_primary():
+        started.set()
+        return query_model(model_id, prompt, max_tokens)
+
+    primary = hedge_executor.submit(run_primary)
+    started.wait()
+    try:
+        return primary.result(timeout=hedge_after)
+    except concurrent.futures.TimeoutError:
+        pass
+    print(f"\033[93m{model_id} slower than its p95 ({hedge_after:.1f}s), sending hedged request\033[0m")
+    run_stats.count("hedged_requests")
+    backup = hedge_executor.submit(query_model, model_id, prompt, max_tokens)
+    done, not_done = concurrent.futures.wait([primary, backup], return_when=concurrent.futures.FIRST_COMPLETED)
+    reply = done.pop().result()
+    if is_transport_error(reply[0]) and not_done:
+        reply = not_done.pop().result()
+    return reply
+
+async def query_model_hedged_async(client, model_id, prompt, max_tokens, hedge_after):
+    """
+    Asyncio version of query_model_hedged; the losing request is cancelled.
+    """
+    import asyncio
+    primary = asyncio.ensure_future(query_model_async(client, model_id, prompt, max_tokens))
+    done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+    if done:
+        return primary.result()
+    print(f"\033[93m{model_id} slower than its p95 ({hedge_after:.1f}s), sending hedged request\033[0m")
+    run_stats.count("hedged_requests")
+    backup = asyncio.ensure_future(query_model_async(client, model_id, prompt, max_tokens))
+    pending = {primary, backup}
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        reply = done.pop().result()
+        if not is_transport_error(reply[0]) or not pending:
+            break
+    for task in pending:
+        task.cancel()
+    return reply
+
+def query_model_stage(args):
+    """
+    Pipeline stage 1: send the English prompt to one model and time the request.
+    Returns a query record for translation_stage; exceptions are captured in it.
+    """
+    model_id, details, max_tokens, english_question = args
+    print_detail(f"\n\033[96m{'='*80}\033[0m")
+    print_detail(f"\033[96mProcessing Model: {details['name']}\033[0m")
+    print_detail(f"\033[96m{'='*80}\033[0m")
+    try:
+        # Record start time
+        started_at, start_ns = time.time(), time.monotonic_ns()
+        print_detail(f"\033[93mStart Time: {format_report_time(started_at)}\033[0m")
+
+        # Get English response
+        print_detail(f"\n\033[93mSending English prompt to {details['name']}:\033[0m")
+        print_detail(f"\033[93mPrompt: {english_question}\033[0m")
+        hedge_after = hedge_delay_for(model_id)
+        if hedge_after:
+            english_response, raw_data = query_model_hedged(model_id, english_question, max_tokens, hedge_after)
+        else:
+            english_response, raw_data = query_model(model_id, english_question, max_tokens)
+        print_detail(f"\n\033[92mReceived English response from {details['name']}:\033[0m")
+        print_detail(f"\033[92mResponse: {english_response}\033[0m")
+
+        # Record end time and calculate duration
+        end_ns = time.monotonic_ns()
+        print_detail(f"\033[93mEnd Time: {format_report_time(time.time())}\033[0m")
+        print_detail(f"\033[93mDuration: {(end_ns - start_ns) / 1e9:.2f} seconds\033[0m")
+
+        return {"model_id": model_id, "details": details, "english_response": english_response,
+                "raw_data": raw_data, "started_at": started_at, "start_ns": start_ns, "end_ns": end_ns}
+    except Exception as e:
+        return {"model_id": model_id, "details": details, "error": e}
+
+async def query_model_stage_async(client, semaphore, args, on_start=None):
+    """
+    Asyncio version of query_model_stage; the semaphore bounds how many requests are in flight.
+    on_start() is called once the request gets its slot.
+    """
+    model_id, details, max_tokens, english_question = args
+    try:
+        async with semaphore:
+            if on_start:
+                on_start()
+            started_at, start_ns = time.time(), time.monotonic_ns()
+            print_detail(f"\n\033[93mSending English prompt to {details['name']} (async)\033[0m")
+            hedge_after = hedge_delay_for(model_id)
+            if hedge_after:
+                english_response, raw_data = await query_model_hedged_async(
+                    client, model_id, english_question, max_tokens, hedge_after)
+            else:
+                english_response, raw_data = await query_model_async(client, model_id, english_question, max_tokens)
+            end_ns = time.monotonic_ns()
+            print_detail(f"\n\033[92mReceived English response from {details['name']} "
+                  f"in {(end_ns - start_ns) / 1e9:.2f} seconds\033[0m")
+        return {"model_id": model_id, "details": details, "english_response": english_response,
+                "raw_data": raw_data, "started_at": started_at, "start_ns": start_ns, "end_ns": end_ns}
+    except Exception as e:
+        return {"model_id": model_id, "details": details, "error": e}
+
+def translation_stage(query):
+    """
+    Pipeline stage 2: translate a query record's response and build its ModelResult.
+    """
+    model_id, details = query["model_id"], query["details"]
+    if "error" in query:
+        return build_error_result(model_id, details, query["error"])
+    try:
+        labels = analyze_response(query["english_response"])
+        spanish_response = translate_model_response(details, query["english_response"], labels)
+        return build_model_result(model_id, details, query["english_response"], spanish_response, query["raw_data"],
+                                  query["started_at"], query["start_ns"], query["end_ns"], labels)
+    except Exception as e:
+        return build_error_result(model_id, details, e)
+
+def process_model_response(args):
+    """
+    Query one model and translate its response, running both stages in the calling thread.
+    """
+    return translation_stage(query_model_stage(args))
+
+class AsyncModelEngine:
+    """
+    Runs query_model_stage_async on a background event loop with one pooled
+    keep-alive (HTTP/2 when h2 is installed) httpx client shared by every request.
+    submit() returns a concurrent.futures.Future with the query record, like
+    ThreadPoolExecutor.submit. Use as a context manager; leaving it waits for all requests.
+    """
+    def __init__(self, max_concurrency=ASYNC_MAX_CONCURRENT_REQUESTS):
+        self.max_concurrency = max_concurrency
+        self.loop = None
+        self.client = None
+        self.semaphore = None
+        self.thread = None
+        self.futures = []
+
+    def __enter__(self):
+        try:
+            import httpx
+        except ImportError:
+            raise RuntimeError("USE_ASYNC_ENGINE requires httpx (pip install httpx[http2])")
+        try:
+            import h2  # noqa: F401
+            http2 = True
+        except ImportError:
+            print("\033[93mh2 not installed, async engine falling back to HTTP/1.1 keep-alive\033[0m")
+            http2 = False
+
+        import asyncio
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="async-model-engine", daemon=True)
+        self.thread.start()
+
+        async def setup():
+            limits = httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency)
+            timeout = httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+            self.client = httpx.AsyncClient(http2=http2, limits=limits, timeout=timeout)
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        asyncio.run_coroutine_threadsafe(setup(), self.loop).result()
+        return self
+
+    def submit(self, args, on_done=None, on_start=None):
+        """
+        Schedule a model query. If given, on_done(query) is run in a worker thread
+        holding a semaphore slot, so a blocking handoff applies backpressure to the engine.
+        """
+        import asyncio
+
+        async def run():
+            query = await query_model_stage_async(self.client, self.semaphore, args, on_start)
+            if on_done:
+                async with self.semaphore:
+                    await asyncio.to_thread(on_done, query)
+            return query
+        future = asyncio.run_coroutine_threadsafe(run(), self.loop)
+        self.futures.append(future)
+        return future
+
+    def cancel(self):
+        """
+        Cancel every request that has not finished yet.
+        """
+        for future in self.futures:
+            future.cancel()
+
+    def __exit__(self, exc_type, exc, tb):
+        import asyncio
+        import concurrent.futures
+        concurrent.futures.wait(self.futures)
+        asyncio.run_coroutine_threadsafe(self.client.aclose(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        return False
+
+class ModelPipeline:
+    """
+    Two-stage pipeline for model requests.
+    Stage 1 queries models on MAX_CONCURRENT_REQUESTS threads (or the AsyncModelEngine).
+    Each response is handed through a bounded queue to stage 2, where TRANSLATION_WORKERS
+    threads translate it, so translation latency never holds a model slot. When the
+    queue is full, stage 1 blocks until translation catches up.
+    Requests are started by a dispatcher in submission order, keeping at most
+    PROVIDER_MAX_CONCURRENT_REQUESTS in flight per provider: while one provider is at
+    its cap (e.g. throttled and retrying), requests to other providers go ahead of its
+    backlog instead of filling the pool.
+    Finished result dictionaries are read back with get() as (tag, result) tuples.
+    started_at maps each tag to the monotonic time its first request started.
+    """
+    def __init__(self):
+        self.translation_queue = queue.Queue(maxsize=TRANSLATION_QUEUE_SIZE)
+        self.results = queue.Queue()
+        self.engine = None
+        self.executor = None
+        self.translation_threads = []
+        self.started_at = {}
+        self.abandoned = False
+        self.cancelled = set()  # tags whose waiting requests were dropped by cancel()
+        self.dispatch_lock = threading.Lock()
+        self.waiting = {}    # provider -> deque of (sequence, tag, args) not started yet
+        self.in_flight = {}  # provider -> requests running
+        self.running = 0
+        self.max_running = ASYNC_MAX_CONCURRENT_REQUESTS if USE_ASYNC_ENGINE else MAX_CONCURRENT_REQUESTS
+        self.sequence = 0
+
+    def __enter__(self):
+        if USE_ASYNC_ENGINE:
+            self.engine = AsyncModelEngine().__enter__()
+        else:
+            import concurrent.futures
+            self.executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=MAX_CONCURRENT_REQUESTS, thread_name_prefix="model-query")
+        for i in range(TRANSLATION_WORKERS):
+            thread = threading.Thread(target=self._translation_worker, name=f"translation-{i}", daemon=True)
+            thread.start()
+            self.translation_threads.append(thread)
+        return self
+
+    def submit(self, tag, args):
+        """
+        Queue one model request; its result will come back from get() with the given tag.
+        """
+        with self.dispatch_lock:
+            self.sequence += 1
+            self.waiting.setdefault(model_provider(args[0]), deque()).append((self.sequence, tag, args))
+        self._dispatch()
+
+    def _dispatch(self):
+        # Start the oldest waiting requests whose provider is under its cap
+        ready = []
+        with self.dispatch_lock:
+            while self.running < self.max_running and not self.abandoned:
+                provider = None
+                for candidate, waiting in self.waiting.items():
+                    if not waiting:
+                        continue
+                    if PROVIDER_MAX_CONCURRENT_REQUESTS and self.in_flight.get(candidate, 0) >= PROVIDER_MAX_CONCURRENT_REQUESTS:
+                        continue
+                    if provider is None or waiting[0][0] < self.waiting[provider][0][0]:
+                        provider = candidate
+                if provider is None:
+                    break
+                _, tag, args = self.waiting[provider].popleft()
+                self.in_flight[provider] = self.in_flight.get(provider, 0) + 1
+                self.running += 1
+                ready.append((tag, args))
+        for tag, args in ready:
+            self._start(tag, args)
+
+    def _start(self, tag, args):
+        if self.engine:
+            self.engine.submit(args, on_done=lambda query: self._query_done(tag, args, query),
+                               on_start=lambda: self.started_at.setdefault(tag, time.monotonic()))
+        else:
+            self.executor.submit(self._query_worker, tag, args)
+
+    def _query_done(self, tag, args, query):
+        # Free the request's slot before the (possibly blocking) handoff to translation
+        with self.dispatch_lock:
+            self.in_flight[model_provider(args[0])] -= 1
+            self.running -= 1
+        self._dispatch()
+        self._handoff(tag, query)
+
+    def get(self, timeout=None):
+        """
+        Return the next finished (tag, result) tuple, blocking up to timeout seconds.
+        Raises queue.Empty if nothing finished in time.
+        """
+        return self.results.get(timeout=timeout)
+
+    def cancel(self, tag):
+        """
+        Drop the requests of tag that have not started yet (e.g. its question reached
+        its deadline), so they use no quota or slot. Requests already running finish,
+        but their responses are not translated or returned.
+        Returns the set of model IDs whose requests were dropped.
+        """
+        with self.dispatch_lock:
+            self.cancelled.add(tag)
+            dropped = set()
+            for provider, waiting in self.waiting.items():
+                dropped.update(args[0] for _, entry_tag, args in waiting if entry_tag == tag)
+                self.waiting[provider] = deque(entry for entry in waiting if entry[1] != tag)
+        return dropped
+
+    def abandon(self):
+        """
+        Stop waiting for the requests still running (e.g. after their deadline passed).
+        Their results are dropped and leaving the pipeline no longer waits for them.
+        """
+        self.abandoned = True
+        if self.engine:
+            self.engine.cancel()
+
+    def _handoff(self, tag, query):
+        if not self.abandoned and tag not in self.cancelled:
+            # Blocks while the translation queue is full (backpressure)
+            self.translation_queue.put((tag, query))
+
+    def _query_worker(self, tag, args):
+        if self.abandoned:
+            return
+        self.started_at.setdefault(tag, time.monotonic())
+        self._query_done(tag, args, query_model_stage(args))
+
+    def _translation_worker(self):
+        while True:
+            item = self.translation_queue.get()
+            if item is None:
+                break
+            tag, query = item
+            self.results.put((tag, translation_stage(query)))
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.engine:
+            self.engine.__exit__(exc_type, exc, tb)
+        else:
+            # Abandoned requests finish within READ_TIMEOUT; do not block the run on them
+            self.executor.shutdown(wait=not self.abandoned, cancel_futures=self.abandoned)
+        for _ in self.translation_threads:
+            self.translation_queue.put(None)
+        for thread in self.translation_threads:
+            thread.join()
+        return False
+
+class ResultJournal:
+    """
+    Append-only JSONL write-ahead log of finished model results.
+    Each record is flushed and fsynced before the result is used, so after a crash
+    load() returns every answer that was already paid for. Once a question has been
+    reported successfully its records are retired with a "done" record and dropped by
+    compact(); the records of a question whose report failed are kept for its next run.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def _append(self, record):
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self.lock:
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line)
+                    f.flush()
+                    os.fsync(f.fileno())
+            except OSError as e:
+                print(f"\033[31mError writing result journal {self.path}: {str(e)}\033[0m")
+
+    def _records(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        # A torn last line from a crash mid-write
+                        continue
+        except FileNotFoundError:
+            return
+
+    def append_result(self, question, english_question, result):
+        self._append({"type": "result", "question": question, "english_question": english_question,
+                      "result": result.to_dict()})
+
+    def mark_done(self, question):
+        self._append({"type": "done", "question": question})
+
+    def load(self):
+        """
+        Returns a dictionary mapping each unfinished question to
+        {"english_question": ..., "results": {model_id: ModelResult}}. Results whose request
+        never completed (transport errors, exceptions) are left out so they are retried.
+        """
+        pending = {}
+        for record in self._records():
+            question = record.get("question")
+            if record.get("type") == "done":
+                pending.pop(question, None)
+            elif record.get("type") == "result":
+                result = ModelResult.from_dict(record["result"])
+                if result.error_class in TRANSPORT_ERROR_CLASSES or result.status is ResultStatus.EXCEPTION:
+                    continue
+                entry = pending.setdefault(question, {"english_question": record.get("english_question"), "results": {}})
+                entry["results"][result.model_id] = result
+        return pending
+
+    def compact(self):
+        """
+        Rewrite the journal keeping only the records of unfinished questions.
+        """
+        with self.lock:
+            try:
+                records = list(self._records())
+                # Only results written after a question's last "done" record are still needed
+                last_done = {r.get("question"): i for i, r in enumerate(records) if r.get("type") == "done"}
+                keep = [r for i, r in enumerate(records)
+                        if r.get("type") == "result" and i > last_done.get(r.get("question"), -1)]
+                if not keep:
+                    if os.path.exists(self.path):
+                        os.remove(self.path)
+                    return
+                tmp_path = self.path + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    for record in keep:
+                        f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                print(f"\033[31mError compacting result journal {self.path}: {str(e)}\033[0m")
+
+class ResultsStore:
+    """
+    Indexed SQLite store of every model result (one row per question and model per run),
+    with token counts, timings, the analysis labels and both languages of the response.
+    Safe to share between threads; Parquet export needs pyarrow.
+    """
+    COLUMNS = ["run_id", "question", "english_question", "model_id", "model_name", "timestamp",
+               "duration", "prompt_tokens", "completion_tokens", "total_tokens", "characters",
+               "ttft", "itl_p50", "itl_p95", "tokens_per_sec", "error_class",
+               "english_response", "spanish_response", "refusal", "degenerate", "language"]
+    # Columns added after the first release, created on older databases when opened
+    ADDED_COLUMNS = {"refusal": "INTEGER", "degenerate": "INTEGER", "language": "TEXT"}
+
+    def __init__(self, path=RESULTS_DB_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS results (
+            id INTEGER PRIMARY KEY,
+            run_id TEXT NOT NULL,
+            question TEXT NOT NULL,
+            english_question TEXT,
+            model_id TEXT NOT NULL,
+            model_name TEXT,
+            timestamp REAL NOT NULL,
+            duration REAL,
+            prompt_tokens INTEGER,
+            completion_tokens INTEGER,
+            total_tokens INTEGER,
+            characters INTEGER,
+            ttft REAL,
+            itl_p50 REAL,
+            itl_p95 REAL,
+            tokens_per_sec REAL,
+            error_class TEXT NOT NULL,
+            english_response TEXT,
+            spanish_response TEXT,
+            refusal INTEGER,
+            degenerate INTEGER,
+            language TEXT)""")
+        existing = {row[1] for row in self.conn.execute("PRAGMA table_info(results)")}
+        for column, column_type in self.ADDED_COLUMNS.items():
+            if column not in existing:
+                self.conn.execute(f"ALTER TABLE results ADD COLUMN {column} {column_type}")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS results_model_id ON results (model_id, timestamp)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS results_question ON results (question)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS results_timestamp ON results (timestamp)")
+        self.conn.commit()
+
+    def add_result(self, question, english_question, result):
+        """
+        Insert one ModelResult as produced by the pipeline.
+        """
+        labels = result.labels
+        row = (
+            RUN_ID, question, english_question, result.model_id, result.model_name,
+            result.started_at or result.recorded_at or time.time(),
+            result.duration,
+            result.prompt_tokens,
+            result.completion_tokens,
+            result.total_tokens,
+            result.characters,
+            result.ttft,
+            result.itl_p50,
+            result.itl_p95,
+            result.tokens_per_sec,
+            labels["error_class"],
+            result.english_response,
+            result.spanish_response,
+            int(labels["refusal"]),
+            int(labels["degenerate"]),
+            labels["language"],
+        )
+        with self.lock:
+            try:
+                self.conn.execute(f"INSERT INTO results ({', '.join(self.COLUMNS)}) "
+                                  f"VALUES ({', '.join('?' * len(self.COLUMNS))})", row)
+                self.conn.commit()
+            except sqlite3.Error as e:
+                print(f"\033[31mError writing result to {self.path}: {str(e)}\033[0m")
+
+    def recent_latencies(self, per_model=100):
+        """
+        Durations of the latest successful answers of every model, oldest first.
+        Returns a dictionary mapping model_id to a list of seconds.
+        """
+        with self.lock:
+            rows = self.conn.execute("""SELECT model_id, duration FROM (
+                SELECT model_id, duration, timestamp, ROW_NUMBER() OVER (
+                    PARTITION BY model_id ORDER BY timestamp DESC) AS recent
+                FROM results WHERE error_class = 'ok' AND duration IS NOT NULL)
+                WHERE recent <= ? ORDER BY model_id, timestamp""", (per_model,)).fetchall()
+        latencies = {}
+        for model_id, duration in rows:
+            latencies.setdefault(model_id, []).append(duration)
+        return latencies
+
+    def latest_run_id(self, question=None):
+        """
+        The run that stored the newest result (of question, if given), or None.
+        """
+        with self.lock:
+            if question is None:
+                row = self.conn.execute("SELECT run_id FROM results ORDER BY id DESC LIMIT 1").fetchone()
+            else:
+                row = self.conn.execute("SELECT run_id FROM results WHERE question = ? ORDER BY id DESC LIMIT 1",
+                                        (question,)).fetchone()
+        return row[0] if row else None
+
+    def run_results(self, run_id, question=None):
+        """
+        The results stored by a run (only those of question, if given), grouped by question.
+        Returns a list of (question, english_question, [ModelResult]) in the order stored.
+        The stored labels are reused; only rows written before the label columns existed
+        are analyzed again (repeated_ngrams is not stored and comes back as None).
+        """
+        query = ("SELECT question, english_question, model_id, model_name, timestamp, duration, prompt_tokens, "
+                 "completion_tokens, total_tokens, ttft, itl_p50, itl_p95, tokens_per_sec, error_class, "
+                 "english_response, spanish_response, refusal, degenerate, language FROM results WHERE run_id = ?")
+        params = [run_id]
+        if question is not None:
+            query += " AND question = ?"
+            params.append(question)
+        with self.lock:
+            rows = self.conn.execute(query + " ORDER BY id", params).fetchall()
+        groups = {}
+        for (question, english_question, model_id, model_name, timestamp, duration, prompt_tokens, completion_tokens,
+             total_tokens, ttft, itl_p50, itl_p95, tokens_per_sec, error_class, english_response, spanish_response,
+             refusal, degenerate, language) in rows:
+            results = groups.setdefault(question, (english_question, []))[1]
+            labels = None
+            if error_class is not None and refusal is not None and degenerate is not None and language is not None:
+                labels = {"error_class": error_class, "refusal": bool(refusal), "repeated_ngrams": None,
+                          "degenerate": bool(degenerate), "language": language,
+                          "language_mismatch": language not in ("en", "unknown")}
+            results.append(ModelResult(
+                model_id=model_id,
+                model_name=model_name or model_id,
+                status=ResultStatus.from_error_class(error_class),
+                english_response=english_response or "",
+                spanish_response=spanish_response or "",
+                started_at=timestamp,
+                start_ns=0 if duration is not None else None,
+                end_ns=round(duration * 1e9) if duration is not None else None,
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=total_tokens,
+                ttft=ttft,
+                itl_p50=itl_p50,
+                itl_p95=itl_p95,
+                tokens_per_sec=tokens_per_sec,
+                labels=labels))
+        return [(question, english_question, results) for question, (english_question, results) in groups.items()]
+
+    def export_parquet(self, path, batch_size=10000):
+        """
+        Export the results table to a Parquet file in batches, so memory stays bounded.
+        Returns the number of rows written.
+        """
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+
+        schema = pa.schema([
+            ("id", pa.int64()), ("run_id", pa.string()), ("question", pa.string()),
+            ("english_question", pa.string()), ("model_id", pa.string()), ("model_name", pa.string()),
+            ("timestamp", pa.float64()), ("duration", pa.float64()), ("prompt_tokens", pa.int64()),
+            ("completion_tokens", pa.int64()), ("total_tokens", pa.int64()), ("characters", pa.int64()),
+            ("ttft", pa.float64()), ("itl_p50", pa.float64()), ("itl_p95", pa.float64()),
+            ("tokens_per_sec", pa.float64()), ("error_class", pa.string()),
+            ("english_response", pa.string()), ("spanish_response", pa.string()),
+            ("refusal", pa.int8()), ("degenerate", pa.int8()), ("language", pa.string()),
+        ])
+        written = 0
+        with self.lock:
+            cursor = self.conn.execute(f"SELECT id, {', '.join(self.COLUMNS)} FROM results ORDER BY id")
+            with pq.ParquetWriter(path, schema) as parquet_writer:
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    columns = list(zip(*rows))
+                    parquet_writer.write_table(pa.Table.from_arrays(
+                        [pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema))
+                    written += len(rows)
+        return written
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+def latency_bucket(duration):
+    """
+    Index of the logarithmic histogram bucket holding a duration in seconds.
+    """
+    if duration is None:
+        return None
+    return math.floor(math.log(max(duration, 0.001)) / math.log(LATENCY_BUCKET_GROWTH))
+
+def histogram_percentile(buckets, pct):
+    """
+    Approximate percentile from sorted (bucket, count) pairs, using each bucket's geometric midpoint.
+    """
+    total = sum(count for _, count in buckets)
+    if not total:
+        return None
+    rank = total * pct / 100
+    seen = 0
+    for bucket, count in buckets:
+        seen += count
+        if seen >= rank:
+            return LATENCY_BUCKET_GROWTH ** (bucket + 0.5)
+    return LATENCY_BUCKET_GROWTH ** (buckets[-1][0] + 0.5)
+
+class Leaderboard:
+    """
+    Cross-run model leaderboard aggregated from the results store.
+    Aggregates live in their own tables next to the results: per-model sums, a log-scale
+    latency histogram and failure counts. update() folds only the rows added since the
+    last update, with one GROUP BY query per table, so each run costs O(new rows).
+    """
+    def __init__(self, store):
+        self.conn = store.conn
+        self.lock = store.lock
+        self.conn.create_function("latency_bucket", 1, latency_bucket, deterministic=True)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS leaderboard_state (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS leaderboard_models (
+                model_id TEXT PRIMARY KEY,
+                model_name TEXT,
+                answers INTEGER NOT NULL,
+                successes INTEGER NOT NULL,
+                token_chars INTEGER NOT NULL,
+                tokens INTEGER NOT NULL,
+                tokens_per_sec_sum REAL NOT NULL,
+                tokens_per_sec_count INTEGER NOT NULL,
+                last_seen REAL);
+            CREATE TABLE IF NOT EXISTS leaderboard_latency (
+                model_id TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (model_id, bucket));
+            CREATE TABLE IF NOT EXISTS leaderboard_failures (
+                model_id TEXT NOT NULL,
+                error_class TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (model_id, error_class));
+        """)
+        self.conn.commit()
+
+    def reset(self):
+        with self.lock:
+            self.conn.executescript("""
+                DELETE FROM leaderboard_state;
+                DELETE FROM leaderboard_models;
+                DELETE FROM leaderboard_latency;
+                DELETE FROM leaderboard_failures;
+            """)
+            self.conn.commit()
+
+    def update(self):
+        """
+        Fold the results added since the last update into the aggregates.
+        Returns the number of new rows.
+        """
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM leaderboard_state WHERE key = 'last_id'").fetchone()
+            last_id = row[0] if row else 0
+            new_last_id, new_rows = self.conn.execute(
+                "SELECT COALESCE(MAX(id), ?), COUNT(*) FROM results WHERE id > ?", (last_id, last_id)).fetchone()
+            if not new_rows:
+                return 0
+            window = (last_id, new_last_id)
+            self.conn.execute("""
+                INSERT INTO leaderboard_models
+                SELECT model_id, MAX(model_name), COUNT(*),
+                    SUM(error_class = 'ok'),
+                    COALESCE(SUM(CASE WHEN error_class = 'ok' AND total_tokens > 0 THEN characters END), 0),
+                    COALESCE(SUM(CASE WHEN error_class = 'ok' AND total_tokens > 0 THEN total_tokens END), 0),
+                    COALESCE(SUM(tokens_per_sec), 0), COUNT(tokens_per_sec), MAX(timestamp)
+                FROM results WHERE id > ? AND id <= ? GROUP BY model_id
+                ON CONFLICT (model_id) DO UPDATE SET
+                    model_name = COALESCE(excluded.model_name, model_name),
+                    answers = answers + excluded.answers,
+                    successes = successes + excluded.successes,
+                    token_chars = token_chars + excluded.token_chars,
+                    tokens = tokens + excluded.tokens,
+                    tokens_per_sec_sum = tokens_per_sec_sum + excluded.tokens_per_sec_sum,
+                    tokens_per_sec_count = tokens_per_sec_count + excluded.tokens_per_sec_count,
+                    last_seen = MAX(last_seen, excluded.last_seen)""", window)
+            self.conn.execute("""
+                INSERT INTO leaderboard_latency
+                SELECT model_id, latency_bucket(duration) AS bucket, COUNT(*)
+                FROM results WHERE id > ? AND id <= ? AND error_class = 'ok' AND duration IS NOT NULL
+                GROUP BY model_id, bucket
+                ON CONFLICT (model_id, bucket) DO UPDATE SET count = count + excluded.count""", window)
+            self.conn.execute("""
+                INSERT INTO leaderboard_failures
+                SELECT model_id, error_class, COUNT(*)
+                FROM results WHERE id > ? AND id <= ? AND error_class != 'ok'
+                GROUP BY model_id, error_class
+                ON CONFLICT (model_id, error_class) DO UPDATE SET count = count + excluded.count""", window)
+            self.conn.execute("INSERT OR REPLACE INTO leaderboard_state VALUES ('last_id', ?)", (new_last_id,))
+            self.conn.commit()
+            return new_rows
+
+    def rows(self):
+        """
+        One dictionary per model, best success rate first (then fastest median latency).
+        """
+        with self.lock:
+            models = self.conn.execute("SELECT * FROM leaderboard_models").fetchall()
+            latency = {}
+            for model_id, bucket, count in self.conn.execute(
+                    "SELECT model_id, bucket, count FROM leaderboard_latency ORDER BY model_id, bucket"):
+                latency.setdefault(model_id, []).append((bucket, count))
+            failures = {}
+            for model_id, error_class, count in self.conn.execute(
+                    "SELECT model_id, error_class, count FROM leaderboard_failures ORDER BY count DESC"):
+                failures.setdefault(model_id, []).append((error_class, count))
+
+        rows = []
+        for (model_id, model_name, answers, successes, token_chars, tokens,
+             tps_sum, tps_count, last_seen) in models:
+            rows.append({
+                "model_id": model_id,
+                "model_name": model_name or model_id,
+                "answers": answers,
+                "success_rate": successes / answers if answers else 0,
+                "p50": histogram_percentile(latency.get(model_id, []), 50),
+                "p95": histogram_percentile(latency.get(model_id, []), 95),
+                "chars_per_token": token_chars / tokens if tokens else None,
+                "tokens_per_sec": tps_sum / tps_count if tps_count else None,
+                "failures": failures.get(model_id, []),
+                "last_seen": last_seen,
+            })
+        rows.sort(key=lambda r: (-r["success_rate"], r["p50"] if r["p50"] is not None else float("inf")))
+        return rows
+
+def render_leaderboard_html(rows, filename):
+    """
+    Write the leaderboard as a static HTML page.
+    """
+    import html
+
+    def number(value, fmt):
+        return format(value, fmt) if value is not None else "N/A"
+
+    lines = [f"""<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <title>Model Leaderboard</title>
+    <link rel="stylesheet" href="../css/estilo.css" media="all">
+</head>
+<body>
+    <h1>Model Leaderboard</h1>
+    <p>{sum(r["answers"] for r in rows):,} results from {len(rows)} models, generated {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
+    <table>
+        <thead>
+            <tr>
+                <th>#</th>
+                <th>Model</th>
+                <th>Answers</th>
+                <th>Success Rate</th>
+                <th>p50 Latency (s)</th>
+                <th>p95 Latency (s)</th>
+                <th>Chars/Token</th>
+                <th>Tokens/s</th>
+                <th>Failure Reasons</th>
+            </tr>
+        </thead>
+        <tbody>
+"""]
+    for rank, row in enumerate(rows, 1):
+        failures = "<br>".join(f"{html.escape(error_class)}: {count}" for error_class, count in row["failures"])
+        lines.append(f"""            <tr>
+                <td>{rank}</td>
+                <td>{html.escape(row["model_name"])}<br><span class="model-id">{html.escape(row["model_id"])}</span></td>
+                <td>{row["answers"]:,}</td>
+                <td>{row["success_rate"] * 100:.1f}%</td>
+                <td>{number(row["p50"], ".2f")}</td>
+                <td>{number(row["p95"], ".2f")}</td>
+                <td>{number(row["chars_per_token"], ".2f")}</td>
+                <td>{number(row["tokens_per_sec"], ".1f")}</td>
+                <td>{failures or "-"}</td>
+            </tr>
+""")
+    lines.append("""        </tbody>
+    </table>
+</body>
+</html>""")
+    tmp_filename = filename + ".part"
+    with open(tmp_filename, "w", encoding="utf-8") as f:
+        f.writelines(lines)
+    os.replace(tmp_filename, filename)
 
-    # Write the HTML file
+def update_leaderboard(output=LEADERBOARD_FILE, rebuild=False):
+    """
+    Fold new results into the leaderboard aggregates and render the HTML page.
+    Returns the output filename, or None if it could not be written.
+    """
+    store = ResultsStore(RESULTS_DB_FILE)
     try:
-        with open(html_filename, "w", encoding="utf-8") as file:
-            file.write(html_content)
-    except Exception as e:
-        print(f"\033[31mError writing HTML file {html_filename}: {str(e)}\033[0m")
+        leaderboard = Leaderboard(store)
+        if rebuild:
+            leaderboard.reset()
+        started = time.perf_counter()
+        new_rows = leaderboard.update()
+        rows = leaderboard.rows()
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+        render_leaderboard_html(rows, output)
+        print(f"\033[92mLeaderboard updated with {new_rows} new results ({len(rows)} models) "
+              f"in {time.perf_counter() - started:.3f}s: {output}\033[0m")
+        return output
+    except (sqlite3.Error, OSError) as e:
+        print(f"\033[31mError updating leaderboard: {str(e)}\033[0m")
         return None
+    finally:
+        store.close()
 
-    # Check file size
-    try:
-        file_size = os.path.getsize(html_filename)
-        if file_size < 50 * 1024:  # 50KB in bytes
-            if safe_move_file(html_filename, f"file too small ({file_size/1024:.1f}KB)"):
-                small_files.append((html_filename, file_size))
-                print(f"\033[31mMoved HTML file {html_filename} to html_failed due to small size ({file_size/1024:.1f}KB)\033[0m")
-            return None
+DEDUP_STOPWORDS = frozenset("""
+a al algo algun alguna algunas alguno algunos ante como con contra cual cuales cuando de del desde donde
+el ella ellas ellos en entre era es esa esas ese eso esos esta estan estas este esto estos fue ha hay la las
+le les lo los mas me mi mis mucho muy no nos o para pero poco por que quien se sea ser si sin sobre son su
+sus tambien te tiene tu tus un una uno unos unas y ya yo
+about an and are as at be but by can could do does for from had has have how i if in is it its know me my
+of on or our please should so than that the their them then there these they this to was what when where
+which who why will with would you your
+""".split())
 
-        # If HTML is valid, create Excel report
-        excel_filename = create_excel_report_for_prompt(original_spanish_prompt, english_prompt, results, timestamp, safe_prompt)
-        if excel_filename:
-            print(f"Excel report saved as '{excel_filename}'")
+def normalize_question(question):
+    """
+    Case- and accent-insensitive form of a question: lowercase letters and digits
+    separated by single spaces ("¿Cómo curar el cáncer?" -> "como curar el cancer").
+    """
+    text = unicodedata.normalize("NFKD", question.casefold())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(re.findall(r"\w+", text))
+
+def question_hash(normalized):
+    import hashlib
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+def question_shingles(normalized, size=DEDUP_SHINGLE_SIZE):
+    """
+    Character shingles of the content words of a normalized question (stopwords dropped),
+    so rewordings, plurals and typos still share most of their shingles.
+    """
+    words = [word for word in normalized.split() if word not in DEDUP_STOPWORDS]
+    text = " ".join(words) or normalized
+    if len(text) <= size:
+        return {text}
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+def question_similarity(normalized, other_normalized):
+    """
+    Jaccard similarity of the shingles of two normalized questions, or 0.0 if they
+    mention different numbers ("poblacion de espana en 2020" is not a repeat of 2021).
+    """
+    if set(re.findall(r"\d+", normalized)) != set(re.findall(r"\d+", other_normalized)):
+        return 0.0
+    shingles, other_shingles = question_shingles(normalized), question_shingles(other_normalized)
+    return len(shingles & other_shingles) / len(shingles | other_shingles)
+
+def minhash_bands(shingles):
+    """
+    LSH band keys of a shingle set. The MinHash signature uses one-permutation hashing:
+    every shingle is hashed once, the hash picks one of DEDUP_BANDS * DEDUP_ROWS_PER_BAND
+    slots and each slot keeps its smallest value; empty slots borrow from the next
+    filled one. The signature is cut into DEDUP_BANDS bands of DEDUP_ROWS_PER_BAND
+    slots, each hashed to a signed 64-bit key. Two questions with Jaccard similarity
+    s share a band with probability about 1 - (1 - s**rows)**bands.
+    """
+    import hashlib
+    size = DEDUP_BANDS * DEDUP_ROWS_PER_BAND
+    slots = [None] * size
+    for shingle in shingles:
+        digest = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        slot, value = digest % size, digest // size
+        if slots[slot] is None or value < slots[slot]:
+            slots[slot] = value
+    # Walk the slots backwards twice so the last empty slots can borrow across the wrap
+    signature = [None] * size
+    borrowed, distance = None, 0
+    for slot in reversed(range(2 * size)):
+        slot %= size
+        if slots[slot] is None:
+            distance += 1
         else:
-            print(f"\033[31mFailed to create Excel report\033[0m")
-            if safe_move_file(html_filename, "failed to create Excel report"):
-                print(f"\033[31mMoved HTML file {html_filename} to html_failed due to Excel creation failure\033[0m")
-            return None
+            borrowed, distance = slots[slot], 0
+        signature[slot] = (borrowed, distance)
+    keys = []
+    for band in range(DEDUP_BANDS):
+        rows = signature[band * DEDUP_ROWS_PER_BAND:(band + 1) * DEDUP_ROWS_PER_BAND]
+        key = hashlib.blake2b(repr(rows).encode("ascii"), digest_size=8).digest()
+        keys.append(int.from_bytes(key, "big", signed=True))
+    return keys
 
-        print(f"HTML report saved as '{html_filename}' ({file_size/1024:.1f}KB)")
-        return html_filename
-    except Exception as e:
-        print(f"\033[31mError processing file {html_filename}: {str(e)}\033[0m")
-        return None
+class QuestionIndex:
+    """
+    Persistent SQLite index of answered questions for the intake stage.
+    Every question is stored with the hash of its normalized form (exact duplicates)
+    and its MinHash LSH band keys (near duplicates). sync() reads only the bytes
+    appended to the resolved file since the last sync, so a run never rereads the
+    whole file. Use ":memory:" for a throwaway index, e.g. of the current batch.
+    """
+    def __init__(self, path=QUESTION_INDEX_FILE):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA cache_size = -65536")  # 64MB, keeps the band index in memory while building
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS index_state (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS questions (
+                id INTEGER PRIMARY KEY,
+                question TEXT NOT NULL,
+                normalized TEXT NOT NULL,
+                hash TEXT NOT NULL UNIQUE,
+                occurrences INTEGER NOT NULL DEFAULT 1);
+            CREATE TABLE IF NOT EXISTS question_bands (
+                band INTEGER NOT NULL,
+                bucket INTEGER NOT NULL,
+                question_id INTEGER NOT NULL,
+                PRIMARY KEY (band, bucket, question_id)) WITHOUT ROWID;
+        """)
+        self.conn.commit()
 
-def process_model_response(args):
-    model_id, details, max_tokens, english_question = args
-    print(f"\n\033[96m{'='*80}\033[0m")
-    print(f"\033[96mProcessing Model: {details['name']}\033[0m")
-    print(f"\033[96m{'='*80}\033[0m")
-    try:
-        # Record start time
-        start_time = datetime.datetime.now()
-        print(f"\033[93mStart Time: {start_time.strftime('%Y-%m-%d %H:%M:%S')}\033[0m")
+    def _state(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM index_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
 
-        # Get English response
-        print(f"\n\033[93mSending English prompt to {details['name']}:\033[0m")
-        print(f"\033[93mPrompt: {english_question}\033[0m")
-        english_response, raw_data = query_model(model_id, english_question, max_tokens)
-        print(f"\n\033[92mReceived English response from {details['name']}:\033[0m")
-        print(f"\033[92mResponse: {english_response}\033[0m")
+    def _set_state(self, key, value):
+        self.conn.execute("INSERT INTO index_state (key, value) VALUES (?, ?) "
+                          "ON CONFLICT (key) DO UPDATE SET value = excluded.value", (key, str(value)))
 
-        # Record end time and calculate duration
-        end_time = datetime.datetime.now()
-        duration = (end_time - start_time).total_seconds()
-        print(f"\033[93mEnd Time: {end_time.strftime('%Y-%m-%d %H:%M:%S')}\033[0m")
-        print(f"\033[93mDuration: {duration:.2f} seconds\033[0m")
-
-        # Add delay between requests for rate limiting
-        print(f"\033[90mWaiting {REQUEST_DELAY} seconds before next request...\033[0m")
-        time.sleep(REQUEST_DELAY)
-
-        # Check if response is an error message
-        is_error = any(error in english_response.lower() for error in [
-            "error:", "no valid response received", "no response", "error processing response"
-        ])
+    def reset(self):
+        self.conn.executescript("""
+            DELETE FROM index_state;
+            DELETE FROM questions;
+            DELETE FROM question_bands;
+        """)
+        self.conn.commit()
 
-        # Only translate if not an error message
-        if not is_error:
-            print(f"\n\033[95mTranslating response from {details['name']} back to Spanish using Gemini...\033[0m")
-            print(f"\033[95mEnglish text to translate: {english_response}\033[0m")
-            spanish_response = translate_text(english_response, "spanish", GEMINI_MODEL)
-
-            if not spanish_response:
-                print(f"\033[31mWarning: Translation failed for {details['name']}\033[0m")
-                print(f"\033[31m- Model: {details['name']}\033[0m")
-                print(f"\033[31m- Original English response: {english_response}\033[0m")
-                print(f"\033[31m- Translation model used: {GEMINI_MODEL}\033[0m")
-                spanish_response = "Translation failed"
-            else:
-                print(f"\033[95mSpanish translation (by Gemini): {spanish_response}\033[0m")
-        else:
-            print(f"\n\033[93mSkipping translation for error message\033[0m")
-            spanish_response = english_response  # Use the same error message in Spanish
-
-        # Process token information
-        tokens = {}
-        if raw_data and "usage" in raw_data:
-            usage = raw_data["usage"]
-            tokens = {
-                "prompt_tokens": usage.get("prompt_tokens", "N/A"),
-                "completion_tokens": usage.get("completion_tokens", "N/A"),
-                "total_tokens": usage.get("total_tokens", "N/A")
-            }
-            print(f"\033[94mToken usage: {tokens}\033[0m")
-        else:
-            tokens = "N/A"
-            print(f"\033[94mToken usage: N/A\033[0m")
+    def add(self, question):
+        """
+        Index a question. Returns True if it was new, False if the same normalized
+        question was already indexed (its occurrence count is bumped instead).
+        """
+        normalized = normalize_question(question)
+        if not normalized:
+            return False
+        digest = question_hash(normalized)
+        if self.conn.execute("UPDATE questions SET occurrences = occurrences + 1 WHERE hash = ?", (digest,)).rowcount:
+            return False
+        cursor = self.conn.execute("INSERT INTO questions (question, normalized, hash) VALUES (?, ?, ?)",
+                                   (question, normalized, digest))
+        self.conn.executemany("INSERT INTO question_bands (band, bucket, question_id) VALUES (?, ?, ?)",
+                              [(band, key, cursor.lastrowid) for band, key in
+                               enumerate(minhash_bands(question_shingles(normalized)))])
+        return True
 
-        request_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        print(f"\033[96m{'='*80}\033[0m")
-        return {
-            "model_name": details["name"],
-            "model_id": model_id,
-            "tokens": tokens,
-            "english_response": english_response,
-            "spanish_response": spanish_response,
-            "translated_by": "Google Translate",
-            "request_time": request_time,  # <-- add this line
-            "start_time": start_time.strftime('%Y-%m-%d %H:%M:%S'),
-            "end_time": end_time.strftime('%Y-%m-%d %H:%M:%S'),
-            "duration": duration
-        }
-    except Exception as e:
-        print(f"\033[31mError processing {details['name']}: {str(e)}\033[0m")
-        print(f"\033[31m- Error Type: {type(e).__name__}\033[0m")
-        print(f"\033[31m- Error Message: {str(e)}\033[0m")
-        return {
-            "model_name": details["name"],
-            "model_id": model_id,
-            "tokens": "N/A",
-            "english_response": "Error processing response",
-            "spanish_response": "Error processing response",
-            "translated_by": "Google Translate",
-            "start_time": "N/A",
-            "end_time": "N/A",
-            "duration": "N/A"
-        }
+    def _prefix_hash(self, f, length):
+        import hashlib
+        f.seek(0)
+        return hashlib.sha1(f.read(min(length, 4096))).hexdigest()
 
-def process_question(question):
+    def sync(self, filename):
+        """
+        Index the questions appended to filename (one per line) since the last sync.
+        If the file was rewritten or truncated in the meantime it is reindexed from
+        the start. Returns the number of lines read.
+        """
+        try:
+            f = open(filename, "rb")
+        except FileNotFoundError:
+            return 0
+        with f:
+            offset = int(self._state("offset", 0))
+            size = os.fstat(f.fileno()).st_size
+            if offset and (size < offset or self._prefix_hash(f, offset) != self._state("prefix_hash")):
+                print(f"\033[93m{filename} was rewritten, rebuilding the question index\033[0m")
+                self.reset()
+                offset = 0
+            f.seek(offset)
+            data = f.read()
+            # A line still being written has no newline yet; it is picked up next time
+            complete = data[:data.rfind(b"\n") + 1]
+            lines = complete.decode("utf-8", errors="replace").splitlines()
+            for line in lines:
+                if line.strip():
+                    self.add(line.strip())
+            offset += len(complete)
+            self._set_state("offset", offset)
+            self._set_state("prefix_hash", self._prefix_hash(f, offset))
+            self.conn.commit()
+        return len(lines)
+
+    def find(self, question, threshold=DEDUP_SIMILARITY):
+        """
+        Look up the indexed question that question duplicates.
+        Returns (indexed question, similarity) with similarity 1.0 for an exact
+        match after normalization, or None if nothing reaches threshold.
+        """
+        normalized = normalize_question(question)
+        row = self.conn.execute("SELECT question FROM questions WHERE hash = ?",
+                                (question_hash(normalized),)).fetchone()
+        if row:
+            return row[0], 1.0
+        keys = minhash_bands(question_shingles(normalized))
+        candidates = self.conn.execute(
+            "SELECT DISTINCT q.question, q.normalized FROM question_bands b JOIN questions q ON q.id = b.question_id "
+            f"WHERE {' OR '.join(['(b.band = ? AND b.bucket = ?)'] * len(keys))}",
+            [value for band, key in enumerate(keys) for value in (band, key)]).fetchall()
+        best = None
+        for candidate, candidate_normalized in candidates:
+            similarity = question_similarity(normalized, candidate_normalized)
+            if similarity >= threshold and (best is None or similarity > best[1]):
+                best = (candidate, similarity)
+        return best
+
+    def duplicate_groups(self, threshold=DEDUP_SIMILARITY):
+        """
+        Exact and near duplicates among the indexed questions.
+        Returns (exact, near): exact is a list of (question, occurrences) indexed more
+        than once, near a list of (question, other question, similarity) pairs.
+        """
+        exact = self.conn.execute(
+            "SELECT question, occurrences FROM questions WHERE occurrences > 1 ORDER BY occurrences DESC").fetchall()
+        rows = self.conn.execute("""
+            SELECT DISTINCT a.question_id, b.question_id FROM question_bands a
+            JOIN question_bands b ON a.band = b.band AND a.bucket = b.bucket AND a.question_id < b.question_id
+        """).fetchall()
+        near = []
+        normalized = {}
+        for first, second in rows:
+            for question_id in (first, second):
+                if question_id not in normalized:
+                    normalized[question_id] = self.conn.execute(
+                        "SELECT question, normalized FROM questions WHERE id = ?", (question_id,)).fetchone()
+            (question, first_normalized), (other, second_normalized) = normalized[first], normalized[second]
+            similarity = question_similarity(first_normalized, second_normalized)
+            if similarity >= threshold:
+                near.append((question, other, similarity))
+        near.sort(key=lambda pair: -pair[2])
+        return exact, near
+
+    def close(self):
+        self.conn.close()
+
+def is_droppable_duplicate(question, match, similarity):
     """
-    Process a single question through the translation and response pipeline
+    True if question repeats match closely enough to be dropped at intake: the same
+    normalized question, or a similarity of at least DEDUP_DROP_SIMILARITY when set.
+    """
+    if normalize_question(question) == normalize_question(match):
+        return True
+    return DEDUP_DROP_SIMILARITY is not None and similarity >= DEDUP_DROP_SIMILARITY
+
+def filter_duplicate_questions(questions, resolved_file):
+    """
+    Intake stage: drop the questions already answered in resolved_file (through the
+    persistent question index) and the repeats of an earlier question of the same list.
+    Only exact repeats (after normalization) are dropped, plus near repeats at or above
+    DEDUP_DROP_SIMILARITY if set; other near repeats are kept.
+    Returns the questions left to process; the dropped ones go to run_stats.duplicate_questions,
+    the near repeats kept to run_stats.near_duplicate_questions.
+    """
+    index = QuestionIndex(QUESTION_INDEX_FILE)
+    batch = QuestionIndex(":memory:")
+    try:
+        started = time.perf_counter()
+        new_lines = index.sync(resolved_file)
+        remaining = []
+        for question in questions:
+            # A near match among the answered questions must not hide an exact one in the batch
+            matches = [match for match in (index.find(question), batch.find(question)) if match]
+            repeated = [match for match in matches if is_droppable_duplicate(question, *match)]
+            if repeated:
+                match = repeated[0]
+                run_stats.add("duplicate_questions", (question,) + match)
+                print(f"\033[93mSkipping duplicate question: {question} "
+                      f"(repeats \"{match[0]}\", similarity {match[1]:.2f})\033[0m")
+                continue
+            if matches:
+                match = max(matches, key=lambda match: match[1])
+                run_stats.add("near_duplicate_questions", (question,) + match)
+                print(f"\033[93mPossible duplicate question, processing it anyway: {question} "
+                      f"(similar to \"{match[0]}\", similarity {match[1]:.2f})\033[0m")
+            batch.add(question)
+            remaining.append(question)
+        print(f"\033[92mQuestion index: {new_lines} new answered questions indexed, "
+              f"{len(questions) - len(remaining)} duplicates dropped in {time.perf_counter() - started:.3f}s\033[0m")
+        return remaining
+    except (sqlite3.Error, OSError) as e:
+        print(f"\033[31mError checking {QUESTION_INDEX_FILE} for duplicate questions: {str(e)}\033[0m")
+        return questions
+    finally:
+        index.close()
+        batch.close()
+
+def report_duplicate_questions(resolved_file="preguntas_resueltas.csv", pending_file="preguntas_pendientes.csv", rebuild=False):
+    """
+    Sync the question index with the resolved file and print the duplicates among the
+    answered questions, plus the pending questions that the next run would skip.
+    """
+    index = QuestionIndex(QUESTION_INDEX_FILE)
+    try:
+        if rebuild:
+            index.reset()
+        started = time.perf_counter()
+        new_lines = index.sync(resolved_file)
+        indexed = index.conn.execute("SELECT COUNT(*) FROM questions").fetchone()[0]
+        print(f"\033[92mIndexed {new_lines} new lines of {resolved_file} ({indexed} distinct questions) "
+              f"in {time.perf_counter() - started:.3f}s\033[0m")
+        exact, near = index.duplicate_groups()
+        print(f"\n\033[93mRepeated Answered Questions:\033[0m")
+        print(f"Total: {len(exact)}")
+        for question, occurrences in exact:
+            print(f"- {question} ({occurrences} times)")
+        print(f"\n\033[93mNear-Duplicate Answered Questions:\033[0m")
+        print(f"Total: {len(near)}")
+        for question, other, similarity in near:
+            print(f"- {question} ~ {other} (similarity {similarity:.2f})")
+        try:
+            with open(pending_file, "r", encoding="utf-8") as pf:
+                pending_questions = [line.strip() for line in pf if line.strip()]
+        except FileNotFoundError:
+            pending_questions = []
+        matches = [(question, index.find(question)) for question in pending_questions]
+        matches = [(question, match) for question, match in matches if match]
+        skipped = [(question, match) for question, match in matches if is_droppable_duplicate(question, *match)]
+        similar = [(question, match) for question, match in matches if not is_droppable_duplicate(question, *match)]
+        print(f"\n\033[93mPending Questions Already Answered (skipped by the next run):\033[0m")
+        print(f"Total: {len(skipped)}")
+        for question, (answered, similarity) in skipped:
+            print(f"- {question} ~ {answered} (similarity {similarity:.2f})")
+        print(f"\n\033[93mPending Questions Similar to an Answered One (still processed):\033[0m")
+        print(f"Total: {len(similar)}")
+        for question, (answered, similarity) in similar:
+            print(f"- {question} ~ {answered} (similarity {similarity:.2f})")
+    except (sqlite3.Error, OSError) as e:
+        print(f"\033[31mError checking {QUESTION_INDEX_FILE} for duplicate questions: {str(e)}\033[0m")
+    finally:
+        index.close()
+
+def prepare_question(question, english_question=None):
+    """
+    Translate a question to English and build the arguments for every free model.
+    If english_question is given (e.g. from the result journal) the translation is skipped.
+    Returns a tuple (english_question, model_args) or None if the question cannot be processed.
     """
     print(f"\n\033[95m{'='*80}\033[0m")
     print(f"\n\033[95mProcessing Spanish Question:\033[0m")
@@ -681,10 +3539,11 @@ def process_question(question):
     
     # Translate to English
     print("\n\033[93mStep 1: Translating question to English...\033[0m")
-    english_question = translate_text(question, "english")
+    if not english_question:
+        english_question = translate_text(question, "english")
     if not english_question:
         print("\033[31mFailed to translate question to English. Skipping.\033[0m")
-        failed_questions.append((question, "translation failed"))
+        run_stats.add("failed_questions", (question, "translation failed"))
         return None
     
     print(f"\n\033[92mStep 1 Complete: English Translation:\033[0m")
@@ -695,69 +3554,280 @@ def process_question(question):
     free_models = load_free_models()
     if not free_models:
         print("No free models available. Exiting.")
-        failed_questions.append((question, "no free models available"))
+        run_stats.add("failed_questions", (question, "no free models available"))
         return None
     
+    # Skip models whose circuit breaker is open (dead or failing endpoints)
+    unhealthy = [model_id for model_id in free_models if not model_health.allow(model_id)]
+    for model_id in unhealthy:
+        del free_models[model_id]
+    if unhealthy:
+        print(f"\033[93mSkipping {len(unhealthy)} models with an open circuit breaker\033[0m")
+    if not free_models:
+        print("\033[31mNo healthy free models available.\033[0m")
+        run_stats.add("failed_questions", (question, "no healthy free models available"))
+        return None
+
     print(f"\n\033[92mStep 2 Complete: Found {len(free_models)} free models\033[0m")
     for model_id, details in free_models.items():
-        print(f"\033[92m- {details['name']}\033[0m")
+        print_detail(f"\033[92m- {details['name']}\033[0m")
 
     # Prepare arguments for parallel execution
     print("\n\033[93mStep 3: Preparing for parallel processing...\033[0m")
     model_args = []
     for model_id, details in free_models.items():
-        try:
-            max_tokens = int(details["context_length"] // 2)
-        except Exception:
-            max_tokens = 50
+        max_tokens = completion_budget(model_id, details, english_question)
+        if max_tokens is None:
+            print(f"\033[93m- Skipping {details['name']}: the question does not leave "
+                  f"{MIN_COMPLETION_TOKENS} tokens of its {details.get('context_length')} token context\033[0m")
+            continue
         model_args.append((model_id, details, max_tokens, english_question))
-        print(f"\033[92m- {details['name']}: max_tokens={max_tokens}\033[0m")
-
-    print("\n\033[93mStep 4: Starting parallel processing of models...\033[0m")
-    # Use ThreadPoolExecutor for parallel requests
-    results = []
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        future_to_model = {executor.submit(process_model_response, args): args for args in model_args}
-        for future in concurrent.futures.as_completed(future_to_model):
-            result = future.result()
-            results.append(result)
-            print(f"\n\033[92mCompleted processing for {result['model_name']}\033[0m")
+        print_detail(f"\033[92m- {details['name']}: max_tokens={max_tokens}\033[0m")
+
+    return english_question, model_args
 
+@tracer.traced("report_write")
+def finalize_question(question, english_question, results, writer=None):
+    """
+    Generate the report for a question once all of its models have returned
+    and update the run statistics. writer is the question's HtmlReportWriter if
+    its rows were streamed as the results arrived.
+    Returns True if a valid report was generated, None otherwise.
+    """
     print("\n\033[93mStep 5: Generating HTML report...\033[0m")
     # Create HTML report
-    report_file = create_html_report_for_prompt(question, english_question, results)
+    report_file = create_html_report_for_prompt(question, english_question, results, writer)
 
     # Update and print statistics
-    global total_prompted_models, successful_answers, failed_models_info
-    total_prompted_models += len(results)
+    run_stats.count("total_prompted_models", len(results))
     for result in results:
-        english_response = result.get("english_response", "")
-        is_error = not english_response or any(error in english_response.lower() for error in [
-            "error:", "no valid response received", "no response", "error processing response", "invalid json response"
-        ])
-        if is_error:
-            failed_models_info.append((result['model_name'], english_response))
-        else:
-            successful_answers += 1
+        labels = result.labels
+        if result.status is not ResultStatus.OK:
+            run_stats.add("failed_models_info", (result.model_name, result.english_response))
+            continue
+        run_stats.count("successful_answers")
+        run_stats.count("refusals", labels["refusal"])
+        run_stats.count("degenerate_responses", labels["degenerate"])
+        run_stats.count("language_mismatches", labels["language_mismatch"])
     
     if report_file is None:
         print(f"\033[31mFailed to generate valid report for question: {question}\033[0m")
-        failed_questions.append((question, "invalid HTML report"))
+        run_stats.add("failed_questions", (question, "invalid HTML report"))
         return None
     
     print(f"\n\033[92mStep 5 Complete: Report generated as {report_file}\033[0m")
     print(f"\033[95m{'='*80}\033[0m")
-    successful_questions.append(question)
+    run_stats.add("successful_questions", question)
     return True
 
-def process_pending_questions():
+def process_question(question):
     """
-    Reads pending questions from 'preguntas_pendientes.csv' and processes them
-    with translation workflow.
+    Process a single question through the translation and response pipeline
+    """
+    return process_question_batch([question])[0]
+
+def process_question_batch(questions, on_question_done=None):
+    """
+    Process a batch of questions with one shared ModelPipeline.
+    Every (question, model) pair goes into the same pool of MAX_CONCURRENT_REQUESTS
+    model slots (or the AsyncModelEngine when USE_ASYNC_ENGINE is set), so a slow
+    model only delays its own question. Translation runs in a separate stage.
+    Each question's report is generated as soon as its last model returns, or once
+    QUESTION_DEADLINE passes with the missing models recorded as timed out, and
+    on_question_done(question, outcome) is called right after.
+    Every result is written to the result journal first; models that already
+    answered in an interrupted earlier run, or in a run whose report for the question
+    failed, are taken from it instead of re-queried.
+    All results are also recorded in the results store when they arrive (not again when
+    taken from the journal), and with EXCEL_BATCH_WORKBOOK every reported question of a multi-question batch becomes a sheet of one workbook.
+    Reports are written by a BackgroundReportWriter, so the next results are collected
+    (and the next models queued) while earlier reports are still being written; the
+    outcome callback also runs on that thread and all reports are flushed before returning.
+    Returns a list with the outcome (True or None) of each question, in input order.
+    """
+    ensure_output_directories()
+    journal = ResultJournal(RESULT_JOURNAL_FILE)
+    resumed = journal.load()
+    store = ResultsStore(RESULTS_DB_FILE)
+    # Seed the hedging latency history with earlier runs
+    for model_id, durations in store.recent_latencies().items():
+        for duration in durations:
+            record_model_latency(model_id, duration)
+    outcomes = [None] * len(questions)
+    running_models = {}   # question index -> {model_id: details} still waiting for an answer
+    question_results = {} # question index -> list of results received so far
+    report_writers = {}   # question index -> HtmlReportWriter streaming its rows
+    english_questions = {}
+    excel_batch = None
+    if EXCEL_BATCH_WORKBOOK and len(questions) > 1:
+        excel_batch = ExcelReportWriter(os.path.join(XCELL_DIR, f"batch_{RUN_ID}.xlsx"))
+
+    def add_to_excel_batch(index, results):
+        nonlocal excel_batch
+        try:
+            excel_batch.add_sheet(questions[index], questions[index], english_questions[index], results)
+        except Exception as e:
+            print(f"\033[31mError adding question {index+1} to the batch Excel workbook, "
+                  f"skipping the batch workbook: {str(e)}\033[0m")
+            run_stats.add("report_errors", (questions[index], f"batch Excel workbook: {str(e)}"))
+            excel_batch = None
+
+    def save_excel_batch():
+        if not excel_batch or not excel_batch.sheets:
+            return
+        try:
+            excel_batch.save()
+            print(f"\033[92mBatch Excel workbook with {excel_batch.sheets} questions saved as '{excel_batch.filename}'\033[0m")
+        except Exception as e:
+            print(f"\033[31mError saving the batch Excel workbook: {str(e)}\033[0m")
+            run_stats.add("report_errors", (excel_batch.filename, f"batch Excel workbook: {str(e)}"))
+
+    # open_report, write_report_row and write_report run on the report writer thread,
+    # the only one touching report_writers, the batch workbook and the run statistics
+    def open_report(index):
+        try:
+            report_writers[index] = open_html_report(questions[index], english_questions[index])
+        except Exception as e:
+            print(f"\033[31mError creating HTML report file: {str(e)}\033[0m")
+
+    def write_report_row(index, result):
+        writer = report_writers.get(index)
+        if writer:
+            try:
+                writer.write_row(result)
+            except Exception as e:
+                # Fall back to writing the whole report at the end
+                print(f"\033[31mError streaming HTML report row: {str(e)}\033[0m")
+                writer.discard()
+                report_writers[index] = None
+
+    def write_report(index, results):
+        outcome = finalize_question(questions[index], english_questions[index], results,
+                                    report_writers.pop(index, None))
+        outcomes[index] = outcome
+        if outcome and excel_batch:
+            add_to_excel_batch(index, results)
+        if on_question_done:
+            on_question_done(questions[index], outcome)
+        # Retire the journal records only after the caller has recorded a successful
+        # outcome; a failed question keeps them, so its next run only asks the missing models
+        if outcome:
+            journal.mark_done(questions[index])
+
+    def add_result(index, result, replayed=False):
+        # Results replayed from the journal were stored when they first arrived
+        if not replayed:
+            store.add_result(questions[index], english_questions[index], result)
+        question_results[index].append(result)
+        reports.submit(questions[index], write_report_row, index, result)
+
+    def finish(index):
+        # All models returned: hand the report to the writer thread and keep collecting
+        del running_models[index]
+        model_health.save()
+        reports.submit(questions[index], write_report, index, question_results.pop(index))
+
+    def collect(index, result):
+        running = running_models.get(index)
+        if running is None or running.pop(result.model_id, None) is None:
+            print(f"\n\033[90mIgnoring late answer from {result.model_name} (question {index+1} already reported)\033[0m")
+            return
+        journal.append_result(questions[index], english_questions[index], result)
+        add_result(index, result)
+        if result.status is ResultStatus.OK and result.duration is not None:
+            record_model_latency(result.model_id, result.duration)
+        model_health.record(result.model_id, result.error_class, result.duration, result.labels["degenerate"])
+        print_detail(f"\n\033[92mCompleted processing for {result.model_name} "
+              f"({len(running)} models left for question {index+1})\033[0m")
+        if not running:
+            finish(index)
+
+    def expire_overdue(pipeline):
+        # Record models that missed their question's deadline as timed out and report anyway
+        now = time.monotonic()
+        for index in list(running_models):
+            started = pipeline.started_at.get(index)
+            if started is None or now - started < QUESTION_DEADLINE:
+                continue
+            print(f"\n\033[31mQuestion {index+1} reached its {QUESTION_DEADLINE}s deadline with "
+                  f"{len(running_models[index])} models unfinished\033[0m")
+            # Requests that never started are dropped and do not count against the models' health
+            dropped = pipeline.cancel(index)
+            if dropped:
+                print(f"\033[93mCancelled {len(dropped)} requests of question {index+1} that had not started\033[0m")
+            for model_id, details in running_models[index].items():
+                add_result(index, build_timeout_result(model_id, details, now - started))
+                if model_id not in dropped:
+                    model_health.record(model_id, "deadline")
+            finish(index)
+
+    def next_wait(pipeline):
+        # Seconds until the earliest deadline of a started question (poll if none started yet)
+        deadlines = [pipeline.started_at[i] + QUESTION_DEADLINE for i in running_models if i in pipeline.started_at]
+        return max(min(deadlines) - time.monotonic(), 0) if deadlines else 1.0
+
+    with BackgroundReportWriter() as reports, ModelPipeline() as pipeline:
+        # Submit each question's models as soon as it is prepared, so the fan-out of
+        # earlier questions overlaps the translation of later ones.
+        for index, question in enumerate(questions):
+            # A question listed twice is only resumed once
+            journaled = resumed.pop(question, {"english_question": None, "results": {}})
+            prepared = prepare_question(question, journaled["english_question"])
+            if not prepared:
+                if on_question_done:
+                    reports.submit(question, on_question_done, question, None)
+                continue
+            english_questions[index], model_args = prepared
+            question_results[index] = []
+            reports.submit(question, open_report, index)
+            for result in journaled["results"].values():
+                add_result(index, result, replayed=True)
+            model_args = [args for args in model_args if args[0] not in journaled["results"]]
+            if journaled["results"]:
+                print(f"\n\033[92mResuming question {index+1}: {len(journaled['results'])} model answers "
+                      f"recovered from {RESULT_JOURNAL_FILE}\033[0m")
+            running_models[index] = {args[0]: args[1] for args in model_args}
+            if not model_args:
+                finish(index)
+                continue
+            print(f"\n\033[93mStep 4: Queueing {len(model_args)} models for question {index+1} of {len(questions)}...\033[0m")
+            for args in schedule_models(model_args):
+                pipeline.submit(index, args)
+
+            # Finalize any questions that completed while this one was being prepared
+            while True:
+                try:
+                    tag, result = pipeline.get(timeout=0)
+                except queue.Empty:
+                    break
+                collect(tag, result)
+            expire_overdue(pipeline)
+
+        while running_models:
+            try:
+                tag, result = pipeline.get(timeout=next_wait(pipeline))
+                collect(tag, result)
+            except queue.Empty:
+                pass
+            expire_overdue(pipeline)
+
+        # Every question is reported; requests still running belong to expired questions
+        pipeline.abandon()
+
+    save_excel_batch()
+    journal.compact()
+    store.close()
+    return outcomes
+
+def start_run():
+    """
+    Print the run banner, create the report directories and load the blacklist.
     """
     print(f"\n\033[94m{'='*80}\033[0m")
     print("\033[94mStarting Question Processing Pipeline\033[0m")
     print(f"\033[94m{'='*80}\033[0m")
+    tracer.enabled = bool(TRACE_FILE)
+    ensure_output_directories()
     
     # Load blacklist at the start
     global blacklisted_models
@@ -767,18 +3837,21 @@ def process_pending_questions():
         print("\n\033[35mBlacklisted Models:\033[0m")
         for model_id in sorted(blacklisted_models):
             print(f"\033[35m- {model_id}\033[0m")
-    
-    print("\n\033[93mStep 1: Reading pending questions file...\033[0m")
-    pending_file = "preguntas_pendientes.csv"
-    resolved_file = "preguntas_resueltas.csv"
 
+def read_pending_questions(pending_file, resolved_file):
+    """
+    Read the pending questions (asking for one if there are none) and, with
+    DEDUP_PENDING_QUESTIONS, drop the ones already answered in resolved_file.
+    Returns the list of questions to process, or None if the run should stop.
+    """
+    print("\n\033[93mStep 1: Reading pending questions file...\033[0m")
     try:
         with open(pending_file, "r", encoding="utf-8") as pf:
             pending_lines = pf.readlines()
         print(f"\033[92mSuccessfully read {pending_file}\033[0m")
     except FileNotFoundError:
         print(f"\033[31mError: File {pending_file} not found.\033[0m")
-        return
+        return None
 
     pending_questions = [line.strip() for line in pending_lines if line.strip()]
     print(f"\033[92mFound {len(pending_questions)} pending questions\033[0m")
@@ -788,32 +3861,61 @@ def process_pending_questions():
         new_question = input("\033[31mNo pending questions found. \033[92mPlease enter a new question for the models (or type 'exit'/'quit' to end):\033[0m ").strip().lower()
         if new_question in ['exit', 'quit']:
             print("\033[92mExiting program as requested.\033[0m")
-            return
+            return None
         elif new_question:
             pending_questions = [new_question]
             print("\033[92mNew question added to processing queue\033[0m")
         else:
             print("\033[31mNo question provided. Exiting.\033[0m")
-            return
+            return None
 
-    remaining_questions = []
-
-    print("\n\033[93mStep 2: Processing questions...\033[0m")
-    for i, question in enumerate(pending_questions, 1):
-        if question:
-            print(f"\n\033[94mProcessing question {i} of {len(pending_questions)}:\033[0m")
-            print(f"\033[94mQuestion: {question}\033[0m")
-            if process_question(question):
-                print(f"\n\033[93mStep 3: Updating resolved questions file...\033[0m")
-                # Append the processed question to the resolved file
-                with open(resolved_file, "a", encoding="utf-8") as rf:
-                    rf.write(question + "\n")
-                print(f"\033[92mQuestion added to resolved file\033[0m")
-            else:
-                print(f"\033[31mFailed to process question. Adding to remaining questions.\033[0m")
-                remaining_questions.append(question)
+    if DEDUP_PENDING_QUESTIONS:
+        print("\n\033[93mChecking pending questions against the answered ones...\033[0m")
+        pending_questions = filter_duplicate_questions(pending_questions, resolved_file)
+
+    return pending_questions
+
+def resolved_question_recorder(pending_questions, pending_file, resolved_file):
+    """
+    Returns the on_question_done callback that moves each reported question from the
+    pending file to the resolved file as soon as its report is written.
+    """
+    resolved_questions = set()
+
+    def record_outcome(question, outcome):
+        if outcome:
+            # Move the processed question to the resolved file right away,
+            # so a later crash does not send it back to the queue
+            with open(resolved_file, "a", encoding="utf-8") as rf:
+                rf.write(question + "\n")
+            resolved_questions.add(question)
+            with open(pending_file, "w", encoding="utf-8") as pf:
+                for q in pending_questions:
+                    if q not in resolved_questions:
+                        pf.write(q + "\n")
+            print(f"\033[92mQuestion added to resolved file: {question}\033[0m")
         else:
-            remaining_questions.append(question)
+            print(f"\033[31mFailed to process question. Adding to remaining questions: {question}\033[0m")
+
+    return record_outcome
+
+def process_pending_questions():
+    """
+    Reads pending questions from 'preguntas_pendientes.csv' and processes them
+    with translation workflow.
+    """
+    start_run()
+    pending_file = "preguntas_pendientes.csv"
+    resolved_file = "preguntas_resueltas.csv"
+    pending_questions = read_pending_questions(pending_file, resolved_file)
+    if pending_questions is None:
+        return
+    record_outcome = resolved_question_recorder(pending_questions, pending_file, resolved_file)
+
+    print(f"\n\033[93mStep 2: Processing {len(pending_questions)} questions "
+          f"(up to {MAX_CONCURRENT_REQUESTS} concurrent model requests)...\033[0m")
+    outcomes = process_question_batch(pending_questions, on_question_done=record_outcome)
+    remaining_questions = [q for q, outcome in zip(pending_questions, outcomes) if not outcome]
 
     print("\n\033[93mStep 4: Updating pending questions file...\033[0m")
     # Update pending file with remaining questions
@@ -822,30 +3924,52 @@ def process_pending_questions():
             pf.write(q + "\n")
     print(f"\033[92mUpdated pending questions file with {len(remaining_questions)} remaining questions\033[0m")
 
-    # Generate final report
+    run_stats.add_process_counters()
+    print_run_summary()
+
+def print_run_summary():
+    """
+    Print the summary report of the run from run_stats, then update the leaderboard
+    and write the trace.
+    """
     print(f"\n\033[94m{'='*80}\033[0m")
     print(f"\033[93mProcessing Summary Report\033[0m")
     print(f"\033[94m{'='*80}\033[0m")
     
     print("\n\033[92mSuccessfully Processed Questions:\033[0m")
-    print(f"Total: {len(successful_questions)}")
-    for q in successful_questions:
+    print(f"Total: {len(run_stats.successful_questions)}")
+    for q in run_stats.successful_questions:
         print(f"- {q}")
     
+    print("\n\033[93mSkipped Duplicate Questions (Removed from Pending):\033[0m")
+    print(f"Total: {len(run_stats.duplicate_questions)}")
+    for question, answered, similarity in run_stats.duplicate_questions:
+        print(f"- {question} (repeats: {answered}, similarity {similarity:.2f})")
+
+    print("\n\033[93mPossible Duplicate Questions (Processed Anyway):\033[0m")
+    print(f"Total: {len(run_stats.near_duplicate_questions)}")
+    for question, similar, similarity in run_stats.near_duplicate_questions:
+        print(f"- {question} (similar to: {similar}, similarity {similarity:.2f})")
+
     print("\n\033[31mFailed Questions (Returned to Pending):\033[0m")
-    print(f"Total: {len(failed_questions)}")
-    for q, reason in failed_questions:
+    print(f"Total: {len(run_stats.failed_questions)}")
+    for q, reason in run_stats.failed_questions:
         print(f"- {q} (Reason: {reason})")
     
     print("\n\033[33mFailed Files:\033[0m")
-    print(f"Total: {len(failed_files)}")
-    for f, reason in failed_files:
+    print(f"Total: {len(run_stats.failed_files)}")
+    for f, reason in run_stats.failed_files:
         file_size = os.path.getsize(f)
         print(f"- {f} ({file_size/1024:.1f}KB) - Reason: {reason}")
     
+    print("\n\033[31mReport Errors:\033[0m")
+    print(f"Total: {len(run_stats.report_errors)}")
+    for question, reason in run_stats.report_errors:
+        print(f"- {question}: {reason}")
+
     print("\n\033[33mSmall Files (Under 50KB):\033[0m")
-    print(f"Total: {len(small_files)}")
-    for f, size in small_files:
+    print(f"Total: {len(run_stats.small_files)}")
+    for f, size in run_stats.small_files:
         print(f"- {f} ({size/1024:.1f}KB)")
     
     print("\n\033[35mBlacklisted Models:\033[0m")
@@ -853,23 +3977,470 @@ def process_pending_questions():
     for model_id in sorted(blacklisted_models):
         print(f"- {model_id}")
 
+    open_breakers = model_health.open_breakers()
+    print("\n\033[35mModels Skipped by Circuit Breaker:\033[0m")
+    print(f"Total: {len(open_breakers)}")
+    for model_id, record in open_breakers:
+        retry_at = datetime.datetime.fromtimestamp(record["open_until"]).strftime('%Y-%m-%d %H:%M:%S')
+        print(f"- {model_id} (error rate {record['error_rate']*100:.0f}%, last error: {record['last_error']}, "
+              f"retried after {retry_at})")
+
+    print("\n\033[94mRate Limiting:\033[0m")
+    print(f"- 429/503 responses: {run_stats.rate_limited_responses}")
+    print(f"- Time spent waiting for model request slots: {run_stats.request_wait_seconds:.1f}s")
+    print(f"- Time spent waiting for translation slots: {run_stats.translation_wait_seconds:.1f}s")
+
+    if HEDGE_REQUESTS:
+        print(f"- Hedged requests sent: {run_stats.hedged_requests}")
+
+    print("\n\033[94mTranslation Cache:\033[0m")
+    lookups = run_stats.translation_cache_hits + run_stats.translation_cache_misses
+    hit_rate = run_stats.translation_cache_hits / lookups * 100 if lookups else 0
+    print(f"\033[92m- Hits: {run_stats.translation_cache_hits}\033[0m")
+    print(f"\033[93m- Misses: {run_stats.translation_cache_misses}\033[0m")
+    print(f"- Hit rate: {hit_rate:.1f}%")
+
     print("\n\033[94mModel Performance Summary:\033[0m")
-    print(f"\033[92m- Total models prompted: {total_prompted_models}\033[0m")
-    print(f"\033[92m- Successful answers: {successful_answers}\033[0m")
-    failed_count = len(failed_models_info)
+    print(f"\033[92m- Total models prompted: {run_stats.total_prompted_models}\033[0m")
+    print(f"\033[92m- Successful answers: {run_stats.successful_answers}\033[0m")
+    print(f"\033[93m- Responses cut off for repeating themselves: {run_stats.repetition_cutoffs}\033[0m")
+    print(f"\033[93m- Refusals: {run_stats.refusals}\033[0m")
+    print(f"\033[93m- Degenerate (looping) answers: {run_stats.degenerate_responses}\033[0m")
+    print(f"\033[93m- Answers not in English: {run_stats.language_mismatches}\033[0m")
+    failed_count = len(run_stats.failed_models_info)
     print(f"\033[31m- Failed answers: {failed_count}\033[0m")
-    if failed_models_info:
+    if run_stats.failed_models_info:
         print("\033[31m  Failed Models:\033[0m")
-        for model_name, reason in failed_models_info:
+        for model_name, reason in run_stats.failed_models_info:
             # Truncate long reasons
             reason_summary = (reason[:70] + '...') if len(reason) > 70 else reason
             print(f"\033[31m  - {model_name}: {reason_summary}\033[0m")
     
+    print("\n\033[94mLeaderboard:\033[0m")
+    update_leaderboard()
+
+    print("\n\033[94mTimings:\033[0m")
+    for name, count, total, mean, longest in tracer.summary():
+        print(f"- {name}: {count} spans, {total:.1f}s total, {mean*1000:.0f}ms mean, {longest:.2f}s max")
+    if TRACE_FILE:
+        try:
+            spans = tracer.export(TRACE_FILE)
+            print(f"\033[92mTrace with {spans} spans written to {TRACE_FILE} (open it in chrome://tracing or ui.perfetto.dev)\033[0m")
+        except OSError as e:
+            print(f"\033[31mError writing trace file {TRACE_FILE}: {str(e)}\033[0m")
+
     print(f"\n\033[94m{'='*80}\033[0m")
     print("\033[94mQuestion Processing Pipeline Complete\033[0m")
     print(f"\033[94m{'='*80}\033[0m")
 
+class JobQueue:
+    """
+    SQLite work queue of the (question, model) jobs of a sharded run, shared by the
+    coordinator and the worker processes. lease() hands pending jobs to one worker inside
+    an IMMEDIATE transaction, so no job is given to two workers at once; workers renew()
+    their leases while the requests run, and jobs whose lease ran out (their worker died)
+    are leased again. complete() stores a job's ModelResult (encoded with RESULT_CODEC)
+    together with the worker's RunStats, and the coordinator collect()s the finished jobs.
+    """
+    def __init__(self, path=JOB_QUEUE_FILE):
+        self.path = path
+        # Autocommit mode; the methods that need a transaction open it themselves
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS queue_state (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS questions (
+                id INTEGER PRIMARY KEY,
+                question TEXT NOT NULL UNIQUE,
+                english_question TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY,
+                question_id INTEGER NOT NULL,
+                args TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                worker TEXT,
+                lease_until REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT);
+            CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, lease_until);
+            CREATE INDEX IF NOT EXISTS jobs_question ON jobs (question_id, status);
+            CREATE TABLE IF NOT EXISTS worker_stats (worker TEXT PRIMARY KEY, stats TEXT NOT NULL);
+        """)
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def set_open(self, is_open):
+        """
+        Mark whether the coordinator may still add jobs; workers only exit once it is closed.
+        """
+        self.conn.execute("INSERT INTO queue_state (key, value) VALUES ('open', ?) "
+                          "ON CONFLICT (key) DO UPDATE SET value = excluded.value", (str(int(is_open)),))
+
+    def is_open(self):
+        row = self.conn.execute("SELECT value FROM queue_state WHERE key = 'open'").fetchone()
+        return bool(row and row[0] == "1")
+
+    def queued_questions(self):
+        return {row[0] for row in self.conn.execute("SELECT question FROM questions")}
+
+    def add_question(self, question, english_question, model_args):
+        """
+        Queue a question with one job per model argument tuple, leased in the given order.
+        """
+        with self._transaction():
+            cursor = self.conn.execute("INSERT INTO questions (question, english_question) VALUES (?, ?)",
+                                       (question, english_question))
+            self.conn.executemany("INSERT INTO jobs (question_id, args) VALUES (?, ?)",
+                                  [(cursor.lastrowid, json.dumps(list(args), ensure_ascii=False)) for args in model_args])
+
+    def lease(self, worker, limit):
+        """
+        Lease up to limit pending (or expired) jobs to worker.
+        Returns a list of (job id, model argument tuple). Jobs already leased
+        JOB_MAX_ATTEMPTS times are not handed out again but completed as timed out.
+        """
+        now = time.time()
+        leased = []
+        with self._transaction():
+            rows = self.conn.execute(
+                "SELECT id, args, attempts FROM jobs WHERE status = 'pending' OR (status = 'leased' AND lease_until < ?) "
+                "ORDER BY id LIMIT ?", (now, limit)).fetchall()
+            for job_id, args, attempts in rows:
+                args = tuple(json.loads(args))
+                if attempts >= JOB_MAX_ATTEMPTS:
+                    result = build_timeout_result(args[0], args[1], attempts * JOB_LEASE_SECONDS)
+                    self.conn.execute("UPDATE jobs SET status = 'done', result = ? WHERE id = ?",
+                                      (encode_result(result), job_id))
+                    continue
+                self.conn.execute("UPDATE jobs SET status = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1 "
+                                  "WHERE id = ?", (worker, now + JOB_LEASE_SECONDS, job_id))
+                leased.append((job_id, args))
+        return leased
+
+    def renew(self, worker):
+        """
+        Extend the leases of every job worker is still running.
+        """
+        self.conn.execute("UPDATE jobs SET lease_until = ? WHERE worker = ? AND status = 'leased'",
+                          (time.time() + JOB_LEASE_SECONDS, worker))
+
+    def complete(self, job_id, worker, result, stats):
+        """
+        Store the result of a leased job and the worker's statistics so far.
+        Returns False if the job had meanwhile been leased to another worker.
+        """
+        with self._transaction():
+            cursor = self.conn.execute(
+                "UPDATE jobs SET status = 'done', result = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+                (encode_result(result), job_id, worker))
+            self.conn.execute("INSERT INTO worker_stats (worker, stats) VALUES (?, ?) "
+                              "ON CONFLICT (worker) DO UPDATE SET stats = excluded.stats",
+                              (worker, json.dumps(stats, ensure_ascii=False, default=str)))
+        return cursor.rowcount > 0
+
+    def has_work(self):
+        """
+        True while the queue is open or has jobs that are pending or leased.
+        """
+        if self.is_open():
+            return True
+        return self.conn.execute(
+            "SELECT EXISTS (SELECT 1 FROM jobs WHERE status IN ('pending', 'leased'))").fetchone()[0] == 1
+
+    def collect(self):
+        """
+        Take the jobs finished since the last call.
+        Returns a list of (question, english_question, ModelResult).
+        """
+        with self._transaction():
+            rows = self.conn.execute(
+                "SELECT q.question, q.english_question, j.result FROM jobs j JOIN questions q ON q.id = j.question_id "
+                "WHERE j.status = 'done' ORDER BY j.id").fetchall()
+            self.conn.execute("UPDATE jobs SET status = 'collected' WHERE status = 'done'")
+        return [(question, english_question, decode_result(result)) for question, english_question, result in rows]
+
+    def completed_questions(self):
+        """
+        Questions whose jobs have all been collected, with all their results.
+        Returns a list of (question, english_question, results).
+        """
+        rows = self.conn.execute(
+            "SELECT id, question, english_question FROM questions q WHERE NOT EXISTS "
+            "(SELECT 1 FROM jobs WHERE question_id = q.id AND status != 'collected')").fetchall()
+        return [(question, english_question,
+                 [decode_result(result) for (result,) in self.conn.execute(
+                     "SELECT result FROM jobs WHERE question_id = ? ORDER BY id", (question_id,))])
+                for question_id, question, english_question in rows]
+
+    def remove_question(self, question):
+        with self._transaction():
+            self.conn.execute("DELETE FROM jobs WHERE question_id = (SELECT id FROM questions WHERE question = ?)", (question,))
+            self.conn.execute("DELETE FROM questions WHERE question = ?", (question,))
+
+    def job_counts(self):
+        return dict(self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def reset_worker_stats(self):
+        self.conn.execute("DELETE FROM worker_stats")
+
+    def worker_stats(self):
+        return {worker: json.loads(stats) for worker, stats in self.conn.execute("SELECT worker, stats FROM worker_stats")}
+
+    def close(self):
+        self.conn.close()
+
+def run_worker(worker_id, api_key_env=None):
+    """
+    Worker process of a sharded run: lease (question, model) jobs from JOB_QUEUE_FILE,
+    run them through a ModelPipeline (model query, then translation) and store each
+    result back in the queue, until the coordinator has closed it and no job is left.
+    api_key_env names the environment variable holding this worker's API key.
+    """
+    if api_key_env:
+        api_key = os.environ.get(api_key_env)
+        if not api_key:
+            print(f"\033[31mError: environment variable {api_key_env} is not set.\033[0m")
+            return
+        headers["Authorization"] = f"Bearer {api_key}"
+
+    jobs = JobQueue(JOB_QUEUE_FILE)
+    store = ResultsStore(RESULTS_DB_FILE)
+    # Seed the hedging latency history with earlier runs
+    for model_id, durations in store.recent_latencies().items():
+        for duration in durations:
+            record_model_latency(model_id, duration)
+    store.close()
+
+    print(f"\033[94mWorker {worker_id} started on {JOB_QUEUE_FILE}\033[0m")
+    in_flight = set()
+    completed = 0
+    last_renewal = time.monotonic()
+    try:
+        with ModelPipeline() as pipeline:
+            while True:
+                room = min(pipeline.max_running - len(in_flight), JOB_LEASE_BATCH)
+                for job_id, args in (jobs.lease(worker_id, room) if room > 0 else []):
+                    in_flight.add(job_id)
+                    pipeline.submit(job_id, args)
+                if not in_flight:
+                    if not jobs.has_work():
+                        break
+                    time.sleep(JOB_POLL_INTERVAL)
+                    continue
+                try:
+                    job_id, result = pipeline.get(timeout=JOB_POLL_INTERVAL)
+                    in_flight.discard(job_id)
+                    if jobs.complete(job_id, worker_id, result, run_stats.to_dict(process_counters=True)):
+                        completed += 1
+                        print_detail(f"\033[92m[{worker_id}] {result.model_name} done ({completed} jobs)\033[0m")
+                    else:
+                        print(f"\033[93m[{worker_id}] {result.model_name} finished after its lease expired, "
+                              f"dropping the result\033[0m")
+                except queue.Empty:
+                    pass
+                if time.monotonic() - last_renewal > JOB_LEASE_SECONDS / 4:
+                    jobs.renew(worker_id)
+                    last_renewal = time.monotonic()
+    finally:
+        jobs.close()
+    print(f"\033[92mWorker {worker_id} finished: {completed} jobs completed\033[0m")
+
+def run_coordinator(workers=0, api_key_envs=None):
+    """
+    Coordinator of a sharded run: queue every pending question in JOB_QUEUE_FILE as one
+    job per model, optionally start local worker processes (handing out the API keys in
+    api_key_envs round robin), and report each question once all of its jobs are done.
+    Questions left in the queue by an interrupted coordinator are resumed. The workers'
+    statistics are merged into the summary.
+    """
+    start_run()
+    pending_file = "preguntas_pendientes.csv"
+    resolved_file = "preguntas_resueltas.csv"
+    pending_questions = read_pending_questions(pending_file, resolved_file)
+    if pending_questions is None:
+        return
+    record_outcome = resolved_question_recorder(pending_questions, pending_file, resolved_file)
+
+    jobs = JobQueue(JOB_QUEUE_FILE)
+    store = ResultsStore(RESULTS_DB_FILE)
+    processes = []
+    outcomes = {}
+    try:
+        queued = jobs.queued_questions()
+        jobs.reset_worker_stats()
+        jobs.set_open(True)
+        # Start the workers first, so they run the first questions while the rest are translated
+        for i in range(workers):
+            command = [sys.executable, entry_script()] + (["--quiet"] if QUIET else [])
+            command += ["worker", "--id", f"worker-{i+1}"]
+            if api_key_envs:
+                command += ["--api-key-env", api_key_envs[i % len(api_key_envs)]]
+            import subprocess
+            processes.append(subprocess.Popen(command))
+        if processes:
+            print(f"\033[92mStarted {len(processes)} worker processes\033[0m")
+
+        print(f"\n\033[93mStep 2: Queueing {len(pending_questions)} questions in {JOB_QUEUE_FILE}...\033[0m")
+        for question in pending_questions:
+            if question in queued:
+                print(f"\033[92mResuming question already in the queue: {question}\033[0m")
+                continue
+            prepared = prepare_question(question)
+            if not prepared:
+                outcomes[question] = None
+                record_outcome(question, None)
+                continue
+            english_question, model_args = prepared
+            jobs.add_question(question, english_question, schedule_models(model_args))
+            print(f"\033[92mQueued {len(model_args)} model jobs for: {question}\033[0m")
+        jobs.set_open(False)
+
+        print(f"\n\033[93mStep 3: Collecting results from the workers...\033[0m")
+        if not processes:
+            print(f"\033[93mStart workers with: python {os.path.basename(entry_script())} worker [--api-key-env VAR]\033[0m")
+        last_progress = time.monotonic()
+        while True:
+            for question, english_question, result in jobs.collect():
+                store.add_result(question, english_question, result)
+                model_health.record(result.model_id, result.error_class, result.duration, result.labels["degenerate"])
+            for question, english_question, results in jobs.completed_questions():
+                model_health.save()
+                outcomes[question] = finalize_question(question, english_question, results)
+                record_outcome(question, outcomes[question])
+                jobs.remove_question(question)
+            if not jobs.queued_questions():
+                break
+            if processes and all(process.poll() is not None for process in processes):
+                print("\033[31mAll worker processes exited with jobs left; they stay queued for the next run\033[0m")
+                break
+            if time.monotonic() - last_progress > 30:
+                counts = jobs.job_counts()
+                print(f"\033[94mJobs: {counts.get('pending', 0)} pending, {counts.get('leased', 0)} running, "
+                      f"{counts.get('collected', 0)} done\033[0m")
+                last_progress = time.monotonic()
+            time.sleep(JOB_POLL_INTERVAL)
+
+        for process in processes:
+            process.wait()
+        for stats in jobs.worker_stats().values():
+            run_stats.merge(stats)
+    finally:
+        jobs.close()
+        store.close()
+
+    remaining_questions = [q for q in pending_questions if not outcomes.get(q)]
+    print("\n\033[93mStep 4: Updating pending questions file...\033[0m")
+    with open(pending_file, "w", encoding="utf-8") as pf:
+        for q in remaining_questions:
+            pf.write(q + "\n")
+    print(f"\033[92mUpdated pending questions file with {len(remaining_questions)} remaining questions\033[0m")
+
+    run_stats.add_process_counters()
+    print_run_summary()
+
+def rerender_reports(question=None, run_id=None):
+    """
+    Write the HTML and Excel reports of stored results again without querying any model:
+    every question of run_id, or only question. run_id defaults to the latest run
+    (that answered question, if given). Returns the number of reports written.
+    """
+    store = ResultsStore(RESULTS_DB_FILE)
+    try:
+        run_id = run_id or store.latest_run_id(question)
+        groups = store.run_results(run_id, question) if run_id else []
+    finally:
+        store.close()
+    if not groups:
+        print(f"\033[93mNo stored results to report in {RESULTS_DB_FILE}\033[0m")
+        return 0
+    print(f"\033[94mRe-rendering {len(groups)} question reports of run {run_id}\033[0m")
+    ensure_output_directories()
+    written = 0
+    for stored_question, english_question, results in groups:
+        if create_html_report_for_prompt(stored_question, english_question, results):
+            written += 1
+    print(f"\033[92m{written} of {len(groups)} reports written\033[0m")
+    return written
+
+def export_results(path):
+    """
+    Export the results store to a Parquet file.
+    """
+    store = ResultsStore(RESULTS_DB_FILE)
+    try:
+        rows = store.export_parquet(path)
+        print(f"\033[92mExported {rows} results from {RESULTS_DB_FILE} to {path}\033[0m")
+    except RuntimeError as e:
+        print(f"\033[31m{str(e)}\033[0m")
+    finally:
+        store.close()
+
+def build_arg_parser():
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark free OpenRouter models on the pending questions.")
+    parser.add_argument("--quiet", action="store_true", help="do not print every request, response and translation")
+    parser.add_argument("--trace", metavar="PATH", help="write timing spans to PATH as a Chrome trace")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("run", help="process preguntas_pendientes.csv (default)")
+    report_parser = subparsers.add_parser("report", help=f"write the reports of stored results again from {RESULTS_DB_FILE}, without querying any model")
+    report_parser.add_argument("question", nargs="?", help="only this question (default: every question of the run)")
+    report_parser.add_argument("--run", metavar="RUN_ID", help="run to report (default: the latest one)")
+    export_parser = subparsers.add_parser("export", help="export the results store to Parquet")
+    export_parser.add_argument("path", nargs="?", default="results.parquet", help="output file (default: results.parquet)")
+    leaderboard_parser = subparsers.add_parser("leaderboard", help="aggregate all stored results into a model leaderboard page")
+    leaderboard_parser.add_argument("--output", default=LEADERBOARD_FILE, help=f"HTML file to write (default: {LEADERBOARD_FILE})")
+    leaderboard_parser.add_argument("--rebuild", action="store_true", help="recompute the aggregates from scratch")
+    dedup_parser = subparsers.add_parser("dedup", help="list repeated answered questions and pending questions that would be skipped")
+    dedup_parser.add_argument("--rebuild", action="store_true", help=f"reindex preguntas_resueltas.csv into {QUESTION_INDEX_FILE} from scratch")
+    coordinator_parser = subparsers.add_parser("coordinator", help=f"queue the pending questions in {JOB_QUEUE_FILE} for worker processes and report them")
+    coordinator_parser.add_argument("--workers", type=int, default=0, help="start this many local worker processes (default: 0, start them yourself)")
+    coordinator_parser.add_argument("--api-key-env", nargs="+", metavar="VAR", help="environment variables with the API keys to hand out to the local workers, round robin")
+    worker_parser = subparsers.add_parser("worker", help=f"run (question, model) jobs from {JOB_QUEUE_FILE}")
+    worker_parser.add_argument("--id", default=f"worker-{os.getpid()}", help="worker name in the queue (default: worker-PID)")
+    worker_parser.add_argument("--api-key-env", metavar="VAR", help="read this worker's API key from VAR instead of OPENROUTER_API_KEY")
+    return parser
+
+def entry_script():
+    """
+    Path of the script to start this tool with: the run_benchmark.py launcher next to
+    this file, which starts faster, or this file if the launcher is missing.
+    """
+    launcher = os.path.join(os.path.dirname(os.path.abspath(__file__)), "run_benchmark.py")
+    return launcher if os.path.exists(launcher) else os.path.abspath(__file__)
+
+def main(argv=None):
+    """
+    Command line entry point, also run by the run_benchmark.py launcher (which starts
+    faster than running this file, as the module is loaded from its cached bytecode).
+    """
+    global QUIET, TRACE_FILE
+    args = build_arg_parser().parse_args(argv)
+    QUIET = QUIET or args.quiet
+    TRACE_FILE = args.trace or TRACE_FILE
+    if args.command == "report":
+        rerender_reports(args.question, args.run)
+    elif args.command == "export":
+        export_results(args.path)
+    elif args.command == "leaderboard":
+        update_leaderboard(args.output, args.rebuild)
+    elif args.command == "dedup":
+        report_duplicate_questions(rebuild=args.rebuild)
+    elif args.command == "coordinator":
+        run_coordinator(args.workers, args.api_key_env)
+    elif args.command == "worker":
+        run_worker(args.id, args.api_key_env)
+    else:
+        print("\033[94mrunning \033[92mFREE LLM BENCHMARK \033[94mby \033[95mKEYDAY ELECTRONICS SOFTWARE \033[94mand \033[95mRUMI EXPLORA")
+        print(f"\033[94mExecuting from: \033[93m{os.path.abspath(__file__)}")
+        process_pending_questions()
+
 if __name__ == "__main__":
-    print("\033[94mrunning \033[92mFREE LLM BENCHMARK \033[94mby \033[95mKEYDAY ELECTRONICS SOFTWARE \033[94mand \033[95mRUMI EXPLORA")
-    print(f"\033[94mExecuting from: \033[93m{os.path.abspath(__file__)}")
-    process_pending_questions()
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -3,3 +3,4 @@ cd .
 pip install requests
 pip install deep_translator
 pip install openpyxl
+pip install httpx[http2]
@@ -0,0 +1,8 @@
+# Launcher for free_llm_benchmark.py: `python run_benchmark.py [command] [options]` takes
+# the same commands and options. Python compiles a script it runs directly from source
+# on every start (about 50ms for free_llm_benchmark.py), while an imported module is
+# loaded from its cached bytecode, so this file is kept to the import.
+from free_llm_benchmark import main
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import benchmark_harness
+import free_llm_benchmark
+
+
+@pytest.fixture
+def make_stub():
+    """
+    Start StubOpenRouter servers configured with benchmark_harness options
+    (e.g. make_stub("--models", "3", "--latency", "0.01")); all are stopped afterwards.
+    """
+    stubs = []
+
+    def start(*options):
+        config = benchmark_harness.build_arg_parser().parse_args(
+            ["--latency", "0.01", "--latency-spread", "0", *options])
+        stubs.append(benchmark_harness.StubOpenRouter(config).start())
+        return stubs[-1]
+
+    yield start
+    for stub in stubs:
+        stub.stop()
+
+
+@pytest.fixture
+def benchmark(tmp_path, monkeypatch):
+    """
+    free_llm_benchmark running in an empty directory with the fake translator, no request
+    rate limits and fresh per-run state; point it at a stub with use_stub(stub).
+    """
+    monkeypatch.chdir(tmp_path)
+    for name in ("preguntas_pendientes.csv", "preguntas_resueltas.csv", "blacklist.csv"):
+        open(name, "w", encoding="utf-8").close()
+    monkeypatch.setattr(free_llm_benchmark, "GoogleTranslator", benchmark_harness.FakeTranslator)
+    monkeypatch.setattr(free_llm_benchmark, "rate_limiter", free_llm_benchmark.RateLimiter(10 ** 9))
+    monkeypatch.setattr(free_llm_benchmark, "translation_rate_limiter", free_llm_benchmark.RateLimiter(10 ** 9))
+    monkeypatch.setattr(free_llm_benchmark, "run_stats", free_llm_benchmark.RunStats())
+    monkeypatch.setattr(free_llm_benchmark, "model_health", free_llm_benchmark.ModelHealth(str(tmp_path / "model_health.json")))
+    monkeypatch.setattr(free_llm_benchmark, "model_latency_history", {})
+    monkeypatch.setattr(free_llm_benchmark, "QUIET", True)
+    monkeypatch.setattr(free_llm_benchmark, "EXCEL_BATCH_WORKBOOK", False)
+    return free_llm_benchmark
+
+
+@pytest.fixture
+def use_stub(benchmark, monkeypatch):
+    def use(stub):
+        monkeypatch.setattr(benchmark, "API_URL", stub.base_url + "/chat/completions")
+        monkeypatch.setattr(benchmark, "MODEL_LIST_URL", stub.base_url + "/models")
+    return use
@@ -0,0 +1,32 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from free_llm_benchmark import classify_error
+
+
+@pytest.mark.parametrize("message, error_class", [
+    ("API Request Error: HTTPSConnectionPool(host='openrouter.ai', port=443): Max retries exceeded with url: "
+     "/api/v1/chat/completions (Caused by NewConnectionError('<urllib3.connection.HTTPSConnection object>: "
+     "Failed to establish a new connection: [Errno 111] Connection refused'))", "connection_error"),
+    ("API Request Error: HTTPSConnectionPool(host='openrouter.ai', port=443): Max retries exceeded with url: "
+     "/api/v1/chat/completions (Caused by NameResolutionError(\"HTTPSConnection(host='openrouter.ai', port=443): "
+     "Failed to resolve 'openrouter.ai' ([Errno -2] Name or service not known)\"))", "connection_error"),
+    ("API Request Error: [Errno 111] Connection refused", "connection_error"),
+    ("API Request Error: 502 Server Error: Bad Gateway for url: https://openrouter.ai/api/v1/chat/completions",
+     "http_error"),
+    ("API Request Error: Client error '404 Not Found' for url 'https://openrouter.ai/api/v1/chat/completions'",
+     "http_error"),
+    ("API Request Error: HTTP 500 from upstream", "http_error"),
+    ("API Request Error: HTTPSConnectionPool(host='openrouter.ai', port=443): Read timed out. (read timeout=60)",
+     "timeout"),
+    ("API Request Error: Failed after 4 attempts", "rate_limited"),
+    ("API Request Error: Invalid JSON response from model m. Response text: <html>502</html>", "invalid_json"),
+    ("Error: Timed out after 300 seconds", "deadline"),
+    ("The answer mentions port=443 and a 404 page.", "ok"),
+])
+def test_classify_error(message, error_class):
+    assert classify_error(message) == error_class
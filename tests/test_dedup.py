@@ -0,0 +1,35 @@
+ANSWERED = [
+    "Explica la teoría de la relatividad especial de Einstein y sus consecuencias para la física moderna",
+    "Explica las ventajas y desventajas de la energía solar para generar electricidad en zonas rurales aisladas",
+]
+
+
+def write_answered():
+    with open("preguntas_resueltas.csv", "w", encoding="utf-8") as f:
+        f.write("\n".join(ANSWERED) + "\n")
+
+
+def test_only_exact_repeats_are_dropped(benchmark):
+    write_answered()
+    pending = [
+        "¿explica la teoria de la relatividad especial de einstein y sus consecuencias para la fisica moderna?",
+        # Different questions that share all but their topic word score above DEDUP_SIMILARITY
+        "Explica la teoría de la relatividad general de Einstein y sus consecuencias para la física moderna",
+        "Explica las ventajas y desventajas de la energía eólica para generar electricidad en zonas rurales aisladas",
+        "Explica las ventajas y desventajas de la energía eólica para generar electricidad en zonas rurales aisladas",
+    ]
+    remaining = benchmark.filter_duplicate_questions(pending, "preguntas_resueltas.csv")
+    assert remaining == pending[1:3]
+    assert [entry[0] for entry in benchmark.run_stats.duplicate_questions] == [pending[0], pending[3]]
+    assert [entry[0] for entry in benchmark.run_stats.near_duplicate_questions] == pending[1:3]
+    assert all(entry[2] >= benchmark.DEDUP_SIMILARITY for entry in benchmark.run_stats.near_duplicate_questions)
+
+
+def test_near_repeats_are_dropped_above_the_opt_in_threshold(benchmark, monkeypatch):
+    monkeypatch.setattr(benchmark, "DEDUP_DROP_SIMILARITY", 0.8)
+    write_answered()
+    pending = [
+        "Explica la teoría de la relatividad general de Einstein y sus consecuencias para la física moderna",
+        "Explica las ventajas y desventajas de la energía eólica para generar electricidad en zonas rurales aisladas",
+    ]
+    assert benchmark.filter_duplicate_questions(pending, "preguntas_resueltas.csv") == pending[:1]
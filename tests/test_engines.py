@@ -0,0 +1,69 @@
+import itertools
+
+import pytest
+
+QUESTION = "What is the speed of light in a vacuum?"
+MODEL_ID = "stub-provider-0/model-0:free"
+DETAILS = {"name": "Stub Model 0", "context_length": 32768}
+
+
+def run_engine(benchmark, engine):
+    """
+    Query MODEL_ID through the sync (requests Session) or async (httpx) engine
+    and build its ModelResult the way the pipeline does.
+    """
+    args = (MODEL_ID, DETAILS, 1000, QUESTION)
+    if engine == "sync":
+        query = benchmark.query_model_stage(args)
+    else:
+        with benchmark.AsyncModelEngine(max_concurrency=2) as async_engine:
+            query = async_engine.submit(args).result()
+    assert "error" not in query
+    return benchmark.translation_stage(query)
+
+
+@pytest.mark.parametrize("engine", ["sync", "async"])
+def test_streamed_response(benchmark, make_stub, use_stub, monkeypatch, engine):
+    stub = make_stub("--models", "1", "--latency", "0.05", "--response-chars", "2000", "--stream-chunk-chars", "40")
+    use_stub(stub)
+    monkeypatch.setattr(benchmark, "STREAM_RESPONSES", True)
+    result = run_engine(benchmark, engine)
+
+    assert result.status is benchmark.ResultStatus.OK
+    assert result.english_response.startswith(f"{MODEL_ID} answers: ")
+    assert len(result.english_response) == len(f"{MODEL_ID} answers: ") + 2000
+    assert result.completion_tokens == len(result.english_response) // 4 + 1
+    assert result.total_tokens == result.prompt_tokens + result.completion_tokens
+    # The stub sleeps for its latency before the first event
+    assert 0.05 <= result.ttft <= result.duration
+    assert 0 <= result.itl_p50 <= result.itl_p95
+    assert result.tokens_per_sec > 0
+    assert stub.counts["completions"] == 1
+
+
+@pytest.mark.parametrize("engine", ["sync", "async"])
+def test_non_streamed_response_has_no_stream_metrics(benchmark, make_stub, use_stub, engine):
+    use_stub(make_stub("--models", "1", "--response-chars", "500"))
+    result = run_engine(benchmark, engine)
+
+    assert result.status is benchmark.ResultStatus.OK
+    assert result.completion_tokens == len(result.english_response) // 4 + 1
+    assert result.ttft is None and result.itl_p50 is None and result.tokens_per_sec is None
+
+
+@pytest.mark.parametrize("engine", ["sync", "async"])
+def test_429_is_retried_after_retry_after(benchmark, make_stub, use_stub, monkeypatch, engine):
+    stub = make_stub("--models", "1", "--rate-429", "0.5", "--retry-after", "1")
+    use_stub(stub)
+    # Answer the first request with 429 and every later one normally
+    draws = itertools.chain([0.0], itertools.repeat(0.99))
+    monkeypatch.setattr(stub, "draw", lambda: next(draws))
+    result = run_engine(benchmark, engine)
+
+    assert result.status is benchmark.ResultStatus.OK
+    assert result.english_response.startswith(f"{MODEL_ID} answers: ")
+    assert stub.counts["429"] == 1
+    assert stub.counts["completions"] == 2
+    assert benchmark.rate_limiter.rate_limited_responses == 1
+    # The retry waited for the server's Retry-After, not for the default backoff
+    assert 1.0 <= result.duration < 1.0 + benchmark.INITIAL_RETRY_BACKOFF
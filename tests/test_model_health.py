@@ -0,0 +1,38 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from free_llm_benchmark import BREAKER_FAILURE_THRESHOLD, ModelHealth
+
+MODEL = "example/model:free"
+
+
+def test_rate_limited_requests_do_not_open_the_breaker(tmp_path):
+    health = ModelHealth(str(tmp_path / "model_health.json"))
+    for _ in range(BREAKER_FAILURE_THRESHOLD * 3):
+        health.record(MODEL, "rate_limited")
+    record = health.models[MODEL]
+    assert record["requests"] == BREAKER_FAILURE_THRESHOLD * 3
+    assert record["consecutive_failures"] == 0
+    assert record["open_until"] == 0
+    assert health.allow(MODEL)
+
+
+def test_rate_limited_requests_do_not_reset_the_failure_count(tmp_path):
+    health = ModelHealth(str(tmp_path / "model_health.json"))
+    for _ in range(BREAKER_FAILURE_THRESHOLD - 1):
+        health.record(MODEL, "timeout")
+        health.record(MODEL, "rate_limited")
+    health.record(MODEL, "http_error")
+    assert health.models[MODEL]["open_until"] > 0
+    assert not health.allow(MODEL)
+
+
+def test_degenerate_answers_open_the_breaker(tmp_path):
+    health = ModelHealth(str(tmp_path / "model_health.json"))
+    for _ in range(BREAKER_FAILURE_THRESHOLD):
+        health.record(MODEL, "ok", 1.0, degenerate=True)
+    record = health.models[MODEL]
+    assert record["last_error"] == "degenerate"
+    assert not health.allow(MODEL)
@@ -0,0 +1,51 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from free_llm_benchmark import REPETITION_CUTOFF_NOTE, RepetitionMonitor, analyze_response, cut_repeated_content
+
+LOOP_SENTENCE = "The model keeps repeating the same sentence over and over again. "
+TABLE = "| # | Producto | Vegano | Sin gluten | Ecológico | Precio |\n|---|---|---|---|---|---|\n" + "\n".join(
+    f"| {i} | Producto {i} | Sí | No | Sí | N/A |" for i in range(1, 31))
+
+
+def stream(text, size=7):
+    monitor = RepetitionMonitor()
+    for start in range(0, len(text), size):
+        if monitor.feed(text[start:start + size]):
+            return monitor
+    monitor.finish()
+    return monitor
+
+
+def test_table_with_repeated_cells_is_not_cut():
+    assert cut_repeated_content(TABLE) == (TABLE, False)
+    assert stream(TABLE).cutoff is None
+    assert not analyze_response(TABLE)["degenerate"]
+
+
+def test_recurring_phrase_is_not_cut():
+    text = " ".join(f"Step {i}: as mentioned before, check the value of the previous step carefully." for i in range(40))
+    assert cut_repeated_content(text) == (text, False)
+
+
+def test_loop_is_cut_after_its_second_copy():
+    text = "Here is the answer. " + LOOP_SENTENCE * 20
+    content, cut = cut_repeated_content(text)
+    assert cut
+    assert content == "Here is the answer. " + (LOOP_SENTENCE * 2).rstrip() + REPETITION_CUTOFF_NOTE
+    assert analyze_response(content)["degenerate"]
+
+
+def test_streamed_loop_is_cut_before_the_end():
+    text = "Here is the answer. " + LOOP_SENTENCE * 50
+    monitor = stream(text)
+    assert monitor.cutoff is not None
+    assert text[:monitor.cutoff].count("keeps repeating") == 2
+    assert monitor.consumed < len(text) / 2
+
+
+def test_short_loop_needs_as_many_words_as_a_long_one():
+    assert not cut_repeated_content("ha " * 30)[1]
+    assert cut_repeated_content("ha " * 200)[1]
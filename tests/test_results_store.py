@@ -0,0 +1,21 @@
+import sqlite3
+
+QUESTIONS = ["pregunta de prueba uno sobre astronomia", "pregunta de prueba dos sobre geologia"]
+
+
+def test_resumed_results_are_stored_once(benchmark, make_stub, use_stub, monkeypatch):
+    # 200-character answers make every report fall under the 50KB minimum, so both
+    # questions fail and are resumed from the journal by each following run
+    stub = make_stub("--models", "5", "--response-chars", "200")
+    use_stub(stub)
+    for run in range(3):
+        monkeypatch.setattr(benchmark, "RUN_ID", f"test-run-{run}")
+        with open("preguntas_pendientes.csv", "w", encoding="utf-8") as f:
+            f.write("\n".join(QUESTIONS) + "\n")
+        benchmark.process_pending_questions()
+
+    assert stub.counts["completions"] == 10
+    with sqlite3.connect(benchmark.RESULTS_DB_FILE) as conn:
+        rows = conn.execute("SELECT question, model_id, COUNT(*) FROM results GROUP BY question, model_id").fetchall()
+    assert len(rows) == 10
+    assert all(count == 1 for _, _, count in rows)